@@ -0,0 +1,213 @@
+import threading
+from collections import OrderedDict
+import queries
+from roster import _bitmap, _positions
+
+# Absence questions answered by the absent students wizard
+ABSENT_ON_DATE = "on_date"        # No attendance on the date
+ABSENT_EVERY_DAY = "every_day"    # No attendance on any session day of the range
+ABSENT_AT_LEAST = "at_least"      # Absent on at least min_days of the session days of the range
+ABSENCE_STREAK = "streak"         # Absent on the last min_days (or more) session days up to the date
+
+# Session days looked back over for a consecutive-absence streak
+MAX_STREAK_DAYS = 60
+
+# Dates whose presence bitmap is kept in memory
+MAX_CACHED_DATES = 400
+
+
+class AbsenceIndex:
+    """Which students attended on each date, as a bitmap over the student id space.
+
+    The presence of a date is a Python int with bit i set when the student
+    with id i has attendance on that date. It is read once from the
+    (date, student_id) index and kept, so every absence question is a few
+    whole-bitmap operations against the roster's bitmap of the students
+    matching the filters, whatever the number of days and students.
+
+    mark() sets the bit of a scan recorded by this app. Before a cached date
+    is used its row count and highest attendance id are compared with the
+    database, so scans from another device and deleted attendance make it
+    re-read. Questions run on the query executor's worker while the Tk thread
+    marks scans, so the cache is guarded by a lock.
+    """
+
+    def __init__(self, roster):
+        self.roster = roster
+        self._lock = threading.Lock()
+        self._dates = OrderedDict()  # date -> (bitmap, row count, highest attendance id), least recently used first
+
+    def mark(self, student_id, date, attendance_id):
+        """Set the bit of a scan just recorded (nothing to do when the date is not cached)"""
+        with self._lock:
+            cached = self._dates.get(date)
+            if cached is None:
+                return
+            bitmap, count, last_id = cached
+            if not bitmap >> student_id & 1:
+                self._dates[date] = (bitmap | 1 << student_id, count + 1, max(last_id or 0, attendance_id))
+
+    def presence(self, conn, date):
+        """Bitmap of the students with attendance on date"""
+        count, last_id = conn.execute(queries.ATTENDANCE_DAY_QUERY, (date,)).fetchone()
+        with self._lock:
+            cached = self._dates.get(date)
+            if cached is not None and cached[1:] == (count, last_id):
+                self._dates.move_to_end(date)
+                return cached[0]
+
+        student_ids = [row[0] for row in conn.execute(queries.PRESENT_STUDENT_IDS_QUERY, (date,))]
+        bitmap = _bitmap(student_ids, max(student_ids) + 1 if student_ids else 0)
+        with self._lock:
+            # A scan written between the two reads leaves the count off, the next use reads the date again
+            self._dates[date] = (bitmap, len(student_ids), last_id)
+            self._dates.move_to_end(date)
+            while len(self._dates) > MAX_CACHED_DATES:
+                self._dates.popitem(last=False)
+        return bitmap
+
+    def session_days(self, conn, start, end):
+        """Dates from start to end on which anyone attended, oldest first"""
+        return [row[0] for row in conn.execute(queries.SESSION_DAYS_QUERY, (start, end))]
+
+    def recent_session_days(self, conn, end, limit=MAX_STREAK_DAYS):
+        """The last limit dates up to end on which anyone attended, newest first"""
+        return [row[0] for row in conn.execute(queries.RECENT_SESSION_DAYS_QUERY, (end, limit))]
+
+    def absent_on(self, conn, date, candidates):
+        """{student_id: 1} of the candidates (a bitmap over the ids) without attendance on date"""
+        return dict.fromkeys(_positions(candidates & ~self.presence(conn, date), 0, None), 1)
+
+    def absent_every_day(self, conn, dates, candidates):
+        """{student_id: len(dates)} of the candidates without attendance on any of dates"""
+        if not dates:
+            return {}
+        present = 0
+        for date in dates:
+            present |= self.presence(conn, date)
+        return dict.fromkeys(_positions(candidates & ~present, 0, None), len(dates))
+
+    def absent_at_least(self, conn, dates, min_days, candidates):
+        """{student_id: days absent} of the candidates absent on at least min_days of dates.
+
+        The absences are added up as a bit-sliced counter: planes[k] holds bit k
+        of every student's count, so each date costs a few bitmap operations.
+        """
+        planes = []
+        for date in dates:
+            carry = candidates & ~self.presence(conn, date)
+            for k, plane in enumerate(planes):
+                planes[k] = plane ^ carry
+                carry &= plane
+                if not carry:
+                    break
+            if carry:
+                planes.append(carry)
+
+        if min_days >= 1 << len(planes):
+            return {}
+
+        # count >= min_days, compared from the highest bit down
+        greater, equal = 0, candidates
+        for k in reversed(range(len(planes))):
+            if min_days >> k & 1:
+                equal &= planes[k]
+            else:
+                greater |= equal & planes[k]
+                equal &= ~planes[k]
+        matching = greater | equal
+
+        return {student_id: sum(1 << k for k, plane in enumerate(planes) if plane >> student_id & 1)
+                for student_id in _positions(matching, 0, None)}
+
+    def absence_streaks(self, conn, dates, min_days, candidates):
+        """{student_id: streak} of the candidates absent on at least the first min_days of dates (newest first).
+
+        The streak is the number of consecutive dates, from the newest, the student was absent on.
+        """
+        streaks = {}
+        still_absent = candidates
+        for streak, date in enumerate(dates):
+            absent = still_absent & ~self.presence(conn, date)
+            if streak >= min_days:
+                streaks.update(dict.fromkeys(_positions(still_absent & ~absent, 0, None), streak))
+            still_absent = absent
+            if not still_absent:
+                break
+        if len(dates) >= min_days:
+            streaks.update(dict.fromkeys(_positions(still_absent, 0, None), len(dates)))
+        return streaks
+
+
+class AbsenceSearch:
+    """One absence question, answered on first use and then read a page at a time.
+
+    page(conn, after, limit) and count(conn) fit VirtualGrid.load(). Rows are
+    the absent students listing (id, name, mobile, center_name, learning_type,
+    parent_mobile, grade) followed by the number of days absent, sorted by
+    (name, id). days is the number of session days the question covered.
+    """
+
+    def __init__(self, index, mode, start, end, min_days=1, name="", center_name="", learning_type=""):
+        self.index = index
+        self.mode = mode
+        self.start = start
+        self.end = end
+        self.min_days = min_days
+        self.name = name
+        self.center_name = center_name
+        self.learning_type = learning_type
+        self.days = 0
+        self._keys = None    # (name, id) of the absent students, sorted
+        self._absences = {}  # student_id -> days absent
+        self._order = {}     # student_id -> index in _keys
+        self._lock = threading.Lock()
+
+    def _candidates(self, conn):
+        candidates = self.index.roster.id_bitmap(self.center_name, self.learning_type)
+        expression = queries.search_expression(self.name, "name") if self.name else None
+        if expression:
+            student_ids = [row[0] for row in conn.execute(*queries.name_search_ids_query(expression))]
+            candidates &= _bitmap(student_ids, max(student_ids) + 1 if student_ids else 0)
+        return candidates
+
+    def _answer(self, conn):
+        index = self.index
+        candidates = self._candidates(conn)
+        if self.mode == ABSENT_ON_DATE:
+            self.days = 1
+            return index.absent_on(conn, self.end, candidates)
+        if self.mode == ABSENCE_STREAK:
+            dates = index.recent_session_days(conn, self.end, max(self.min_days, MAX_STREAK_DAYS))
+            self.days = len(dates)
+            return index.absence_streaks(conn, dates, self.min_days, candidates)
+
+        dates = index.session_days(conn, self.start, self.end)
+        self.days = len(dates)
+        if self.mode == ABSENT_EVERY_DAY:
+            return index.absent_every_day(conn, dates, candidates)
+        if self.mode == ABSENT_AT_LEAST:
+            return index.absent_at_least(conn, dates, self.min_days, candidates)
+        raise ValueError(f"Unknown absence mode: {self.mode}")
+
+    def _answered(self, conn):
+        with self._lock:
+            if self._keys is None:
+                self._absences = self._answer(conn)
+                self._keys = self.index.roster.sort_by_name(self._absences)
+                self._order = {student_id: order for order, (_, student_id) in enumerate(self._keys)}
+            return self._keys
+
+    def count(self, conn):
+        return len(self._answered(conn))
+
+    def page(self, conn, after, limit):
+        keys = self._answered(conn)
+        # Continue after the student of the key (its name may have been edited since)
+        start = 0 if after is None else self._order[after[1]] + 1
+        student_ids = [student_id for _, student_id in keys[start:start + limit]]
+        if not student_ids:
+            return []
+        rows = {row[0]: row for row in conn.execute(*queries.absentees_by_id_query(student_ids))}
+        # A student deleted since the question was answered has no row any more
+        return [rows[student_id] + (self._absences[student_id],) for student_id in student_ids if student_id in rows]
@@ -1,99 +1,168 @@
 import sqlite3
 import os
 import random
+import argparse
 import datetime
+import itertools
+import multiprocessing
 from datetime import date, timedelta
+from database import db_path, get_connection
+import attendance_api
 
-# Get the directory where the script is running
-app_dir = os.path.dirname(os.path.abspath(__file__))
-db_path = os.path.join(app_dir, 'students.db')
+# Attendance rows inserted per transaction
+BATCH_ROWS = 50000
 
-def add_attendance_data():
-    """Add dummy attendance data for month 8 (August)"""
-    
-    # Check if database exists
-    if not os.path.exists(db_path):
-        print("Database not found. Please run the main application first to create the database.")
-        return
-    
-    conn = sqlite3.connect(db_path)
+# Share of attendance records without marks (no quiz that day)
+NO_MARKS_RATE = 0.15
+
+# How much the attendance probability varies between students (higher = less)
+ATTENDANCE_CONCENTRATION = 8
+
+# Set in each worker process by _init_worker
+_profiles = None
+_seed = None
+
+
+def working_days(start_month, months):
+    """Dates ('YYYY-MM-DD') of the working days in months months starting at start_month ('YYYY-MM')"""
+    current_date = datetime.datetime.strptime(start_month, "%Y-%m").date()
+    year, month = current_date.year, current_date.month + months
+    end_date = date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+    dates = []
+    while current_date < end_date:
+        # Skip weekends (Saturday = 5, Sunday = 6)
+        if current_date.weekday() < 5:  # Monday to Friday
+            dates.append(current_date.strftime("%Y-%m-%d"))
+        current_date += timedelta(days=1)
+    return dates
+
+
+def student_profiles(student_ids, rate, seed):
+    """(student_id, attendance_probability, marks_mean) for every student.
+
+    Attendance probabilities follow a Beta distribution around rate, so most
+    students are close to the average and a few hardly ever come.
+    """
+    rng = random.Random(f"{seed}:profiles")
+    alpha = max(rate, 0.001) * ATTENDANCE_CONCENTRATION
+    beta = max(1 - rate, 0.001) * ATTENDANCE_CONCENTRATION
+    return [(student_id, rng.betavariate(alpha, beta), min(max(rng.gauss(70, 12), 20), 98))
+            for student_id in student_ids]
+
+
+def attendance_for_day(date_str, profiles, seed):
+    """Attendance rows (student_id, date, marks) of one day, in scan order.
+
+    The random generator is seeded from the seed and the date, so a day always
+    gets the same rows whichever process generates it.
+    """
+    rng = random.Random(f"{seed}:{date_str}")
+    # Some days are busier than others (exams, bad weather...)
+    day_factor = rng.uniform(0.85, 1.05)
+
+    rows = []
+    for student_id, attendance_probability, marks_mean in profiles:
+        if rng.random() < attendance_probability * day_factor:
+            marks = None if rng.random() < NO_MARKS_RATE else min(max(round(rng.gauss(marks_mean, 10)), 0), 100)
+            rows.append((student_id, date_str, marks))
+    rng.shuffle(rows)
+    return rows
+
+
+def _init_worker(profiles, seed):
+    global _profiles, _seed
+    _profiles = profiles
+    _seed = seed
+
+
+def _worker_day(date_str):
+    return attendance_for_day(date_str, _profiles, _seed)
+
+
+def generate_attendance(student_ids, dates, rate=0.8, seed=None, workers=1):
+    """Yield attendance rows for every date, day after day.
+
+    The output only depends on the arguments (not on workers) when a seed is
+    given. With workers > 1 the days are generated by a process pool.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    profiles = student_profiles(student_ids, rate, seed)
+
+    if workers > 1:
+        with multiprocessing.Pool(workers, _init_worker, (profiles, seed)) as pool:
+            for rows in pool.imap(_worker_day, dates):
+                yield from rows
+    else:
+        for date_str in dates:
+            yield from attendance_for_day(date_str, profiles, seed)
+
+
+def add_attendance_data(start_month="2024-08", months=1, rate=0.8, seed=None, workers=1, conn=None, verbose=True):
+    """Add dummy attendance data for every student; returns the number of records added"""
+    conn = conn or get_connection()
     cursor = conn.cursor()
-    
+    added = 0
+
     try:
         # Get all student IDs
-        cursor.execute("SELECT id FROM students")
+        cursor.execute("SELECT id FROM students ORDER BY id")
         student_ids = [row[0] for row in cursor.fetchall()]
-        
+
         if not student_ids:
             print("No students found in the database. Please add students first.")
-            return
-        
-        # Define August dates (month 8)
-        august_start = date(2024, 8, 1)
-        august_end = date(2024, 8, 31)
-        
-        # Generate dates for August (excluding weekends for more realistic data)
-        august_dates = []
-        current_date = august_start
-        while current_date <= august_end:
-            # Skip weekends (Saturday = 5, Sunday = 6)
-            if current_date.weekday() < 5:  # Monday to Friday
-                august_dates.append(current_date.strftime("%Y-%m-%d"))
-            current_date += timedelta(days=1)
-        
-        print(f"Generated {len(august_dates)} working days in August")
-        
-        # Generate attendance records
-        attendance_records = []
-        
-        # Distribute attendance across different patterns
-        for student_id in student_ids:
-            # Each student will have different attendance patterns
-            attendance_probability = random.uniform(0.6, 0.95)  # 60-95% attendance rate
-            
-            for date_str in august_dates:
-                # Randomly decide if student attended based on probability
-                if random.random() < attendance_probability:
-                    # Generate random marks (0-100)
-                    marks = random.randint(0, 100)
-                    attendance_records.append((student_id, date_str, marks))
-                    
-                    # Occasionally skip some days (simulating absences)
-                    if random.random() < 0.1:  # 10% chance to skip next day
-                        continue
-        
-        # Shuffle records to make them more random
-        random.shuffle(attendance_records)
-        
-        # Limit to around 100 records
-        if len(attendance_records) > 100:
-            attendance_records = random.sample(attendance_records, 100)
-        
-        # Insert attendance records
-        cursor.executemany(
-            "INSERT INTO attendance (student_id, date, marks) VALUES (?, ?, ?)",
-            attendance_records
-        )
-        
-        conn.commit()
-        
-        # Get statistics
-        cursor.execute("SELECT COUNT(*) FROM attendance")
-        total_attendance = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(DISTINCT student_id) FROM attendance")
-        students_with_attendance = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(DISTINCT date) FROM attendance")
-        unique_dates = cursor.fetchone()[0]
-        
-        print(f"✅ Successfully added {len(attendance_records)} attendance records!")
-        print(f"📊 Total attendance records in database: {total_attendance}")
-        print(f"👥 Students with attendance records: {students_with_attendance}")
-        print(f"📅 Unique dates covered: {unique_dates}")
-        print(f"📈 Average attendance per student: {len(attendance_records) / len(student_ids):.1f}")
-        
-        # Show distribution by date
+            return 0
+
+        dates = working_days(start_month, months)
+        if verbose:
+            print(f"Generated {len(dates)} working days for {len(student_ids)} students")
+
+        # Insert batch by batch straight from the generator (students already
+        # present on a date are skipped)
+        rows = generate_attendance(student_ids, dates, rate, seed, workers)
+        started = datetime.datetime.now()
+        while True:
+            batch = list(itertools.islice(rows, BATCH_ROWS))
+            if not batch:
+                break
+            added += attendance_api.record_attendance(batch, conn=conn)
+            if verbose:
+                seconds = (datetime.datetime.now() - started).total_seconds()
+                print(f"Added {added} records up to {batch[-1][1]} ({added / max(seconds, 0.001):.0f} rows/s)", end="\r")
+
+        if verbose:
+            print()
+            print_summary(cursor, added, len(student_ids))
+
+    except sqlite3.Error as e:
+        print(f"❌ Database error: {e}")
+        conn.rollback()
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        conn.rollback()
+    return added
+
+
+def print_summary(cursor, added, student_count):
+    # Get statistics
+    cursor.execute("SELECT COUNT(*) FROM attendance")
+    total_attendance = cursor.fetchone()[0]
+
+    cursor.execute("SELECT COUNT(DISTINCT student_id) FROM attendance")
+    students_with_attendance = cursor.fetchone()[0]
+
+    cursor.execute("SELECT COUNT(DISTINCT date) FROM attendance")
+    unique_dates = cursor.fetchone()[0]
+
+    print(f"✅ Successfully added {added} attendance records!")
+    print(f"📊 Total attendance records in database: {total_attendance}")
+    print(f"👥 Students with attendance records: {students_with_attendance}")
+    print(f"📅 Unique dates covered: {unique_dates}")
+    print(f"📈 Average attendance per student: {added / student_count:.1f}")
+
+    # Show distribution by date (only for about a month of data)
+    if unique_dates <= 31:
         print("\n📅 Attendance distribution by date:")
         cursor.execute("""
             SELECT date, COUNT(*) as count 
@@ -102,35 +171,50 @@ def add_attendance_data():
             ORDER BY date
         """)
         date_distribution = cursor.fetchall()
-        
+
         for date_str, count in date_distribution:
             print(f"   {date_str}: {count} students")
-        
-        # Show distribution by student
-        print("\n👥 Top 5 students by attendance:")
-        cursor.execute("""
-            SELECT s.name, COUNT(a.id) as attendance_count
-            FROM students s
-            JOIN attendance a ON s.id = a.student_id
-            GROUP BY s.id, s.name
-            ORDER BY attendance_count DESC
-            LIMIT 5
-        """)
-        top_students = cursor.fetchall()
-        
-        for name, count in top_students:
-            print(f"   {name}: {count} days")
-        
-    except sqlite3.Error as e:
-        print(f"❌ Database error: {e}")
-        conn.rollback()
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+
+    # Show distribution by student
+    print("\n👥 Top 5 students by attendance:")
+    cursor.execute("""
+        SELECT s.name, COUNT(a.id) as attendance_count
+        FROM students s
+        JOIN attendance a ON s.id = a.student_id
+        GROUP BY s.id, s.name
+        ORDER BY attendance_count DESC
+        LIMIT 5
+    """)
+    top_students = cursor.fetchall()
+
+    for name, count in top_students:
+        print(f"   {name}: {count} days")
+
 
 if __name__ == "__main__":
-    print("🎯 Adding dummy attendance data for August 2024...")
-    add_attendance_data()
+    parser = argparse.ArgumentParser(description="Add dummy attendance records for testing")
+    parser.add_argument("--start-month", default="2024-08", help="First month as YYYY-MM (default: 2024-08)")
+    parser.add_argument("--months", type=int, default=1, help="Number of months (default: 1)")
+    parser.add_argument("--rate", type=float, default=0.8, help="Average attendance rate between 0 and 1 (default: 0.8)")
+    parser.add_argument("--seed", type=int, help="Random seed, the same seed always generates the same data")
+    parser.add_argument("--workers", type=int, default=1, help="Processes generating the records (default: 1)")
+    parser.add_argument("--db", help="Database file to fill (created if it does not exist)")
+    args = parser.parse_args()
+
+    if not 0 <= args.rate <= 1:
+        parser.error("--rate must be between 0 and 1")
+    try:
+        working_days(args.start_month, 0)
+    except ValueError:
+        parser.error("--start-month must be YYYY-MM")
+
+    print(f"🎯 Adding dummy attendance data for {args.months} month(s) from {args.start_month}...")
+    if args.db:
+        conn = attendance_api.open_database(args.db)
+        add_attendance_data(args.start_month, args.months, args.rate, args.seed, args.workers, conn)
+    elif not os.path.exists(db_path):
+        print("Database not found. Please run the main application first to create the database.")
+    else:
+        conn = attendance_api.open_database(db_path)  # Upgrades a database from an older version of the app
+        add_attendance_data(args.start_month, args.months, args.rate, args.seed, args.workers, conn)
     print("\n✨ Script completed!")
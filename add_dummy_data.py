@@ -1,14 +1,14 @@
 import sqlite3
 import os
+import sys
 import random
 import string
-import datetime
+import argparse
+import itertools
+from database import db_path, get_connection
+import attendance_api
 
-# Get the directory where the script is running
-app_dir = os.path.dirname(os.path.abspath(__file__))
-db_path = os.path.join(app_dir, 'students.db')
-
-# Arabic names for students
+# Arabic names for students (first name + father's name)
 arabic_names = [
     "أحمد محمد", "فاطمة علي", "علي حسن", "مريم أحمد", "محمد عبدالله",
     "خديجة محمد", "عبدالله علي", "عائشة محمد", "حسن علي", "زينب أحمد",
@@ -29,119 +29,150 @@ centers = [
 ]
 
 # Learning types (already defined in the app)
-learning_types = ["علمي", "ادبي"]
+learning_types = attendance_api.LEARNING_TYPES
+learning_type_weights = [0.6, 0.4]
+
+# Grades (the values offered by the grade dropdown in the app)
+grades = attendance_api.GRADES
 
-# Grades
-grades = ["الصف الأول", "الصف الثاني", "الصف الثالث", "الصف الرابع", "الصف الخامس", "الصف السادس"]
+# Students inserted per transaction
+BATCH_ROWS = 10000
 
-def generate_mobile():
+
+def generate_mobile(rng=random):
     """Generate a realistic Egyptian mobile number"""
     prefixes = ["010", "011", "012", "015"]
-    prefix = random.choice(prefixes)
-    number = ''.join(random.choices(string.digits, k=8))
+    prefix = rng.choice(prefixes)
+    number = ''.join(rng.choices(string.digits, k=8))
     return f"{prefix}{number}"
 
-def generate_barcode():
+
+def generate_barcode(rng=random):
     """Generate a unique 10-character barcode"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+    return ''.join(rng.choices(string.ascii_uppercase + string.digits, k=10))
+
+
+def center_names(count):
+    """The first count center names (numbered names once the list runs out)"""
+    return centers[:count] + [f"مركز رقم {i}" for i in range(len(centers) + 1, count + 1)]
+
 
-def add_dummy_data():
-    """Add 50 dummy student records"""
-    conn = sqlite3.connect(db_path)
+def generate_students(count, center_ids, rng):
+    """Yield count student rows.
+
+    Center sizes follow a Zipf-like distribution (a few big centers and a
+    long tail), names are built from a first name and a father's name.
+    """
+    first_names = sorted({name.split()[0] for name in arabic_names})
+    father_names = sorted({name.split()[-1] for name in arabic_names} | {"عبدالله", "مصطفى", "خالد", "سعيد"})
+    center_weights = [1 / rank for rank in range(1, len(center_ids) + 1)]
+
+    for _ in range(count):
+        yield (f"{rng.choice(first_names)} {rng.choice(father_names)}",
+               generate_mobile(rng),
+               rng.choices(center_ids, center_weights)[0],
+               rng.choices(learning_types, learning_type_weights)[0],
+               generate_mobile(rng),
+               generate_barcode(rng),
+               rng.choice(grades))
+
+
+def add_dummy_data(students=50, center_count=len(centers), seed=None, conn=None, verbose=True):
+    """Add dummy student records (and their centers); returns the number of students added"""
+    conn = conn or get_connection()
     cursor = conn.cursor()
-    
+    rng = random.Random(seed)
+    added = 0
+
     try:
         # First, ensure we have centers
-        print("Checking/creating centers...")
-        for center_name in centers:
-            cursor.execute("INSERT OR IGNORE INTO centers (name, created_date) VALUES (?, ?)",
-                         (center_name, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        
-        # Get center IDs
-        cursor.execute("SELECT id FROM centers")
-        center_ids = [row[0] for row in cursor.fetchall()]
-        
+        if verbose:
+            print("Checking/creating centers...")
+        attendance_api.add_centers(center_names(center_count), conn=conn)
+
+        # Get center IDs (in a stable order so a seed always gives the same data)
+        center_ids = sorted(center_id for center_id, _ in attendance_api.center_names(conn))
+
         if not center_ids:
             print("Error: No centers found. Please create centers first.")
-            return
-        
-        print(f"Found {len(center_ids)} centers")
-        
-        # Check if students table exists
-        cursor.execute("PRAGMA table_info(students)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if not columns:
-            print("Error: Students table not found. Please run the main application first.")
-            return
-        
-        # Generate and insert 50 students
-        print("Adding 50 dummy students...")
-        
-        for i in range(50):
-            # Generate unique data
-            name = random.choice(arabic_names)
-            mobile = generate_mobile()
-            center_id = random.choice(center_ids)
-            learning_type = random.choice(learning_types)
-            parent_mobile = generate_mobile()
-            barcode = generate_barcode()
-            grade = random.choice(grades)
-            
-            # Insert student
-            cursor.execute('''INSERT INTO students (name, mobile, center_id, learning_type, parent_mobile, barcode, grade)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                         (name, mobile, center_id, learning_type, parent_mobile, barcode, grade))
-            
-            if (i + 1) % 10 == 0:
-                print(f"Added {i + 1} students...")
-        
-        # Commit changes
-        conn.commit()
-        print(f"Successfully added 50 dummy students!")
-        
-        # Show summary
-        cursor.execute("SELECT COUNT(*) FROM students")
-        total_students = cursor.fetchone()[0]
-        print(f"Total students in database: {total_students}")
-        
-        # Show distribution by learning type
-        cursor.execute("SELECT learning_type, COUNT(*) FROM students GROUP BY learning_type")
-        type_distribution = cursor.fetchall()
-        print("\nDistribution by learning type:")
-        for learning_type, count in type_distribution:
-            print(f"  {learning_type}: {count} students")
-        
-        # Show distribution by center
-        cursor.execute("""
-            SELECT centers.name, COUNT(*) 
-            FROM students 
-            JOIN centers ON students.center_id = centers.id 
-            GROUP BY centers.name
-        """)
-        center_distribution = cursor.fetchall()
-        print("\nDistribution by center:")
-        for center_name, count in center_distribution:
-            print(f"  {center_name}: {count} students")
-            
+            return 0
+
+        if verbose:
+            print(f"Found {len(center_ids)} centers")
+            print(f"Adding {students} dummy students...")
+
+        # Insert batch by batch straight from the generator; a barcode that
+        # collides with an existing one is skipped
+        rows = generate_students(students, center_ids, rng)
+        while True:
+            batch = list(itertools.islice(rows, BATCH_ROWS))
+            if not batch:
+                break
+            added += attendance_api.add_students(batch, conn=conn, ignore_duplicates=True)
+            if verbose:
+                print(f"Added {added} students...")
+
+        if verbose:
+            print(f"Successfully added {added} dummy students!")
+            print_summary(cursor)
+
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         conn.rollback()
     except Exception as e:
         print(f"Error: {e}")
         conn.rollback()
-    finally:
-        conn.close()
+    return added
+
+
+def print_summary(cursor):
+    # Show summary
+    cursor.execute("SELECT COUNT(*) FROM students")
+    total_students = cursor.fetchone()[0]
+    print(f"Total students in database: {total_students}")
+
+    # Show distribution by learning type
+    cursor.execute("SELECT learning_type, COUNT(*) FROM students GROUP BY learning_type")
+    type_distribution = cursor.fetchall()
+    print("\nDistribution by learning type:")
+    for learning_type, count in type_distribution:
+        print(f"  {learning_type}: {count} students")
+
+    # Show distribution by center
+    cursor.execute("""
+        SELECT centers.name, COUNT(*) 
+        FROM students 
+        JOIN centers ON students.center_id = centers.id 
+        GROUP BY centers.name
+    """)
+    center_distribution = cursor.fetchall()
+    print("\nDistribution by center:")
+    for center_name, count in center_distribution:
+        print(f"  {center_name}: {count} students")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add dummy students for testing")
+    parser.add_argument("--students", type=int, default=50, help="Number of students to add (default: 50)")
+    parser.add_argument("--centers", type=int, default=len(centers), help=f"Number of centers (default: {len(centers)})")
+    parser.add_argument("--seed", type=int, help="Random seed, the same seed always generates the same data")
+    parser.add_argument("--db", help="Database file to fill (created if it does not exist)")
+    args = parser.parse_args()
+
     print("Student Attendance Management System - Dummy Data Generator")
     print("=" * 60)
-    
-    if not os.path.exists(db_path):
+
+    if args.db:
+        conn = attendance_api.open_database(args.db)
+        add_dummy_data(args.students, args.centers, args.seed, conn)
+    elif not os.path.exists(db_path):
         print(f"Error: Database file not found at {db_path}")
         print("Please run the main application first to create the database.")
     else:
-        add_dummy_data()
-    
-    print("\nPress Enter to exit...")
-    input()
+        conn = attendance_api.open_database(db_path)  # Upgrades a database from an older version of the app
+        add_dummy_data(args.students, args.centers, args.seed, conn)
+
+    # Keep the console window open when the script is started by double-click
+    if len(sys.argv) == 1:
+        print("\nPress Enter to exit...")
+        input()
@@ -1,126 +1,43 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import sqlite3
-import os
 import random
 import string
-import qrcode
+import io
 from fpdf import FPDF
-import tempfile
 from tkinter import filedialog
 # from datetime import datetime  # Removed due to naming conflict
 from PIL import Image, ImageTk
 import subprocess
+import multiprocessing
 import datetime
 import requests
+from migrations import create_database
+import queries
+from query_executor import QueryExecutor
+from scan_pipeline import ScanPipeline
+from virtual_grid import VirtualGrid, PAGE_ROWS
+from absence import AbsenceIndex, AbsenceSearch, ABSENT_ON_DATE, ABSENT_EVERY_DAY, ABSENT_AT_LEAST, ABSENCE_STREAK
+import importer
+import attendance_api
+import reports
+import cards
+import export
 
 
 #pyinstaller --onedir --windowed application.py
 
-# Get the directory where the script is running
-app_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Define the database file path in the same directory
-db_path = os.path.join(app_dir, 'students.db')
-
 # Splash screen duration (in milliseconds)
 SPLASH_DURATION = 3000
 
-# Database setup
-def create_database():
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+# Pause in typing (in milliseconds) before the students search runs
+STUDENT_SEARCH_DELAY_MS = 250
 
-    # Create centers table
-    cursor.execute('''CREATE TABLE IF NOT EXISTS centers (
-                        id INTEGER PRIMARY KEY,
-                        name TEXT UNIQUE NOT NULL,
-                        created_date TEXT)''')
-
-    # Check if students table exists and has the old schema
-    cursor.execute("PRAGMA table_info(students)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
-    if 'center_name' in columns and 'center_id' not in columns:
-        # Migration needed: old schema detected
-        print("Migrating database schema...")
-        
-        # Get existing data
-        cursor.execute("SELECT * FROM students")
-        existing_students = cursor.fetchall()
-        
-        # Get existing attendance data
-        cursor.execute("SELECT * FROM attendance")
-        existing_attendance = cursor.fetchall()
-        
-        # Drop old students table
-        cursor.execute("DROP TABLE IF EXISTS students")
-        
-        # Create new students table with proper schema
-        cursor.execute('''CREATE TABLE students (
-                            id INTEGER PRIMARY KEY,
-                            name TEXT,
-                            mobile TEXT,
-                            center_id INTEGER,
-                            learning_type TEXT,
-                            parent_mobile TEXT,
-                            barcode TEXT UNIQUE,
-                            grade TEXT,
-                            FOREIGN KEY(center_id) REFERENCES centers(id))''')
-        
-        # Migrate data
-        for student in existing_students:
-            student_id, name, mobile, center_name, learning_type, parent_mobile, barcode, grade = student
-            
-            # Create center if it doesn't exist
-            cursor.execute("INSERT OR IGNORE INTO centers (name, created_date) VALUES (?, ?)",
-                         (center_name, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-            
-            # Get center_id
-            cursor.execute("SELECT id FROM centers WHERE name = ?", (center_name,))
-            center_id = cursor.fetchone()[0]
-            
-            # Insert student with new schema
-            cursor.execute('''INSERT INTO students (id, name, mobile, center_id, learning_type, parent_mobile, barcode, grade)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                         (student_id, name, mobile, center_id, learning_type, parent_mobile, barcode, grade))
-        
-        # Recreate attendance table and restore data
-        cursor.execute("DROP TABLE IF EXISTS attendance")
-        cursor.execute('''CREATE TABLE attendance (
-                            id INTEGER PRIMARY KEY,
-                            student_id INTEGER,
-                            date TEXT,
-                            marks INTEGER,
-                            FOREIGN KEY(student_id) REFERENCES students(id))''')
-        
-        # Restore attendance data
-        for attendance in existing_attendance:
-            cursor.execute("INSERT INTO attendance VALUES (?, ?, ?, ?)", attendance)
-        
-        print("Database migration completed!")
-    
-    else:
-        # Create students table with new schema if it doesn't exist
-        cursor.execute('''CREATE TABLE IF NOT EXISTS students (
-                            id INTEGER PRIMARY KEY,
-                            name TEXT,
-                            mobile TEXT,
-                            center_id INTEGER,
-                            learning_type TEXT,
-                            parent_mobile TEXT,
-                            barcode TEXT UNIQUE,
-                            grade TEXT,
-                            FOREIGN KEY(center_id) REFERENCES centers(id))''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS attendance (
-                        id INTEGER PRIMARY KEY,
-                        student_id INTEGER,
-                        date TEXT,
-                        marks INTEGER,
-                        FOREIGN KEY(student_id) REFERENCES students(id))''')
-    conn.commit()
-    conn.close()
+# Colors of the scan status line
+SCAN_PENDING_COLOR = "#555555"
+SCAN_OK_COLOR = "#1b7f3b"
+SCAN_WARNING_COLOR = "#b36b00"
+SCAN_ERROR_COLOR = "#c62828"
 
 class SplashScreen(tk.Toplevel):
     def __init__(self, parent):
@@ -143,8 +60,27 @@ class SplashScreen(tk.Toplevel):
         self.creator_name.place(x=screen_width//2 - 150, y=screen_height//2)
         self.mobile_number.place(x=screen_width//2 - 150, y=screen_height//2 + 50)
 
-        # Close the splash screen after SPLASH_DURATION milliseconds
-        self.after(2000, self.destroy)  # Replace 5000 with your desired duration in milliseconds
+        # Database upgrade progress (only shown while a migration is running)
+        self.progress_text = tk.Label(self, text="", fg="black", bg="white", font=("Helvetica", 14))
+        self.progress_bar = ttk.Progressbar(self, orient="horizontal", length=300, mode="determinate")
+        self.progress_text.place(x=screen_width//2 - 150, y=screen_height//2 + 120)
+
+    def show_progress(self, message, done, total):
+        """Progress callback for create_database()"""
+        if total:
+            percent = min(100, done * 100 // total)
+            self.progress_text.config(text=f"Updating database: {message} {percent}%")
+            self.progress_bar.place(x=self.winfo_screenwidth()//2 - 150, y=self.winfo_screenheight()//2 + 160)
+            self.progress_bar['value'] = percent
+        else:
+            self.progress_text.config(text=f"Updating database: {message}...")
+        self.update()
+
+    def finish(self):
+        """Close the splash screen after the startup work is done"""
+        self.progress_text.config(text="")
+        self.progress_bar.place_forget()
+        self.after(2000, self.destroy)
 
 class StudentManagementApp:
     def __init__(self, root):
@@ -179,6 +115,25 @@ class StudentManagementApp:
         self.padx = 10
         self.pady = 5
 
+        # Reads run on a worker thread so the window never freezes on a large query
+        self.query_executor = QueryExecutor(self.root)
+        # Exports, imports and card batches take seconds: they get their own worker (and connection)
+        # so the grid pages and the attendance refresh after a scan never wait behind them
+        self.job_executor = QueryExecutor(self.root, name="job-executor")
+
+        # Every student's center, type and grade in memory: the student filters and counts never query the database
+        self.roster = attendance_api.load_roster()
+
+        # Who attended on each date as bitmaps, for the absent students wizard
+        self.absence_index = AbsenceIndex(self.roster)
+
+        # (barcode, month, center, type) of the report shown, for exporting it
+        self.report_view_filter = None
+
+        # Scans are written on their own thread, a few per transaction, so scanning never waits for the disk
+        self.scan_pipeline = ScanPipeline(self.root, self.on_scans_recorded, self.on_scans_failed)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
         self.create_widgets()
 
         # Global binding for Ctrl+V
@@ -250,6 +205,14 @@ class StudentManagementApp:
         # Clear Filters Button
         ttk.Button(filter_frame, text="مسح الفلاتر", command=self.clear_all_filters).grid(row=0, column=6, padx=self.padx, pady=self.pady)
 
+        # Search by name, mobile, parent mobile or barcode (any spelling of the name)
+        ttk.Label(filter_frame, text="بحث:").grid(row=1, column=0, padx=self.padx, pady=self.pady, sticky="E")
+        self.student_search_var = tk.StringVar()
+        self.student_search_entry = ttk.Entry(filter_frame, textvariable=self.student_search_var, width=50)
+        self.student_search_entry.grid(row=1, column=1, columnspan=3, padx=self.padx, pady=self.pady, sticky="WE")
+        self.student_search_entry.bind("<KeyRelease>", self.on_student_search_change)
+        self.student_search_job = None
+
         # Frame for displaying records in a table
         self.table_frame = ttk.Frame(self.student_scrollable_frame, padding=(10, 10))
         self.table_frame.pack(fill="both", expand=True)
@@ -286,6 +249,9 @@ class StudentManagementApp:
         self.tree.column("الصف", anchor="center")
         self.tree.pack(fill="both", expand=True)
 
+        # Only a window of the students is kept in the treeview, pages are read while scrolling
+        self.students_grid = VirtualGrid(self.tree, self.student_tree_scroll_y, self.query_executor, "students")
+
         # Load students only (filters will be loaded later)
         self.load_center_names()
         self.load_students()
@@ -301,6 +267,9 @@ class StudentManagementApp:
         self.update_button.pack(side="left", padx=self.padx)
         self.delete_button = ttk.Button(btn_frame, text="حذف المحدد", command=self.delete_student)
         self.delete_button.pack(side="left", padx=self.padx)
+        ttk.Button(btn_frame, text="استيراد من ملف", command=self.import_students_file).pack(side="left", padx=self.padx)
+        ttk.Button(btn_frame, text="طباعة بطاقات QR", command=self.print_student_cards).pack(side="left", padx=self.padx)
+        ttk.Button(btn_frame, text="تصدير", command=self.export_students).pack(side="left", padx=self.padx)
 
         # Frame for adding/updating a student
         self.add_frame = ttk.Frame(self.student_scrollable_frame, padding=(10, 10))
@@ -342,7 +311,7 @@ class StudentManagementApp:
         self.barcode_entry.bind("<KeyRelease>", self.validate_barcode_realtime)
 
         ttk.Label(self.add_frame, text="الصف:").grid(row=6, column=0, padx=self.padx, pady=self.pady, sticky="E")  # Added "Grade" field
-        self.student_grade_dropdown = ttk.Combobox(self.add_frame, textvariable=self.student_grade_var, state="readonly", values=["اولي", "ثانية", "ثالثة"])
+        self.student_grade_dropdown = ttk.Combobox(self.add_frame, textvariable=self.student_grade_var, state="readonly", values=attendance_api.GRADES)
         self.student_grade_dropdown.grid(row=6, column=1, padx=self.padx, pady=self.pady)  # Added "Grade" field dropdown
 
         # Generate Barcode Button
@@ -381,7 +350,7 @@ class StudentManagementApp:
 
         # Grade Filter for Attendance
         ttk.Label(attendance_filter_frame, text="الصف:").grid(row=0, column=4, padx=self.padx, pady=self.pady, sticky="E")
-        self.attendance_grade_filter = ttk.Combobox(attendance_filter_frame, state="normal", values=["", "اولي", "ثانية", "ثالثة"])
+        self.attendance_grade_filter = ttk.Combobox(attendance_filter_frame, state="normal", values=[""] + attendance_api.GRADES)
         self.attendance_grade_filter.grid(row=0, column=5, padx=self.padx, pady=self.pady)
 
         # Today's attendance checkbox
@@ -409,6 +378,11 @@ class StudentManagementApp:
 
         ttk.Button(barcode_frame, text="تأكيد", command=self.add_attendance).grid(row=0, column=2, padx=self.padx, pady=self.pady)
 
+        # Result of the last scan (no dialog, so the next student can scan right away)
+        self.scan_status_var = tk.StringVar()
+        self.scan_status_label = tk.Label(barcode_frame, textvariable=self.scan_status_var, font=('Helvetica', 14, 'bold'))
+        self.scan_status_label.grid(row=1, column=0, columnspan=3, padx=self.padx, pady=self.pady, sticky="W")
+
         # Treeview frame for attendance
         attendance_tree_frame = ttk.Frame(self.attendance_frame, padding=(10, 10))
         attendance_tree_frame.pack(fill="both", expand=True)
@@ -446,6 +420,10 @@ class StudentManagementApp:
         self.attendance_tree.column("الدرجات", anchor="center", width=100)
 
         self.attendance_tree.pack(fill="both", expand=True)
+        self.attendance_grid = VirtualGrid(self.attendance_tree, self.attendance_tree_scroll_y, self.query_executor, "attendance")
+        # Highest attendance id when the view was loaded: the refresh reads the rows after it even
+        # when the filtered view shows no row (or only old ones), instead of every attendance id
+        self.attendance_watermark = 0
 
         # Bind double-click for editing marks
         self.attendance_tree.bind("<Double-1>", self.edit_marks)
@@ -459,6 +437,7 @@ class StudentManagementApp:
 
         # Add show absent students button
         ttk.Button(attendance_btn_frame, text="عرض قائمة الغائبين", command=self.show_absent_students_wizard).pack(side="left", padx=self.padx)
+        ttk.Button(attendance_btn_frame, text="تصدير", command=self.export_attendance).pack(side="left", padx=self.padx)
 
         # Statistics frame for attendance
         stats_frame = ttk.Frame(self.attendance_frame, padding=(10, 10))
@@ -523,8 +502,16 @@ class StudentManagementApp:
         # Month filter
         ttk.Label(search_frame, text="التصفية حسب الشهر (MM-YYYY):").grid(row=0, column=3, padx=self.padx, pady=self.pady, sticky="E")
         self.month_filter_var = tk.StringVar()
-        self.month_filter_entry = ttk.Entry(search_frame, textvariable=self.month_filter_var)
+        # Only months that have attendance are offered; the list is refreshed every time it opens
+        self.month_filter_entry = ttk.Combobox(search_frame, textvariable=self.month_filter_var, state="normal",
+                                               postcommand=self.load_report_months)
         self.month_filter_entry.grid(row=0, column=4, padx=self.padx, pady=self.pady)
+        self.month_filter_entry.bind("<<ComboboxSelected>>", lambda e: self.apply_reporting_filters())
+
+        # Student × day matrix of a whole center for a month
+        ttk.Button(search_frame, text="التقرير الشهري", command=self.show_monthly_report).grid(row=0, column=5, padx=self.padx, pady=self.pady)
+        ttk.Button(search_frame, text="تصدير", command=self.export_report).grid(row=0, column=6, padx=self.padx, pady=self.pady)
+        ttk.Button(search_frame, text="ملخص السناتر", command=self.show_monthly_summary).grid(row=0, column=7, padx=self.padx, pady=self.pady)
 
         # Treeview frame for reporting
         reporting_tree_frame = ttk.Frame(self.reporting_frame, padding=(10, 10))
@@ -563,6 +550,10 @@ class StudentManagementApp:
 
         self.reporting_tree.pack(fill="both", expand=True)
 
+        # Report rows start with the attendance id (the page key), which is not displayed
+        self.reporting_grid = VirtualGrid(self.reporting_tree, self.reporting_tree_scroll_y, self.query_executor, "report",
+                                          values=lambda row: row[1:], on_loaded=self.show_report)
+
         # Counter frame
         counter_frame = ttk.Frame(self.reporting_frame, padding=(10, 10))
         counter_frame.pack(fill="x")
@@ -615,12 +606,8 @@ class StudentManagementApp:
         return 'break'  # Prevent the default Enter behavior
 
     def load_filters(self):
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
         # Load distinct values for Center Name (اسم السنتر)
-        cursor.execute("SELECT name FROM centers ORDER BY name")
-        center_names = [row[0] for row in cursor.fetchall()]
+        center_names = [row[1] for row in attendance_api.center_names()]
         self.center_name_filter['values'] = center_names
 
         # Load distinct values for Student Type (نوع الطالب)
@@ -628,9 +615,7 @@ class StudentManagementApp:
         self.student_type_filter['values'] = student_types
 
         # Load distinct values for Grade (الصف)
-        cursor.execute("SELECT DISTINCT grade FROM students")
-        grades = [row[0] for row in cursor.fetchall()]
-        self.grade_filter['values'] = grades
+        self.grade_filter['values'] = self.roster.grade_values()
 
         # Load attendance filters
         self.attendance_center_filter['values'] = center_names
@@ -655,8 +640,6 @@ class StudentManagementApp:
         self.student_type_filter.bind("<KeyRelease>", self.on_filter_change)
         self.grade_filter.bind("<KeyRelease>", self.on_filter_change)
 
-        conn.close()
-
     def paste_clipboard(self, event):
         """Handle the Ctrl+V paste event for specific entry widgets."""
         try:
@@ -685,8 +668,19 @@ class StudentManagementApp:
         if hasattr(widget, 'get') and widget.get() == "":
             self.apply_filters()
             
+    def on_student_search_change(self, event=None):
+        """Search once the user stops typing for a moment"""
+        if self.student_search_job is not None:
+            self.root.after_cancel(self.student_search_job)
+        self.student_search_job = self.root.after(STUDENT_SEARCH_DELAY_MS, self.search_students)
+
+    def search_students(self):
+        self.student_search_job = None
+        self.load_students()
+
     def clear_all_filters(self):
         """Clear all filters and show all students"""
+        self.student_search_var.set("")
         self.center_name_filter.set("")
         self.student_type_filter.set("")
         self.grade_filter.set("")
@@ -701,177 +695,108 @@ class StudentManagementApp:
         self.apply_attendance_filters()
 
     def load_students(self):
-        # Clear the existing data
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # Join with centers table to get center names
-        query = """SELECT students.id, students.name, students.mobile, centers.name as center_name,
-                          students.learning_type, students.parent_mobile, students.barcode, students.grade
-                   FROM students
-                   LEFT JOIN centers ON students.center_id = centers.id"""
-        parameters = []
-
-        # Apply filters if any filter is selected
-        if self.center_name_filter.get():
-            query += " WHERE centers.name = ?"
-            parameters.append(self.center_name_filter.get())
-
-        if self.student_type_filter.get():
-            if "WHERE" in query:
-                query += " AND learning_type = ?"
-            else:
-                query += " WHERE learning_type = ?"
-            parameters.append(self.student_type_filter.get())
-
-        if self.grade_filter.get():
-            if "WHERE" in query:
-                query += " AND grade = ?"
-            else:
-                query += " WHERE grade = ?"
-            parameters.append(self.grade_filter.get())
-
-        cursor.execute(query, parameters)
-        rows = cursor.fetchall()
+        filters = (self.center_name_filter.get(), self.student_type_filter.get(), self.grade_filter.get())
+        search_text = self.student_search_var.get().strip()
 
-        for row in rows:
-            self.tree.insert("", tk.END, values=row)
-        
-        conn.close()
+        def fetch_page(conn, after_id, limit):
+            if search_text:
+                return attendance_api.search_students(search_text, *filters, after_id, limit, conn=conn)
+            # The roster picks the ids of each page for the selected filters, the rows are read by id
+            return attendance_api.students_by_id(self.roster.student_ids(*filters, after_id, limit), conn=conn)
 
+        self.students_grid.load(fetch_page)
 
     def apply_attendance_filters(self):
-        self.load_attendance()
+        # Reload only when the filter changed, otherwise just add the new rows
+        if self.current_attendance_filter() == self.attendance_view_filter:
+            self.refresh_attendance()
+        else:
+            self.load_attendance()
         self.update_attendance_statistics()
 
-    def load_attendance(self):
-        # Clear the existing data
-        for item in self.attendance_tree.get_children():
-            self.attendance_tree.delete(item)
-
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # Base query with join
-        query = '''SELECT attendance.id, students.name, students.mobile, centers.name as center_name,
-                          students.learning_type, students.parent_mobile, students.grade, attendance.date, attendance.marks
-                   FROM attendance
-                   JOIN students ON attendance.student_id = students.id
-                   LEFT JOIN centers ON students.center_id = centers.id'''
-        parameters = []
-
-        # Apply filters if any filter is selected
-        conditions = []
-        
+    def current_attendance_filter(self):
+        """(date, center, type, grade) selected in the attendance tab"""
         # Check if "today only" is selected
+        date = None
         if hasattr(self, 'today_only_var') and self.today_only_var.get():
-            today = datetime.datetime.now().strftime("%Y-%m-%d")
-            conditions.append("attendance.date = ?")
-            parameters.append(today)
-        
-        if self.attendance_center_filter.get():
-            conditions.append("centers.name = ?")
-            parameters.append(self.attendance_center_filter.get())
+            date = datetime.datetime.now().strftime("%Y-%m-%d")
 
-        if self.attendance_type_filter.get():
-            conditions.append("students.learning_type = ?")
-            parameters.append(self.attendance_type_filter.get())
+        return (date, self.attendance_center_filter.get(), self.attendance_type_filter.get(),
+                self.attendance_grade_filter.get())
 
-        if self.attendance_grade_filter.get():
-            conditions.append("students.grade = ?")
-            parameters.append(self.attendance_grade_filter.get())
-
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-
-        query += " ORDER BY attendance.id DESC"
+    def load_attendance(self):
+        self.query_executor.cancel("attendance_refresh")
+        self.attendance_view_filter = self.current_attendance_filter()
+        date, *filters = self.attendance_view_filter
 
-        cursor.execute(query, parameters)
+        # Read before the first page (the worker runs them in order): a row recorded in between
+        # is in the page and also after the watermark, and show_new_attendance() skips it
+        self.query_executor.submit("attendance_watermark", lambda conn: attendance_api.last_attendance_id(conn=conn),
+                                   self.set_attendance_watermark)
 
-        rows = cursor.fetchall()
-        for row in rows:
-            # Insert the id (row[0]) but hide it in the treeview
-            self.attendance_tree.insert("", tk.END, values=row)
+        # The id (row[0]) is inserted but hidden in the treeview
+        self.attendance_grid.load(lambda conn, before_id, limit: attendance_api.attendance(date, *filters, before_id, limit,
+                                                                                           conn=conn))
 
-        conn.close()
+    def set_attendance_watermark(self, last_id):
+        self.attendance_watermark = last_id
 
-    def update_attendance_statistics(self):
-        """Calculate and update attendance statistics based on current filters"""
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+    def lower_attendance_watermark(self):
+        """After attendance was deleted: SQLite gives the next row the id after the highest one left"""
+        self.attendance_watermark = min(self.attendance_watermark, attendance_api.last_attendance_id())
 
-        # Get current filter values
-        center_filter = self.attendance_center_filter.get() if hasattr(self, 'attendance_center_filter') else ""
-        type_filter = self.attendance_type_filter.get() if hasattr(self, 'attendance_type_filter') else ""
-        grade_filter = self.attendance_grade_filter.get() if hasattr(self, 'attendance_grade_filter') else ""
+    def attendance_refresh_key(self):
+        """Id after which refresh_attendance() looks for new rows"""
+        return max(self.attendance_grid.top_key() or 0, self.attendance_watermark)
 
-        # Build base query for total students (filtered by current selections)
-        total_query = """SELECT COUNT(DISTINCT students.id)
-                        FROM students
-                        LEFT JOIN centers ON students.center_id = centers.id"""
-        total_parameters = []
+    def refresh_attendance(self):
+        """Add the attendance rows recorded since the view was loaded"""
+        if not self.attendance_grid.at_start():
+            return  # The new rows are read when scrolling back to the top
 
-        # Apply filters for total students count
-        conditions = []
-        if center_filter:
-            conditions.append("centers.name = ?")
-            total_parameters.append(center_filter)
+        watermark = self.attendance_refresh_key()
+        date, *filters = self.attendance_view_filter
 
-        if type_filter:
-            conditions.append("students.learning_type = ?")
-            total_parameters.append(type_filter)
+        def new_rows(conn):
+            return attendance_api.attendance(date, *filters, limit=PAGE_ROWS + 1, after_id=watermark, conn=conn)
 
-        if grade_filter:
-            conditions.append("students.grade = ?")
-            total_parameters.append(grade_filter)
+        self.query_executor.submit("attendance_refresh", new_rows, self.show_new_attendance)
 
-        if conditions:
-            total_query += " WHERE " + " AND ".join(conditions)
+    def show_new_attendance(self, rows):
+        """Display the rows found by refresh_attendance()"""
+        if len(rows) > PAGE_ROWS:
+            self.load_attendance()  # Too many new rows to merge, start again from the top
+            return
+        if not self.attendance_grid.at_start():
+            return
 
-        cursor.execute(total_query, total_parameters)
-        total_students = cursor.fetchone()[0]
+        # Rows come newest first; skip any shown since the refresh was submitted
+        watermark = self.attendance_refresh_key()
+        for row in reversed(rows):
+            if row[0] > watermark:
+                self.attendance_grid.prepend(row)
 
-        # Build query for present students (attendance today) with same filters
+    def update_attendance_statistics(self):
+        """Calculate and update attendance statistics based on current filters"""
+        # Get current filter values
+        center_filter = self.attendance_center_filter.get() if hasattr(self, 'attendance_center_filter') else ""
+        type_filter = self.attendance_type_filter.get() if hasattr(self, 'attendance_type_filter') else ""
+        grade_filter = self.attendance_grade_filter.get() if hasattr(self, 'attendance_grade_filter') else ""
         today = datetime.datetime.now().strftime("%Y-%m-%d")
-        present_query = """SELECT COUNT(DISTINCT students.id)
-                          FROM attendance
-                          JOIN students ON attendance.student_id = students.id
-                          LEFT JOIN centers ON students.center_id = centers.id
-                          WHERE attendance.date = ?"""
-        present_parameters = [today]
-
-        # Apply same filters for present students
-        if center_filter:
-            present_query += " AND centers.name = ?"
-            present_parameters.append(center_filter)
-
-        if type_filter:
-            present_query += " AND students.learning_type = ?"
-            present_parameters.append(type_filter)
 
-        if grade_filter:
-            present_query += " AND students.grade = ?"
-            present_parameters.append(grade_filter)
+        def count_students(conn):
+            return attendance_api.stats(today, center_filter, type_filter, grade_filter, roster=self.roster, conn=conn)
 
-        cursor.execute(present_query, present_parameters)
-        present_students = cursor.fetchone()[0]
-
-        # Get total unfiltered count for comparison if filters are applied
-        total_unfiltered = 0
-        if center_filter or type_filter or grade_filter:
-            cursor.execute("SELECT COUNT(DISTINCT students.id) FROM students")
-            total_unfiltered = cursor.fetchone()[0]
-
-        conn.close()
+        self.query_executor.submit("attendance_statistics", count_students,
+                                   lambda counts: self.show_attendance_statistics(*counts, center_filter or type_filter or grade_filter))
 
+    def show_attendance_statistics(self, total_students, present_students, total_unfiltered, filtered):
+        """Display the counts computed by update_attendance_statistics()"""
         # Calculate absent students (total filtered - present)
         absent_students = total_students - present_students
 
         # Update the labels with filtered counts
-        if center_filter or type_filter or grade_filter:
+        if filtered:
             self.total_students_var.set(f"اجمالي عدد الطلاب (مفلتر): {total_students} / {total_unfiltered}")
         else:
             self.total_students_var.set(f"اجمالي عدد الطلاب: {total_students}")
@@ -884,58 +809,73 @@ class StudentManagementApp:
             messagebox.showwarning("خطأ", "يرجى إدخال الرمز الشريطي.")
             return
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute('''SELECT students.id, students.name, students.mobile, centers.name as center_name, 
-                                 students.learning_type, students.parent_mobile, students.grade 
-                          FROM students 
-                          LEFT JOIN centers ON students.center_id = centers.id 
-                          WHERE students.barcode = ?''', (barcode,))
-        student = cursor.fetchone()
+        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+
+        # The barcode is looked up in memory, only the attendance insert goes to the database
+        student = self.roster.find_barcode(barcode)
+        if student is None:
+            # Not in the roster: maybe added from another device since it was loaded
+            row = attendance_api.find_student(barcode)
+            if row:
+                self.roster.add(row[0], row[1], barcode, row[3], row[4], row[6])
+                student = row[:2]
 
         if student:
-            student_id = student[0]
-            name = student[1]
-            mobile = student[2]
-            center_name = student[3]
-            learning_type = student[4]
-            parent_mobile = student[5]
-            grade = student[6]
-            current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-
-            # Insert the attendance record into the database
-            cursor.execute('''INSERT INTO attendance (student_id, date, marks)
-                            VALUES (?, ?, ?)''', (student_id, current_date, ""))
-
-            conn.commit()
-
-            # Retrieve the attendance ID after insertion
-            attendance_id = cursor.lastrowid
-
-            # Add the data to the Treeview (make sure to include the hidden ID column)
-            self.attendance_tree.insert("", 0, values=(attendance_id, name, mobile, center_name, learning_type, parent_mobile, grade, current_date, ""))  # Added 'attendance_id'
-            messagebox.showinfo("نجاح", f"تم تسجيل الحضور للطالب {name}.")
-            # Update statistics after adding attendance
-            self.update_attendance_statistics()
+            student_id, name = student
+
+            # Queue the attendance record (ignored if already present today); on_scans_recorded() confirms it
+            self.scan_pipeline.submit((student_id, current_date, "", name))
+
             # Clear the barcode field for next scan
             self.search_barcode_var.set("")
+            self.show_scan_status(f"جاري تسجيل حضور {name}...", SCAN_PENDING_COLOR)
         else:
+            # The only case that stops the desk: make it loud
+            self.root.bell()
+            self.show_scan_status(f"✗ رمز شريطي غير معروف: {barcode}", SCAN_ERROR_COLOR)
             messagebox.showwarning("خطأ", "لم يتم العثور على طالب بالرمز الشريطي المدخل.")
 
-        conn.close()
+    def show_scan_status(self, message, color):
+        self.scan_status_var.set(message)
+        self.scan_status_label.configure(foreground=color)
+
+    def on_scans_recorded(self, results):
+        """Confirm a batch of scans written by the scan pipeline"""
+        recorded = [scan for scan, attendance_id in results if attendance_id is not None]
+        for (student_id, date, *_), attendance_id in results:
+            if attendance_id is not None:
+                self.absence_index.mark(student_id, date, attendance_id)
+        (_, _, _, name), attendance_id = results[-1]
+
+        if attendance_id is None:
+            self.show_scan_status(f"تم تسجيل حضور الطالب {name} اليوم بالفعل.", SCAN_WARNING_COLOR)
+        else:
+            self.show_scan_status(f"✓ تم تسجيل الحضور للطالب {name}.", SCAN_OK_COLOR)
+        if recorded:
+            self.root.bell()
+
+            # Show the new rows (and any recorded meanwhile by another device) if they match the filters
+            self.refresh_attendance()
+            # Update statistics after adding attendance
+            self.update_attendance_statistics()
+
+    def on_scans_failed(self, scans, error):
+        self.root.bell()
+        names = "، ".join(scan[3] for scan in scans)
+        self.show_scan_status("✗ لم يتم تسجيل الحضور", SCAN_ERROR_COLOR)
+        messagebox.showerror("خطأ في قاعدة البيانات", f"لم يتم تسجيل حضور: {names}\n{error}")
+
+    def on_close(self):
+        # Write the scans still queued before leaving
+        self.scan_pipeline.close()
+        self.root.destroy()
 
     def auto_confirm_attendance(self, barcode):
         """Auto-confirm attendance after 1 second delay if barcode exists"""
         if not barcode.strip():
             return
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM students WHERE barcode = ?", (barcode,))
-        student = cursor.fetchone()
-        conn.close()
-
-        if student:
+        if self.roster.barcode_exists(barcode):
             # Barcode exists, auto-confirm attendance
             self.add_attendance()
         # If barcode doesn't exist, do nothing (user can continue typing or press enter)
@@ -945,13 +885,7 @@ class StudentManagementApp:
         if not barcode.strip():
             return
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM students WHERE barcode = ?", (barcode,))
-        student = cursor.fetchone()
-        conn.close()
-
-        if student:
+        if self.roster.barcode_exists(barcode):
             # Barcode exists, auto-filter reports
             self.filter_by_barcode()
         # If barcode doesn't exist, do nothing (user can continue typing or press enter)
@@ -978,61 +912,69 @@ class StudentManagementApp:
         """Apply filters to the reporting view"""
         self.filter_by_barcode()
 
+    def load_report_months(self):
+        """Fill the month dropdown with the months that have attendance records"""
+        self.month_filter_entry['values'] = [""] + attendance_api.report_months()
+
     def filter_by_barcode(self):
         barcode = self.report_barcode_var.get()
-        month_filter = self.month_filter_var.get()
+        month_filter = self.month_filter_var.get().strip()
 
         if not barcode:
             messagebox.showwarning("خطأ", "يرجى إدخال الرمز الشريطي.")
             return
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        # Build dynamic query with filters
-        query = '''SELECT students.name, students.mobile, centers.name as center_name, students.learning_type, students.parent_mobile, students.grade, attendance.date, attendance.marks
-                   FROM attendance
-                   JOIN students ON attendance.student_id = students.id
-                   LEFT JOIN centers ON students.center_id = centers.id'''
-        parameters = []
-
-        # Add WHERE conditions
-        conditions = ["students.barcode = ?"]
-        parameters.append(barcode)
-
         if month_filter:
-            conditions.append("strftime('%m-%Y', attendance.date) = ?")
-            parameters.append(month_filter)
-
-        if self.reporting_center_filter.get():
-            conditions.append("centers.name = ?")
-            parameters.append(self.reporting_center_filter.get())
-
-        if self.reporting_type_filter.get():
-            conditions.append("students.learning_type = ?")
-            parameters.append(self.reporting_type_filter.get())
-
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-
-        query += " ORDER BY attendance.id DESC"
-
-        cursor.execute(query, parameters)
-
-        rows = cursor.fetchall()
+            try:
+                queries.month_range(month_filter)
+            except ValueError:
+                messagebox.showerror("خطأ", "صيغة الشهر غير صحيحة. استخدم MM-YYYY")
+                return
 
-        # Clear the existing data in the reporting treeview
-        for item in self.reporting_tree.get_children():
-            self.reporting_tree.delete(item)
+        filters = (self.reporting_center_filter.get(), self.reporting_type_filter.get())
+        self.report_view_filter = (barcode, month_filter, *filters)
+
+        self.reporting_grid.load(
+            lambda conn, before_id, limit: attendance_api.report(barcode, month_filter, *filters, before_id, limit, conn=conn),
+            count=lambda conn: attendance_api.report_count(barcode, month_filter, *filters, conn=conn))
+
+    def export_students(self):
+        """Export the students matching the search and filters"""
+        filters = (self.center_name_filter.get(), self.student_type_filter.get(), self.grade_filter.get())
+        search_text = self.student_search_var.get().strip()
+        export_to_file(self.root, self.job_executor, "export_students", "الطلاب",
+                       lambda path, conn, progress: export.export_students(path, search_text, *filters, conn=conn,
+                                                                           progress=progress))
+
+    def export_attendance(self):
+        """Export the attendance rows of the filter shown (today's or the whole history)"""
+        date, *filters = self.attendance_view_filter
+        export_to_file(self.root, self.job_executor, "export_attendance", f"الحضور {date}" if date else "الحضور",
+                       lambda path, conn, progress: export.export_attendance(path, date, *filters, conn=conn,
+                                                                             progress=progress))
+
+    def export_report(self):
+        """Export the attendance history of the student shown in the reporting tab"""
+        if self.report_view_filter is None:
+            messagebox.showwarning("خطأ", "اعرض تقرير الطالب أولاً")
+            return
+        barcode, month, *filters = self.report_view_filter
+        export_to_file(self.root, self.job_executor, "export_report", f"تقرير {barcode}",
+                       lambda path, conn, progress: export.export_report(path, barcode, month, *filters, conn=conn,
+                                                                         progress=progress))
 
-        # Insert the results into the Treeview
-        for row in rows:
-            self.reporting_tree.insert("", tk.END, values=row)
+    def show_monthly_report(self):
+        """Open the monthly attendance matrix with the reporting filters"""
+        MonthlyReportWindow(self.root, self)
 
-        conn.close()
+    def show_monthly_summary(self):
+        """Open the center/month summary with the reporting filters"""
+        MonthlySummaryWindow(self.root, self)
 
+    def show_report(self, total):
+        """Called once the first page of filter_by_barcode() is displayed"""
         # Update result counter
-        self.result_count_var.set(f"النتائج: {len(rows)}")
+        self.result_count_var.set(f"النتائج: {total}")
 
     def on_tree_select(self, event):
         if self.tree.selection():
@@ -1069,16 +1011,8 @@ class StudentManagementApp:
         mobile = self.student_mobile_var.get()
 
         if barcode and mobile:
-            # Generate QR code
-            qr = qrcode.QRCode(version=1, box_size=10, border=5)
-            qr.add_data(barcode)
-            qr.make(fit=True)
-            img = qr.make_image(fill='black', back_color='white')
-
-            # Save QR code to a temporary file
-            with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_file:
-                img.save(tmp_file, "PNG")
-                tmp_file_path = tmp_file.name
+            # Generate QR code (PNG bytes kept in memory)
+            qr_png = cards.qr_png(barcode)
 
             # Ask the user where to save the PDF
             pdf_output_path = filedialog.asksaveasfilename(
@@ -1096,7 +1030,7 @@ class StudentManagementApp:
                 pdf.set_font('Arial', 'B', 12)
 
                 # Add the QR code image
-                pdf.image(tmp_file_path, x=60, y=60, w=90, h=90)  # Adjust image position and size
+                pdf.image(io.BytesIO(qr_png), x=60, y=60, w=90, h=90)  # Adjust image position and size
 
                 # Add the mobile number and barcode to the PDF
                 pdf.set_xy(10, 160)
@@ -1106,39 +1040,56 @@ class StudentManagementApp:
                 # Output the PDF to the specified file path
                 pdf.output(pdf_output_path)
 
-                # Clean up the temporary QR code image file
-                os.remove(tmp_file_path)
-
                 # Show a success message
                 messagebox.showinfo("نجاح", f"تم حفظ رمز الاستجابة السريعة في {pdf_output_path}")
-            else:
-                # Clean up the temporary file if the user cancels the save dialog
-                os.remove(tmp_file_path)
         else:
             # Show a warning if no barcode or mobile number is provided
             messagebox.showwarning("خطأ", "لا يوجد رمز شريطي أو رقم جوال لتوليد رمز الاستجابة السريعة.")
 
+    def print_student_cards(self):
+        """Print the QR cards of the selected students, or of every student matching the filters, into one PDF"""
+        student_ids = [int(self.tree.item(item, 'values')[0]) for item in self.tree.selection()] or None
+        filters = (self.center_name_filter.get(), self.student_type_filter.get(), self.grade_filter.get())
+        if student_ids is None and not any(filters):
+            if not messagebox.askyesno("تأكيد", "لم يتم تحديد طلاب أو فلتر. هل تريد طباعة بطاقات جميع الطلاب؟"):
+                return
+
+        path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF files", "*.pdf")], title="حفظ البطاقات")
+        if not path:
+            return
+
+        # The QR codes are rendered on a process pool from the job executor's worker
+        self.root.config(cursor="watch")
+        self.job_executor.submit(
+            "student_cards",
+            lambda conn: cards.write_card_sheets(cards.card_students(*filters, student_ids=student_ids, conn=conn), path),
+            lambda result: self.on_cards_printed(path, *result), self.on_cards_failed)
+
+    def on_cards_printed(self, path, count, seconds, cached):
+        self.root.config(cursor="")
+        if not count:
+            messagebox.showwarning("تنبيه", "لا يوجد طلاب لديهم رمز شريطي في الاختيار الحالي.")
+            return
+        rate = count / seconds if seconds else 0
+        messagebox.showinfo("نجاح", f"تم حفظ {count} بطاقة في {path}\nخلال {seconds:.1f} ثانية ({rate:.0f} بطاقة/ثانية)"
+                                    f"\nرموز QR من الذاكرة المؤقتة: {cached} من {count}")
+
+    def on_cards_failed(self, error):
+        self.root.config(cursor="")
+        messagebox.showerror("خطأ", f"تعذر إنشاء البطاقات: {error}")
+
     def validate_barcode_realtime(self, event=None):
         """Real-time validation of barcode uniqueness"""
         barcode = self.barcode_var.get().strip()
         if barcode and len(barcode) >= 3:  # Start checking after 3 characters
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
             # Check if we're updating (exclude current student if editing)
+            student_id = None
             if hasattr(self, 'tree') and self.tree.selection():
                 # We're editing - exclude current student
                 selected_item = self.tree.selection()[0]
                 student_id = self.tree.item(selected_item)['values'][0]
-                cursor.execute("SELECT id FROM students WHERE barcode = ? AND id != ?", (barcode, student_id))
-            else:
-                # We're adding new student
-                cursor.execute("SELECT id FROM students WHERE barcode = ?", (barcode,))
-            
-            existing_student = cursor.fetchone()
-            conn.close()
-            
-            if existing_student:
+
+            if self.roster.barcode_exists(barcode, student_id):
                 # Change background color to indicate duplicate
                 self.barcode_entry.configure(background='#ffcccc')  # Light red
             else:
@@ -1210,25 +1161,12 @@ class StudentManagementApp:
         for item in self.centers_tree.get_children():
             self.centers_tree.delete(item)
 
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT id, name, created_date FROM centers ORDER BY id DESC")
-        rows = cursor.fetchall()
-
-        for row in rows:
+        for row in attendance_api.centers():
             self.centers_tree.insert("", tk.END, values=row)
 
-        conn.close()
-
     def load_center_names(self):
         """Load center names for dropdowns"""
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT id, name FROM centers ORDER BY name")
-        centers = cursor.fetchall()
-        conn.close()
+        centers = attendance_api.center_names()
 
         # Store centers as (id, name) tuples for easy lookup
         self.centers_list = centers
@@ -1261,15 +1199,7 @@ class StudentManagementApp:
 
         if messagebox.askyesno("تأكيد", "هل أنت متأكد من أنك تريد حفظ هذا السنتر؟"):
             try:
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-
-                current_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                cursor.execute("INSERT INTO centers (name, created_date) VALUES (?, ?)",
-                             (center_name, current_date))
-
-                conn.commit()
-                conn.close()
+                attendance_api.add_center(center_name)
 
                 self.load_centers()
                 self.load_center_names()  # Refresh dropdowns
@@ -1286,7 +1216,7 @@ class StudentManagementApp:
         selected_item = self.centers_tree.selection()
         if selected_item:
             if messagebox.askyesno("تأكيد", "هل أنت متأكد من أنك تريد تحديث هذا السنتر؟"):
-                center_id = self.centers_tree.item(selected_item)['values'][0]
+                center_id, old_name = self.centers_tree.item(selected_item)['values'][:2]
                 center_name = self.center_name_var.get().strip()
 
                 if not center_name:
@@ -1294,12 +1224,8 @@ class StudentManagementApp:
                     return
 
                 try:
-                    conn = sqlite3.connect(db_path)
-                    cursor = conn.cursor()
-                    cursor.execute("UPDATE centers SET name=? WHERE id=?",
-                                 (center_name, center_id))
-                    conn.commit()
-                    conn.close()
+                    attendance_api.rename_center(center_id, center_name)
+                    self.roster.rename_center(str(old_name), center_name)
 
                     self.load_centers()
                     self.load_center_names()  # Refresh dropdowns
@@ -1317,34 +1243,20 @@ class StudentManagementApp:
         selected_item = self.centers_tree.selection()
         if selected_item:
             if messagebox.askyesno("تأكيد", "هل أنت متأكد من أنك تريد حذف هذا السنتر؟\nسيتم حذف جميع السجلات المرتبطة بهذا السنتر."):
-                center_id = self.centers_tree.item(selected_item)['values'][0]
+                center_id, center_name = self.centers_tree.item(selected_item)['values'][:2]
 
                 try:
-                    conn = sqlite3.connect(db_path)
-                    cursor = conn.cursor()
-
-                    # Get all student IDs for this center
-                    cursor.execute("SELECT id FROM students WHERE center_id=?", (center_id,))
-                    student_ids = [row[0] for row in cursor.fetchall()]
-
-                    # Delete attendance records for these students
-                    if student_ids:
-                        cursor.execute(f"DELETE FROM attendance WHERE student_id IN ({','.join('?' * len(student_ids))})",
-                                     student_ids)
-
-                    # Delete students
-                    cursor.execute("DELETE FROM students WHERE center_id=?", (center_id,))
-
-                    # Delete center
-                    cursor.execute("DELETE FROM centers WHERE id=?", (center_id,))
-
-                    conn.commit()
-                    conn.close()
+                    # Deletes the attendance records and students of the center too
+                    attendance_api.delete_center(center_id)
+                    self.roster.remove_center(str(center_name))
 
                     self.load_centers()
                     self.load_center_names()  # Refresh dropdowns
                     self.load_students()  # Refresh student list
-                    self.load_attendance()  # Refresh attendance list
+                    # Remove the center's rows from the attendance list
+                    self.attendance_grid.delete_where(lambda values: values[3] == center_name)
+                    self.lower_attendance_watermark()
+                    self.update_attendance_statistics()
                     messagebox.showinfo("نجاح", "تم حذف السنتر وجميع السجلات المرتبطة بنجاح!")
 
                 except sqlite3.Error as e:
@@ -1368,13 +1280,7 @@ class StudentManagementApp:
         # Validate barcode uniqueness first
         barcode = self.barcode_var.get().strip()
         if barcode:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM students WHERE barcode = ?", (barcode,))
-            existing_student = cursor.fetchone()
-            conn.close()
-            
-            if existing_student:
+            if self.roster.barcode_exists(barcode):
                 messagebox.showerror("خطأ", "الرمز الشريطي موجود بالفعل. يرجى استخدام رمز شريطي مختلف.")
                 return
 
@@ -1401,16 +1307,8 @@ class StudentManagementApp:
 
             # Connect to the database and insert the new student
             try:
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-
-                # Insert query with center_id instead of center_name
-                cursor.execute('''INSERT INTO students (name, mobile, center_id, learning_type, parent_mobile, barcode, grade)
-                                VALUES (?, ?, ?, ?, ?, ?, ?)''',  # Updated to use center_id
-                            (name, mobile, center_id, learning_type, parent_mobile, barcode, grade))
-
-                conn.commit()
-                conn.close()
+                student_id = attendance_api.add_student(name, mobile, center_id, learning_type, parent_mobile, barcode, grade)
+                self.roster.add(student_id, name, barcode, center_name, learning_type, grade)
 
                 # Reload the table to show the new student
                 self.load_students()
@@ -1425,6 +1323,51 @@ class StudentManagementApp:
             except sqlite3.Error as e:
                 messagebox.showerror("خطأ في قاعدة البيانات", f"حدث خطأ أثناء إضافة الطالب: {e}")
 
+    def import_students_file(self):
+        """Bulk import students from a CSV or Excel file"""
+        path = filedialog.askopenfilename(
+            title="استيراد الطلاب",
+            filetypes=[("CSV / Excel", "*.csv *.xlsx"), ("CSV files", "*.csv"), ("Excel files", "*.xlsx")]
+        )
+        if not path:
+            return
+
+        create_centers = messagebox.askyesno("تأكيد", "هل تريد إنشاء السناتر غير الموجودة تلقائياً؟")
+
+        # The import runs on the job executor's worker thread; the UI is refreshed once at the end
+        self.root.config(cursor="watch")
+        self.job_executor.submit("import_students",
+                                 lambda conn: self.import_and_reload_roster(path, conn, create_centers),
+                                 self.on_students_imported, self.on_students_import_failed)
+
+    def import_and_reload_roster(self, path, conn, create_centers):
+        """Runs on the worker thread"""
+        try:
+            return importer.import_students(path, conn, create_centers)
+        finally:
+            self.roster.reload(conn)  # Chunks committed before a failure are kept too
+
+    def on_students_imported(self, result):
+        imported, rejected, errors = result
+        self.root.config(cursor="")
+
+        self.load_centers()
+        self.load_center_names()
+        self.load_students()
+        self.load_filters()
+
+        message = f"تم استيراد {imported} طالب."
+        if rejected:
+            message += f"\nتم تجاهل {rejected} صف:"
+            message += "".join(f"\n  سطر {line_number}: {error}" for line_number, error in errors[:10])
+            if rejected > 10:
+                message += "\n  ..."
+        messagebox.showinfo("نتيجة الاستيراد", message)
+
+    def on_students_import_failed(self, error):
+        self.root.config(cursor="")
+        messagebox.showerror("خطأ", f"تعذر استيراد الملف: {error}")
+
     def update_student(self):
         selected_item = self.tree.selection()
         if selected_item:
@@ -1432,13 +1375,7 @@ class StudentManagementApp:
             student_id = self.tree.item(selected_item)['values'][0]
             barcode = self.barcode_var.get().strip()
             if barcode:
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("SELECT id FROM students WHERE barcode = ? AND id != ?", (barcode, student_id))
-                existing_student = cursor.fetchone()
-                conn.close()
-                
-                if existing_student:
+                if self.roster.barcode_exists(barcode, student_id):
                     messagebox.showerror("خطأ", "الرمز الشريطي موجود بالفعل. يرجى استخدام رمز شريطي مختلف.")
                     return
 
@@ -1468,13 +1405,9 @@ class StudentManagementApp:
                     return
 
                 try:
-                    conn = sqlite3.connect(db_path)
-                    cursor = conn.cursor()
-                    cursor.execute('''UPDATE students SET name=?, mobile=?, center_id=?, learning_type=?, parent_mobile=?, barcode=?, grade=?
-                        WHERE id=?''',  # Updated to use center_id
-                                   (name, mobile, center_id, learning_type, parent_mobile, barcode, grade, student_id))
-                    conn.commit()
-                    conn.close()
+                    attendance_api.update_student(student_id, name, mobile, center_id, learning_type, parent_mobile,
+                                                  barcode, grade)
+                    self.roster.update(student_id, name, barcode, center_name, learning_type, grade)
 
                     self.load_students()  # Reload the table to show updated student
                     self.load_filters()  # Refresh the dropdown lists
@@ -1495,11 +1428,8 @@ class StudentManagementApp:
         if selected_item:
             if messagebox.askyesno("تأكيد", "هل أنت متأكد من أنك تريد حذف هذا الطالب؟"):
                 student_id = self.tree.item(selected_item)['values'][0]
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM students WHERE id=?", (student_id,))
-                conn.commit()
-                conn.close()
+                attendance_api.delete_student(student_id)
+                self.roster.remove(student_id)
 
                 self.load_students()  # Reload the table to remove the deleted student
                 self.load_filters()  # Refresh the dropdown lists
@@ -1538,13 +1468,7 @@ class StudentManagementApp:
         attendance_id = self.attendance_tree.item(row_id)['values'][0]  # Use the attendance ID
 
         # Update the database with the new marks value
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute('''UPDATE attendance
-                        SET marks=?
-                        WHERE id=?''', (new_value, attendance_id))  # Update based on attendance ID
-        conn.commit()
-        conn.close()
+        attendance_api.set_marks(attendance_id, new_value)  # Update based on attendance ID
 
         entry.destroy()  # Remove the entry widget after editing
 
@@ -1556,14 +1480,11 @@ class StudentManagementApp:
                 attendance_id = self.attendance_tree.item(selected_item)['values'][0]  # The 'id' is in the first column
 
                 # Delete from the database using the attendance id
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute('''DELETE FROM attendance WHERE id = ?''', (attendance_id,))
-                conn.commit()
-                conn.close()
+                attendance_api.delete_attendance(attendance_id)
 
                 # Remove from the Treeview
-                self.attendance_tree.delete(selected_item)
+                self.attendance_grid.delete(selected_item[0])
+                self.lower_attendance_watermark()
                 messagebox.showinfo("نجاح", "تم حذف سجل الحضور بنجاح!")
                 # Update statistics after deleting attendance
                 self.update_attendance_statistics()
@@ -1576,9 +1497,18 @@ class StudentManagementApp:
 
 
 class AbsentStudentsWizard(tk.Toplevel):
+    # Absence questions offered, with their labels
+    MODES = [
+        (ABSENT_ON_DATE, "غائب في يوم"),
+        (ABSENT_EVERY_DAY, "غائب كل أيام الفترة"),
+        (ABSENT_AT_LEAST, "غائب عدد أيام على الأقل في الفترة"),
+        (ABSENCE_STREAK, "غياب متتالي حتى التاريخ"),
+    ]
+
     def __init__(self, parent, main_app):
         super().__init__(parent)
         self.main_app = main_app
+        self.search = None
         self.title("عرض قائمة الغائبين")
         self.geometry("800x600")
         self.resizable(True, True)
@@ -1601,7 +1531,7 @@ class AbsentStudentsWizard(tk.Toplevel):
         self.name_search_entry = ttk.Entry(search_frame, textvariable=self.name_search_var, width=30)
         self.name_search_entry.grid(row=0, column=1, padx=5, pady=5, sticky="W")
         
-        # Date filter
+        # Date filter (the last day of a range)
         ttk.Label(search_frame, text="التصفية حسب التاريخ:").grid(row=0, column=2, padx=5, pady=5, sticky="E")
         self.date_filter_var = tk.StringVar()
         self.date_filter_entry = ttk.Entry(search_frame, textvariable=self.date_filter_var, width=15)
@@ -1613,6 +1543,30 @@ class AbsentStudentsWizard(tk.Toplevel):
         
         # Clear button
         ttk.Button(search_frame, text="مسح", command=self.clear_search).grid(row=0, column=5, padx=5, pady=5)
+
+        # Export button
+        ttk.Button(search_frame, text="تصدير", command=self.export_results).grid(row=0, column=6, padx=5, pady=5)
+
+        # Kind of absence
+        ttk.Label(search_frame, text="نوع الغياب:").grid(row=1, column=0, padx=5, pady=5, sticky="E")
+        self.mode_var = tk.StringVar(value=self.MODES[0][1])
+        self.mode_combo = ttk.Combobox(search_frame, textvariable=self.mode_var, values=[label for _, label in self.MODES],
+                                       state="readonly", width=28)
+        self.mode_combo.grid(row=1, column=1, padx=5, pady=5, sticky="W")
+        self.mode_combo.bind("<<ComboboxSelected>>", lambda e: self.update_mode_fields())
+
+        # First day of the range
+        ttk.Label(search_frame, text="من تاريخ:").grid(row=1, column=2, padx=5, pady=5, sticky="E")
+        self.start_date_var = tk.StringVar(value=self.default_start_date())
+        self.start_date_entry = ttk.Entry(search_frame, textvariable=self.start_date_var, width=15)
+        self.start_date_entry.grid(row=1, column=3, padx=5, pady=5, sticky="W")
+
+        # Minimum number of days absent
+        ttk.Label(search_frame, text="عدد الأيام:").grid(row=1, column=4, padx=5, pady=5, sticky="E")
+        self.min_days_var = tk.StringVar(value="2")
+        self.min_days_spinbox = ttk.Spinbox(search_frame, from_=1, to=365, textvariable=self.min_days_var, width=5)
+        self.min_days_spinbox.grid(row=1, column=5, padx=5, pady=5, sticky="W")
+        self.update_mode_fields()
         
         # Results frame
         results_frame = ttk.Frame(self, padding=(10, 10))
@@ -1631,7 +1585,7 @@ class AbsentStudentsWizard(tk.Toplevel):
         self.tree_scroll_x = ttk.Scrollbar(tree_frame, orient="horizontal")
         
         # Treeview
-        self.results_tree = ttk.Treeview(tree_frame, columns=("الاسم", "رقم الجوال", "اسم السنتر", "نوع الطالب", "رقم جوال ولي الامر", "الصف"), 
+        self.results_tree = ttk.Treeview(tree_frame, columns=("الاسم", "رقم الجوال", "اسم السنتر", "نوع الطالب", "رقم جوال ولي الامر", "الصف", "أيام الغياب"), 
                                        show='headings', yscrollcommand=self.tree_scroll_y.set, xscrollcommand=self.tree_scroll_x.set)
         
         self.tree_scroll_y.config(command=self.results_tree.yview)
@@ -1647,6 +1601,7 @@ class AbsentStudentsWizard(tk.Toplevel):
         self.results_tree.heading("نوع الطالب", text="نوع الطالب", anchor="center")
         self.results_tree.heading("رقم جوال ولي الامر", text="رقم جوال ولي الامر", anchor="center")
         self.results_tree.heading("الصف", text="الصف", anchor="center")
+        self.results_tree.heading("أيام الغياب", text="أيام الغياب", anchor="center")
         
         self.results_tree.column("الاسم", anchor="center", width=150)
         self.results_tree.column("رقم الجوال", anchor="center", width=120)
@@ -1654,8 +1609,14 @@ class AbsentStudentsWizard(tk.Toplevel):
         self.results_tree.column("نوع الطالب", anchor="center", width=100)
         self.results_tree.column("رقم جوال ولي الامر", anchor="center", width=120)
         self.results_tree.column("الصف", anchor="center", width=100)
+        self.results_tree.column("أيام الغياب", anchor="center", width=80)
         
         self.results_tree.pack(fill="both", expand=True)
+
+        # Rows start with the student id; pages are keyed by (name, id)
+        self.results_grid = VirtualGrid(self.results_tree, self.tree_scroll_y, self.main_app.query_executor, "absent_students",
+                                        key=lambda row: (row[1], row[0]), values=lambda row: row[1:],
+                                        on_loaded=self.show_absent_students, on_error=self.show_search_error)
         
         # Status bar
         self.status_var = tk.StringVar(value="جاهز للبحث")
@@ -1665,107 +1626,395 @@ class AbsentStudentsWizard(tk.Toplevel):
         # Bind Enter key to search
         self.name_search_entry.bind("<Return>", lambda e: self.search_absent_students())
         self.date_filter_entry.bind("<Return>", lambda e: self.search_absent_students())
+        self.start_date_entry.bind("<Return>", lambda e: self.search_absent_students())
+        self.min_days_spinbox.bind("<Return>", lambda e: self.search_absent_students())
         
         # Focus on name search
         self.name_search_entry.focus()
-        
+
+    def default_start_date(self):
+        """A week before today"""
+        return (datetime.datetime.now() - datetime.timedelta(days=6)).strftime("%Y-%m-%d")
+
+    def selected_mode(self):
+        label = self.mode_var.get()
+        return next(mode for mode, mode_label in self.MODES if mode_label == label)
+
+    def update_mode_fields(self):
+        """Enable the range start and the number of days only for the questions using them"""
+        mode = self.selected_mode()
+        self.start_date_entry.config(state="normal" if mode in (ABSENT_EVERY_DAY, ABSENT_AT_LEAST) else "disabled")
+        self.min_days_spinbox.config(state="normal" if mode in (ABSENT_AT_LEAST, ABSENCE_STREAK) else "disabled")
+
     def search_absent_students(self):
         """Search for absent students based on filters"""
         name_search = self.name_search_var.get().strip()
         date_filter = self.date_filter_var.get().strip()
+        start_date = self.start_date_var.get().strip()
+        mode = self.selected_mode()
         
-        if not date_filter:
+        if not date_filter or (mode in (ABSENT_EVERY_DAY, ABSENT_AT_LEAST) and not start_date):
             messagebox.showwarning("خطأ", "يرجى إدخال تاريخ للبحث")
             return
             
         try:
             # Validate date format
             datetime.datetime.strptime(date_filter, "%Y-%m-%d")
+            if mode in (ABSENT_EVERY_DAY, ABSENT_AT_LEAST):
+                datetime.datetime.strptime(start_date, "%Y-%m-%d")
         except ValueError:
             messagebox.showerror("خطأ", "صيغة التاريخ غير صحيحة. استخدم YYYY-MM-DD")
             return
+
+        if mode in (ABSENT_EVERY_DAY, ABSENT_AT_LEAST) and start_date > date_filter:
+            messagebox.showerror("خطأ", "تاريخ البداية بعد تاريخ النهاية")
+            return
+
+        try:
+            min_days = int(self.min_days_var.get())
+        except ValueError:
+            min_days = 0
+        if min_days < 1:
+            messagebox.showerror("خطأ", "عدد الأيام يجب أن يكون رقماً أكبر من صفر")
+            return
         
         # Clear previous results
-        for item in self.results_tree.get_children():
-            self.results_tree.delete(item)
+        self.results_grid.clear()
         
         self.status_var.set("جاري البحث...")
-        self.update()
         
-        try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Build query to find absent students
-            query = """
-                SELECT DISTINCT 
-                    students.name, 
-                    students.mobile, 
-                    centers.name as center_name, 
-                    students.learning_type, 
-                    students.parent_mobile, 
-                    students.grade
-                FROM students
-                LEFT JOIN centers ON students.center_id = centers.id
-                WHERE students.id NOT IN (
-                    SELECT DISTINCT student_id 
-                    FROM attendance 
-                    WHERE date = ?
-                )
-            """
-            parameters = [date_filter]
-            
-            # Add name filter if provided
-            if name_search:
-                query += " AND students.name LIKE ?"
-                parameters.append(f"%{name_search}%")
-            
-            # Add current attendance filters if they exist
-            if hasattr(self.main_app, 'attendance_center_filter') and self.main_app.attendance_center_filter.get():
-                query += " AND centers.name = ?"
-                parameters.append(self.main_app.attendance_center_filter.get())
-                
-            if hasattr(self.main_app, 'attendance_type_filter') and self.main_app.attendance_type_filter.get():
-                query += " AND students.learning_type = ?"
-                parameters.append(self.main_app.attendance_type_filter.get())
-            
-            query += " ORDER BY students.name"
-            
-            cursor.execute(query, parameters)
-            rows = cursor.fetchall()
-            
-            # Insert results
-            for row in rows:
-                self.results_tree.insert("", tk.END, values=row)
-            
-            # Update status
-            if rows:
-                self.status_var.set(f"تم العثور على {len(rows)} طالب غائب")
-                self.results_label.config(text=f"نتائج البحث: {len(rows)} طالب غائب")
-            else:
-                self.status_var.set("لم يتم العثور على نتائج")
-                self.results_label.config(text="نتائج البحث: لا توجد نتائج")
-            
-            conn.close()
-            
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء البحث: {str(e)}")
-            self.status_var.set("حدث خطأ أثناء البحث")
-            conn.close()
+        # Use the current attendance filters if they exist
+        center_filter = self.main_app.attendance_center_filter.get() if hasattr(self.main_app, 'attendance_center_filter') else ""
+        type_filter = self.main_app.attendance_type_filter.get() if hasattr(self.main_app, 'attendance_type_filter') else ""
+
+        # Answered from the presence bitmaps on the first page, then read a page at a time
+        self.search = AbsenceSearch(self.main_app.absence_index, mode, start_date, date_filter, min_days,
+                                    name_search, center_filter, type_filter)
+        self.results_grid.load(self.search.page, count=self.search.count)
+
+    def show_absent_students(self, total):
+        """Called once the first page of search_absent_students() is displayed"""
+        if not self.winfo_exists():
+            return  # The wizard was closed while searching
+
+        # Update status
+        if total and self.search.mode != ABSENT_ON_DATE:
+            self.status_var.set(f"تم العثور على {total} طالب غائب (من {self.search.days} يوم دراسي)")
+            self.results_label.config(text=f"نتائج البحث: {total} طالب غائب")
+        elif total:
+            self.status_var.set(f"تم العثور على {total} طالب غائب")
+            self.results_label.config(text=f"نتائج البحث: {total} طالب غائب")
+        else:
+            self.status_var.set("لم يتم العثور على نتائج")
+            self.results_label.config(text="نتائج البحث: لا توجد نتائج")
+
+    def show_search_error(self, error):
+        if not self.winfo_exists():
+            return
+        messagebox.showerror("خطأ", f"حدث خطأ أثناء البحث: {str(error)}")
+        self.status_var.set("حدث خطأ أثناء البحث")
     
+    def export_results(self):
+        """Export every student of the last search, not only the rows shown"""
+        if self.search is None:
+            messagebox.showwarning("خطأ", "قم بالبحث أولاً", parent=self)
+            return
+        search = self.search
+        export_to_file(self, self.main_app.job_executor, "export_absentees", f"الغائبين {search.end}",
+                       lambda path, conn, progress: export.export_absentees(path, search, conn=conn, progress=progress))
+
     def clear_search(self):
         """Clear search fields and results"""
         self.name_search_var.set("")
         self.date_filter_var.set(datetime.datetime.now().strftime("%Y-%m-%d"))
+        self.start_date_var.set(self.default_start_date())
         
-        for item in self.results_tree.get_children():
-            self.results_tree.delete(item)
-            
+        self.results_grid.clear()
+
         self.results_label.config(text="نتائج البحث:")
         self.status_var.set("تم مسح البحث")
         self.name_search_entry.focus()
 
 
+class MonthlyReportWindow(tk.Toplevel):
+    """Monthly attendance matrix of a center: a row per student and a column per school day"""
+
+    def __init__(self, parent, main_app):
+        super().__init__(parent)
+        self.main_app = main_app
+        self.report = None
+        self.title("التقرير الشهري")
+        self.geometry("1000x600")
+        self.resizable(True, True)
+        self.transient(parent)
+
+        self.create_widgets()
+
+    def create_widgets(self):
+        filter_frame = ttk.Frame(self, padding=(10, 10))
+        filter_frame.pack(fill="x", padx=10, pady=10)
+
+        # Center, type and month, starting from the reporting tab's filters
+        ttk.Label(filter_frame, text="اسم السنتر:").grid(row=0, column=0, padx=5, pady=5, sticky="E")
+        self.center_var = tk.StringVar(value=self.main_app.reporting_center_filter.get())
+        ttk.Combobox(filter_frame, textvariable=self.center_var, values=self.main_app.reporting_center_filter['values'],
+                     state="readonly").grid(row=0, column=1, padx=5, pady=5)
+
+        ttk.Label(filter_frame, text="نوع الطالب:").grid(row=0, column=2, padx=5, pady=5, sticky="E")
+        self.type_var = tk.StringVar(value=self.main_app.reporting_type_filter.get())
+        ttk.Combobox(filter_frame, textvariable=self.type_var, values=[""] + attendance_api.LEARNING_TYPES,
+                     state="readonly", width=10).grid(row=0, column=3, padx=5, pady=5)
+
+        ttk.Label(filter_frame, text="الشهر (MM-YYYY):").grid(row=0, column=4, padx=5, pady=5, sticky="E")
+        months = attendance_api.report_months()
+        self.month_var = tk.StringVar(value=self.main_app.month_filter_var.get().strip() or (months[0] if months else ""))
+        ttk.Combobox(filter_frame, textvariable=self.month_var, values=months, width=10).grid(row=0, column=5, padx=5, pady=5)
+
+        ttk.Button(filter_frame, text="عرض", command=self.load_report).grid(row=0, column=6, padx=5, pady=5)
+        ttk.Button(filter_frame, text="تصدير", command=self.export_report).grid(row=0, column=7, padx=5, pady=5)
+        ttk.Button(filter_frame, text="تصدير كل السناتر", command=self.export_all_centers).grid(row=0, column=8, padx=5, pady=5)
+
+        # Matrix
+        tree_frame = ttk.Frame(self, padding=(10, 10))
+        tree_frame.pack(fill="both", expand=True)
+        tree_scroll_y = ttk.Scrollbar(tree_frame, orient="vertical")
+        tree_scroll_x = ttk.Scrollbar(tree_frame, orient="horizontal")
+        self.tree = ttk.Treeview(tree_frame, show='headings', yscrollcommand=tree_scroll_y.set, xscrollcommand=tree_scroll_x.set)
+        tree_scroll_y.config(command=self.tree.yview)
+        tree_scroll_x.config(command=self.tree.xview)
+        tree_scroll_y.pack(side="right", fill="y")
+        tree_scroll_x.pack(side="bottom", fill="x")
+        self.tree.pack(fill="both", expand=True)
+        self.tree.tag_configure("footer", font=("Helvetica", 10, "bold"))
+
+        self.status_var = tk.StringVar(value="اختر السنتر والشهر")
+        ttk.Label(self, textvariable=self.status_var, relief="sunken", anchor="w").pack(side="bottom", fill="x")
+
+    def selected_month(self):
+        month = self.month_var.get().strip()
+        try:
+            queries.month_range(month)
+        except ValueError:
+            messagebox.showerror("خطأ", "صيغة الشهر غير صحيحة. استخدم MM-YYYY", parent=self)
+            return None
+        return month
+
+    def load_report(self):
+        center_name = self.center_var.get()
+        month = self.selected_month()
+        if not center_name:
+            messagebox.showwarning("خطأ", "يرجى اختيار السنتر", parent=self)
+            return
+        if month is None:
+            return
+
+        self.status_var.set("جاري إعداد التقرير...")
+        learning_type = self.type_var.get()
+        self.main_app.query_executor.submit(
+            "monthly_report", lambda conn: reports.monthly_report(center_name, month, learning_type, conn=conn),
+            self.show_matrix, self.show_error)
+
+    def show_matrix(self, report):
+        if not self.winfo_exists():
+            return  # Closed while the report was computed
+        self.report = report
+        header = report.header()
+        columns = [f"c{index}" for index in range(len(header))]
+        self.tree.delete(*self.tree.get_children())
+        self.tree.configure(columns=columns)
+        for index, (column, heading) in enumerate(zip(columns, header)):
+            self.tree.heading(column, text=heading, anchor="center")
+            if index == 0:
+                width = 150
+            elif index == 1 or index >= len(header) - 3:
+                width = 100
+            else:
+                width = 35  # One school day
+            self.tree.column(column, anchor="center", width=width, stretch=False)
+
+        for row in report.rows():
+            self.tree.insert("", tk.END, values=row)
+        self.tree.insert("", tk.END, values=report.footer(), tags=("footer",))
+
+        self.status_var.set(f"{len(report.students)} طالب، {len(report.days)} يوم دراسي")
+
+    def show_error(self, error):
+        if not self.winfo_exists():
+            return
+        self.status_var.set("حدث خطأ أثناء إعداد التقرير")
+        messagebox.showerror("خطأ", f"حدث خطأ أثناء إعداد التقرير: {error}", parent=self)
+
+    def export_report(self):
+        """Save the report shown as CSV"""
+        if self.report is None:
+            messagebox.showwarning("خطأ", "اعرض التقرير أولاً", parent=self)
+            return
+        path = filedialog.asksaveasfilename(parent=self, defaultextension=".csv", filetypes=[("CSV files", "*.csv")],
+                                            initialfile=reports.report_file_name(self.report), title="حفظ التقرير")
+        if not path:
+            return
+        try:
+            self.report.write_csv(path)
+        except OSError as e:
+            messagebox.showerror("خطأ", f"تعذر حفظ الملف: {e}", parent=self)
+            return
+        self.status_var.set(f"تم حفظ التقرير في {path}")
+
+    def export_all_centers(self):
+        """Save the report of every center for the month, one CSV per center"""
+        month = self.selected_month()
+        if month is None:
+            return
+        directory = filedialog.askdirectory(parent=self, title="اختر مجلد التقارير")
+        if not directory:
+            return
+
+        self.status_var.set("جاري تصدير التقارير...")
+        self.main_app.job_executor.submit(
+            "monthly_report_export", lambda conn: reports.export_monthly_reports(month, directory, conn=conn),
+            self.show_exported, self.show_error)
+
+    def show_exported(self, paths):
+        if not self.winfo_exists():
+            return
+        self.status_var.set(f"تم تصدير {len(paths)} تقرير")
+        messagebox.showinfo("تم", f"تم تصدير تقارير {len(paths)} سنتر.", parent=self)
+
+
+class MonthlySummaryWindow(tk.Toplevel):
+    """Attendance of every center per month, compared with the same month of the previous year"""
+
+    def __init__(self, parent, main_app):
+        super().__init__(parent)
+        self.main_app = main_app
+        self.rows = None
+        self.title("ملخص السناتر")
+        self.geometry("1000x600")
+        self.resizable(True, True)
+        self.transient(parent)
+
+        self.create_widgets()
+        self.load_summary()
+
+    def create_widgets(self):
+        filter_frame = ttk.Frame(self, padding=(10, 10))
+        filter_frame.pack(fill="x", padx=10, pady=10)
+
+        # Center and type, starting from the reporting tab's filters (every center when empty)
+        ttk.Label(filter_frame, text="اسم السنتر:").grid(row=0, column=0, padx=5, pady=5, sticky="E")
+        self.center_var = tk.StringVar(value=self.main_app.reporting_center_filter.get())
+        ttk.Combobox(filter_frame, textvariable=self.center_var, values=self.main_app.reporting_center_filter['values'],
+                     state="readonly").grid(row=0, column=1, padx=5, pady=5)
+
+        ttk.Label(filter_frame, text="نوع الطالب:").grid(row=0, column=2, padx=5, pady=5, sticky="E")
+        self.type_var = tk.StringVar(value=self.main_app.reporting_type_filter.get())
+        ttk.Combobox(filter_frame, textvariable=self.type_var, values=[""] + attendance_api.LEARNING_TYPES,
+                     state="readonly", width=10).grid(row=0, column=3, padx=5, pady=5)
+
+        ttk.Button(filter_frame, text="عرض", command=self.load_summary).grid(row=0, column=4, padx=5, pady=5)
+        ttk.Button(filter_frame, text="تصدير", command=self.export_summary).grid(row=0, column=5, padx=5, pady=5)
+
+        tree_frame = ttk.Frame(self, padding=(10, 10))
+        tree_frame.pack(fill="both", expand=True)
+        tree_scroll_y = ttk.Scrollbar(tree_frame, orient="vertical")
+        columns = [f"c{index}" for index in range(len(reports.SUMMARY_COLUMNS))]
+        self.tree = ttk.Treeview(tree_frame, columns=columns, show='headings', yscrollcommand=tree_scroll_y.set)
+        tree_scroll_y.config(command=self.tree.yview)
+        tree_scroll_y.pack(side="right", fill="y")
+        self.tree.pack(fill="both", expand=True)
+        for index, (column, heading) in enumerate(zip(columns, reports.SUMMARY_COLUMNS)):
+            self.tree.heading(column, text=heading, anchor="center")
+            self.tree.column(column, anchor="center", width=180 if index == 0 else 110)
+
+        self.status_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.status_var, relief="sunken", anchor="w").pack(side="bottom", fill="x")
+
+    def load_summary(self):
+        center_name, learning_type = self.center_var.get(), self.type_var.get()
+        self.status_var.set("جاري إعداد الملخص...")
+        self.main_app.query_executor.submit(
+            "monthly_summary", lambda conn: reports.center_month_summary(center_name, learning_type, conn=conn),
+            self.show_summary, self.show_error)
+
+    def show_summary(self, rows):
+        if not self.winfo_exists():
+            return  # Closed while the summary was read
+        self.rows = rows
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            self.tree.insert("", tk.END, values=row)
+        self.status_var.set(f"{len(rows)} شهر")
+
+    def show_error(self, error):
+        if not self.winfo_exists():
+            return
+        self.status_var.set("حدث خطأ أثناء إعداد الملخص")
+        messagebox.showerror("خطأ", f"حدث خطأ أثناء إعداد الملخص: {error}", parent=self)
+
+    def export_summary(self):
+        """Save the summary shown as CSV or Excel"""
+        if not self.rows:
+            messagebox.showwarning("خطأ", "لا توجد بيانات للتصدير", parent=self)
+            return
+        rows = self.rows
+        export_to_file(self, self.main_app.job_executor, "monthly_summary_export", "ملخص السناتر",
+                       lambda path, conn, progress: export.write_rows(path, reports.SUMMARY_COLUMNS, [rows], progress))
+
+
+class ExportWindow(tk.Toplevel):
+    """Progress of an export running on an executor's worker, which can be cancelled"""
+
+    def __init__(self, parent, executor, key, path, export_rows):
+        super().__init__(parent)
+        self.executor = executor
+        self.key = key
+        self.path = path
+        self.title("تصدير")
+        self.resizable(False, False)
+        self.transient(parent)
+        # Modal, also over the absent students wizard (whose grab is given back on close)
+        self.previous_grab = self.grab_current()
+        self.grab_set()
+
+        self.status_var = tk.StringVar(value="جاري التصدير...")
+        ttk.Label(self, textvariable=self.status_var, width=40, anchor="center", padding=(20, 15)).pack(fill="x")
+        ttk.Button(self, text="إلغاء", command=self.cancel).pack(pady=(0, 15))
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+
+        executor.submit(key, lambda conn, progress: export_rows(path, conn, progress), self.show_done, self.show_error,
+                        self.show_progress)
+
+    def show_progress(self, rows):
+        self.status_var.set(f"جاري التصدير... {rows} صف")
+
+    def show_done(self, rows):
+        self.close()
+        messagebox.showinfo("نجاح", f"تم تصدير {rows} صف إلى {self.path}", parent=self.master)
+
+    def show_error(self, error):
+        self.close()
+        messagebox.showerror("خطأ", f"تعذر التصدير: {error}", parent=self.master)
+
+    def cancel(self):
+        """Stop the export; the partly written file is removed"""
+        self.executor.cancel(self.key)
+        self.close()
+
+    def close(self):
+        self.grab_release()
+        self.destroy()
+        if self.previous_grab is not None and self.previous_grab.winfo_exists():
+            self.previous_grab.grab_set()
+
+
+def export_to_file(parent, executor, key, name, export_rows):
+    """Ask for a CSV or Excel file and write it with export_rows(path, conn, progress) on the worker"""
+    path = filedialog.asksaveasfilename(parent=parent, defaultextension=".xlsx", initialfile=name, title="تصدير",
+                                        filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")])
+    if path:
+        ExportWindow(parent, executor, key, path, export_rows)
+
+
 def get_serial_number():
     # Run the command to get the serial number
     command = "wmic bios get serialnumber"
@@ -1824,9 +2073,11 @@ def check_authorization():
     return True
 
 if __name__ == "__main__":
+    # The card printer's process pool starts copies of the (frozen) program on Windows
+    multiprocessing.freeze_support()
+
     # First, check authorization
     if check_authorization():
-        create_database()  # Ensure the database is created before starting the app
         root = tk.Tk()
         
         # Show the splash screen
@@ -1834,6 +2085,15 @@ if __name__ == "__main__":
         root.withdraw()  # Hide the main window during the splash screen
         splash.update()
 
+        # Ensure the database is created (and upgraded) before starting the app
+        try:
+            create_database(progress=splash.show_progress)
+        except sqlite3.Error as e:
+            messagebox.showerror("خطأ في قاعدة البيانات", f"تعذر تحديث قاعدة البيانات: {e}\nسيتم استكمال التحديث عند التشغيل التالي.")
+            root.destroy()
+            raise SystemExit(1)
+        splash.finish()
+
         # Wait until the splash screen is closed
         splash.wait_window()
 
@@ -0,0 +1,29 @@
+import re
+
+# Arabic text normalization for the student search index.
+#
+# Names are typed with and without hamza, with ى or ي at the end and with ة
+# or ه, so the indexed text and the searched text are both reduced to one
+# spelling: diacritics and tatweel are removed, the alef forms become ا,
+# alef maqsura becomes ي, taa marbuta becomes ه and Arabic-Indic digits
+# become 0-9.
+
+# Tashkeel (fathatan .. sukun), superscript alef and tatweel
+_DIACRITICS = re.compile("[\u064B-\u0652\u0670\u0640]")
+
+_LETTERS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي",
+    "ة": "ه",
+    **{arabic: str(digit) for digit, arabic in enumerate("٠١٢٣٤٥٦٧٨٩")},
+})
+
+
+def normalize_arabic(text):
+    """text in the spelling stored in the search index (None stays None)"""
+    if text is None:
+        return None
+    text = str(text)
+    if text.isascii():
+        return text.lower()  # Mobiles and barcodes: nothing to normalize
+    return _DIACRITICS.sub("", text).translate(_LETTERS).lower()
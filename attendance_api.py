@@ -0,0 +1,504 @@
+import sys
+import time
+import argparse
+import datetime
+import threading
+import functools
+import queries
+from roster import Roster
+from database import connect, get_connection
+from migrations import create_database, rebuild_attendance_counters, rebuild_monthly_rollups
+
+# Student, center and attendance operations without any Tk code.
+#
+# Every operation takes an optional conn (the calling thread's shared
+# connection by default), so the same functions run on the Tk thread, on the
+# query executor's worker and in scripts. Writes commit on success and roll
+# back before re-raising sqlite3 errors.
+#
+# Each operation counts its calls and the time spent in it; see timing_stats().
+
+LEARNING_TYPES = ["علمي", "ادبي"]
+GRADES = ["اولي", "ثانية", "ثالثة"]
+
+_timings = {}
+_timings_lock = threading.Lock()
+
+
+def timed(function):
+    """Count the calls of function and the time spent in it"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            with _timings_lock:
+                calls, seconds = _timings.get(function.__name__, (0, 0.0))
+                _timings[function.__name__] = (calls + 1, seconds + elapsed)
+    return wrapper
+
+
+def timing_stats():
+    """{operation: (calls, total_seconds)} since the start or the last reset"""
+    with _timings_lock:
+        return dict(_timings)
+
+
+def reset_timing_stats():
+    with _timings_lock:
+        _timings.clear()
+
+
+def print_timing_stats(file=sys.stdout):
+    for name, (calls, seconds) in sorted(timing_stats().items(), key=lambda item: -item[1][1]):
+        print(f"{name:<24} {calls:8d} calls {seconds * 1000:12.1f} ms {seconds / calls * 1000:10.3f} ms/call", file=file)
+
+
+def _write(conn, statements):
+    """Run (query, parameters) statements in one transaction; returns the last cursor"""
+    cursor = conn.cursor()
+    try:
+        for query, parameters in statements:
+            cursor.execute(query, parameters)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return cursor
+
+
+def _today():
+    return datetime.datetime.now().strftime("%Y-%m-%d")
+
+
+def open_database(path=None):
+    """Open a new connection to path (students.db by default), creating or upgrading the schema"""
+    conn = connect(path)
+    create_database(conn)
+    return conn
+
+
+# Students
+
+@timed
+def find_student(barcode, conn=None):
+    """(id, name, mobile, center_name, learning_type, parent_mobile, grade) of the student, or None"""
+    conn = conn or get_connection()
+    return conn.execute(queries.STUDENT_BY_BARCODE_QUERY, (barcode,)).fetchone()
+
+
+@timed
+def barcode_exists(barcode, exclude_student_id=None, conn=None):
+    """Whether another student (other than exclude_student_id) already uses barcode"""
+    conn = conn or get_connection()
+    if exclude_student_id is None:
+        row = conn.execute(queries.BARCODE_EXISTS_QUERY, (barcode,)).fetchone()
+    else:
+        row = conn.execute(queries.BARCODE_EXISTS_FOR_OTHER_QUERY, (barcode, exclude_student_id)).fetchone()
+    return row is not None
+
+
+@timed
+def students(center_name="", learning_type="", grade="", after_id=None, limit=None, conn=None):
+    """Students tab rows matching the filters, by id (limit rows after after_id for one page)"""
+    conn = conn or get_connection()
+    return conn.execute(*queries.students_query(center_name, learning_type, grade, after_id, limit)).fetchall()
+
+
+@timed
+def search_students(text, center_name="", learning_type="", grade="", after_id=None, limit=None, conn=None):
+    """Students tab rows whose name, mobiles or barcode contain words starting with the words of text, by id.
+
+    Arabic spelling variants (hamza, ى/ي, ة/ه, diacritics) match each other.
+    """
+    expression = queries.search_expression(text)
+    if expression is None:
+        return []
+    conn = conn or get_connection()
+    return conn.execute(*queries.search_students_query(expression, center_name, learning_type, grade, after_id,
+                                                       limit)).fetchall()
+
+
+@timed
+def students_by_id(student_ids, conn=None):
+    """Students tab rows of the given students, by id"""
+    if not student_ids:
+        return []
+    conn = conn or get_connection()
+    return conn.execute(*queries.students_by_id_query(student_ids)).fetchall()
+
+
+@timed
+def load_roster(conn=None):
+    """In-memory Roster of every student, for counting and listing the students of a filter"""
+    return Roster.load(conn or get_connection())
+
+
+@timed
+def grades(conn=None):
+    conn = conn or get_connection()
+    return [row[0] for row in conn.execute(queries.GRADES_QUERY)]
+
+
+@timed
+def add_student(name, mobile, center_id, learning_type, parent_mobile, barcode, grade, conn=None):
+    """Insert a student and return the new id (sqlite3.IntegrityError if the barcode is taken)"""
+    conn = conn or get_connection()
+    cursor = _write(conn, [(queries.INSERT_STUDENT_QUERY,
+                            (name, mobile, center_id, learning_type, parent_mobile, barcode, grade))])
+    return cursor.lastrowid
+
+
+def insert_student_rows(cursor, rows, ignore_duplicates=False):
+    """Insert student rows inside the caller's transaction; returns the number inserted.
+
+    The search index is filled for the whole batch in one INSERT ... SELECT
+    instead of by the per-row trigger (four normalize_arabic() calls a student).
+    """
+    query = queries.INSERT_STUDENT_QUERY
+    if ignore_duplicates:
+        query = query.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+    last_id = cursor.execute(queries.LAST_STUDENT_ID_QUERY).fetchone()[0]
+    cursor.execute(queries.DEFER_STUDENT_INDEXING_QUERY)
+    cursor.executemany(query, rows)
+    inserted = cursor.rowcount  # Not counting the rows written by the triggers
+    cursor.execute(queries.RESUME_STUDENT_INDEXING_QUERY)
+    cursor.execute(queries.INDEX_NEW_STUDENTS_QUERY, (last_id,))
+    return inserted
+
+
+@timed
+def add_students(rows, conn=None, ignore_duplicates=False):
+    """Insert (name, mobile, center_id, learning_type, parent_mobile, barcode, grade) rows in one transaction.
+
+    Returns the number of students added; with ignore_duplicates rows whose
+    barcode already exists are skipped instead of failing the whole batch.
+    """
+    conn = conn or get_connection()
+    try:
+        added = insert_student_rows(conn.cursor(), rows, ignore_duplicates)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return added
+
+
+@timed
+def update_student(student_id, name, mobile, center_id, learning_type, parent_mobile, barcode, grade, conn=None):
+    conn = conn or get_connection()
+    _write(conn, [(queries.UPDATE_STUDENT_QUERY,
+                   (name, mobile, center_id, learning_type, parent_mobile, barcode, grade, student_id))])
+
+
+@timed
+def delete_student(student_id, conn=None):
+    conn = conn or get_connection()
+    _write(conn, [(queries.DELETE_STUDENT_QUERY, (student_id,))])
+
+
+# Centers
+
+@timed
+def centers(conn=None):
+    """(id, name, created_date) of every center, newest first"""
+    conn = conn or get_connection()
+    return conn.execute(queries.CENTERS_QUERY).fetchall()
+
+
+@timed
+def center_names(conn=None):
+    """(id, name) of every center, sorted by name"""
+    conn = conn or get_connection()
+    return conn.execute(queries.CENTER_NAMES_QUERY).fetchall()
+
+
+@timed
+def add_center(name, conn=None):
+    """Insert a center and return its id (sqlite3.IntegrityError if the name is taken)"""
+    conn = conn or get_connection()
+    current_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return _write(conn, [(queries.INSERT_CENTER_QUERY, (name, current_date))]).lastrowid
+
+
+@timed
+def add_centers(names, conn=None):
+    """Create the centers that do not exist yet; returns {name: id} for every name"""
+    conn = conn or get_connection()
+    names = set(names)
+    current_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    query = queries.INSERT_CENTER_QUERY.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+    try:
+        conn.executemany(query, ((name, current_date) for name in names))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {name: center_id for center_id, name in conn.execute(queries.CENTER_NAMES_QUERY) if name in names}
+
+
+@timed
+def rename_center(center_id, name, conn=None):
+    conn = conn or get_connection()
+    _write(conn, [(queries.RENAME_CENTER_QUERY, (name, center_id))])
+
+
+@timed
+def delete_center(center_id, conn=None):
+    """Delete a center with its students and their attendance"""
+    conn = conn or get_connection()
+    _write(conn, [(queries.DELETE_CENTER_ATTENDANCE_QUERY, (center_id,)),
+                  (queries.DELETE_CENTER_STUDENTS_QUERY, (center_id,)),
+                  (queries.DELETE_CENTER_QUERY, (center_id,))])
+
+
+# Attendance
+
+@timed
+def mark_present(barcode, date=None, marks="", conn=None):
+    """Record the attendance of the student with barcode on date (today by default).
+
+    Returns (student, attendance_id): student is None for an unknown barcode,
+    attendance_id is None when the student was already present on that date.
+    """
+    conn = conn or get_connection()
+    student = find_student(barcode, conn=conn)
+    if student is None:
+        return None, None
+    return student, mark_student_present(student[0], date, marks, conn=conn)
+
+
+@timed
+def mark_student_present(student_id, date=None, marks="", conn=None):
+    """Record the attendance of a student whose id is already known (e.g. from Roster.find_barcode()).
+
+    Returns the new attendance id, or None when the student was already present on that date.
+    """
+    conn = conn or get_connection()
+    # Ignored if the student is already present on that date
+    cursor = _write(conn, [(queries.MARK_PRESENT_QUERY, (student_id, date or _today(), marks))])
+    return cursor.lastrowid if cursor.rowcount == 1 else None
+
+
+@timed
+def record_attendance(rows, conn=None):
+    """Insert (student_id, date, marks) rows in one transaction; returns the number added.
+
+    Rows for a student already present on that date are skipped.
+    """
+    conn = conn or get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(queries.MARK_PRESENT_QUERY, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return cursor.rowcount  # Not counting the rows written by the triggers
+
+
+@timed
+def record_scans(scans, conn=None):
+    """Insert (student_id, date, marks) scans in one transaction.
+
+    Returns the new attendance id of each scan, None for a student already
+    present on that date (or scanned twice in the batch).
+    """
+    conn = conn or get_connection()
+    cursor = conn.cursor()
+    attendance_ids = []
+    try:
+        for scan in scans:
+            cursor.execute(queries.MARK_PRESENT_QUERY, scan)
+            attendance_ids.append(cursor.lastrowid if cursor.rowcount == 1 else None)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return attendance_ids
+
+
+@timed
+def attendance(date=None, center_name="", learning_type="", grade="", before_id=None, limit=None, after_id=None,
+               conn=None):
+    """Attendance tab rows (all dates when date is None), newest first.
+
+    before_id and limit read one page; after_id only the rows added after that id.
+    """
+    conn = conn or get_connection()
+    return conn.execute(*queries.attendance_query(date, center_name, learning_type, grade, before_id, limit,
+                                                  after_id)).fetchall()
+
+
+@timed
+def last_attendance_id(conn=None):
+    """Highest attendance id (0 without attendance)"""
+    conn = conn or get_connection()
+    return conn.execute(queries.LAST_ATTENDANCE_ID_QUERY).fetchone()[0]
+
+
+@timed
+def set_marks(attendance_id, marks, conn=None):
+    conn = conn or get_connection()
+    _write(conn, [(queries.UPDATE_MARKS_QUERY, (marks, attendance_id))])
+
+
+@timed
+def delete_attendance(attendance_id, conn=None):
+    conn = conn or get_connection()
+    _write(conn, [(queries.DELETE_ATTENDANCE_QUERY, (attendance_id,))])
+
+
+@timed
+def stats(date=None, center_name="", learning_type="", grade="", roster=None, conn=None):
+    """(total_students, present_students, total_unfiltered) on date (today by default).
+
+    With a roster the student totals are counted from it and only the present students are queried.
+    """
+    conn = conn or get_connection()
+    if roster is None:
+        return queries.attendance_counts(conn, date or _today(), center_name, learning_type, grade)
+
+    present_students = conn.execute(*queries.present_students_query(date or _today(), center_name, learning_type,
+                                                                    grade)).fetchone()[0]
+    total_unfiltered = roster.count() if center_name or learning_type or grade else 0
+    return roster.count(center_name, learning_type, grade), present_students, total_unfiltered
+
+
+@timed
+def rebuild_counters(conn=None):
+    """Derive the statistics counters again from attendance and students.
+
+    Returns the number of counter rows that were wrong (0 when the triggers kept them exact).
+    """
+    conn = conn or get_connection()
+
+    def counters():
+        return (set(conn.execute("SELECT * FROM daily_attendance_counts WHERE present != 0")) |
+                set(conn.execute("SELECT 'students', * FROM roster_counts WHERE students != 0")))
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")  # No scan may slip in between the two reads
+        before = counters()
+        rebuild_attendance_counters(conn.cursor())
+        after = counters()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    # A wrong row is in both sets (stored and derived value), count it once
+    return len({row[:-1] for row in before ^ after})
+
+
+@timed
+def rebuild_rollups(conn=None):
+    """Derive the monthly rollups again from attendance and students.
+
+    Returns the number of rollup rows that were wrong (0 when the triggers kept them exact).
+    """
+    conn = conn or get_connection()
+
+    # Marks are summed as REAL: adding and removing them again leaves rounding noise
+    def rollups():
+        return (set(conn.execute("""SELECT 'student', student_id, month, days_present, first_date, last_date,
+                                           ROUND(marks_sum, 6), marks_count
+                                    FROM monthly_student_attendance""")) |
+                set(conn.execute("""SELECT 'group', center_id, learning_type, grade, month, students, days_present,
+                                           ROUND(marks_sum, 6), marks_count
+                                    FROM monthly_group_attendance""")))
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")  # No scan may slip in between the two reads
+        before = rollups()
+        rebuild_monthly_rollups(conn.cursor())
+        after = rollups()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    # A wrong row is in both sets, count it once by its key
+    return len({row[:3] if row[0] == 'student' else row[:5] for row in before ^ after})
+
+
+@timed
+def absentees(date=None, name="", center_name="", learning_type="", after=None, limit=None, conn=None):
+    """(id, name, mobile, center_name, learning_type, parent_mobile, grade) of the students without
+    attendance on date (today by default), sorted by name (limit rows after the (name, id) after for one page)"""
+    conn = conn or get_connection()
+    return conn.execute(*queries.absent_students_query(date or _today(), name, center_name, learning_type,
+                                                       after, limit)).fetchall()
+
+
+@timed
+def absentees_count(date=None, name="", center_name="", learning_type="", conn=None):
+    conn = conn or get_connection()
+    return conn.execute(*queries.absent_students_count_query(date or _today(), name, center_name,
+                                                             learning_type)).fetchone()[0]
+
+
+@timed
+def report(barcode, month="", center_name="", learning_type="", before_id=None, limit=None, conn=None):
+    """Attendance history of one student, optionally for one 'MM-YYYY' month, newest first.
+
+    Rows start with the attendance id (limit rows before before_id for one page).
+    """
+    conn = conn or get_connection()
+    return conn.execute(*queries.report_query(barcode, month, center_name, learning_type, before_id, limit)).fetchall()
+
+
+@timed
+def report_count(barcode, month="", center_name="", learning_type="", conn=None):
+    conn = conn or get_connection()
+    return conn.execute(*queries.report_count_query(barcode, month, center_name, learning_type)).fetchone()[0]
+
+
+@timed
+def report_months(conn=None):
+    """'MM-YYYY' months with attendance, newest first"""
+    return queries.available_months(conn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the attendance database without the window")
+    parser.add_argument("--db", help="Database file (default: students.db next to the app)")
+    parser.add_argument("--timings", action="store_true", help="Print the time spent in each operation")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats_parser = commands.add_parser("stats", help="Total, present and absent students on a date")
+    absentees_parser = commands.add_parser("absentees", help="Students absent on a date")
+    for command in (stats_parser, absentees_parser):
+        command.add_argument("--date", help="YYYY-MM-DD (default: today)")
+        command.add_argument("--center", default="")
+        command.add_argument("--type", default="", choices=[""] + LEARNING_TYPES)
+    stats_parser.add_argument("--grade", default="")
+    absentees_parser.add_argument("--name", default="")
+    mark_parser = commands.add_parser("mark", help="Record the attendance of a barcode")
+    mark_parser.add_argument("barcode")
+    mark_parser.add_argument("--date", help="YYYY-MM-DD (default: today)")
+    commands.add_parser("rebuild-counters", help="Recount the statistics counters from the attendance")
+    commands.add_parser("rebuild-rollups", help="Sum up the monthly rollups again from the attendance")
+    args = parser.parse_args()
+
+    conn = open_database(args.db)
+    if args.command == "stats":
+        total, present, _ = stats(args.date, args.center, args.type, args.grade, conn=conn)
+        print(f"Students: {total}  Present: {present}  Absent: {total - present}")
+    elif args.command == "absentees":
+        for _, name, mobile, center_name, learning_type, parent_mobile, grade in absentees(
+                args.date, args.name, args.center, args.type, conn=conn):
+            print(f"{name}\t{mobile}\t{center_name}\t{learning_type}\t{parent_mobile}\t{grade}")
+    elif args.command == "mark":
+        student, attendance_id = mark_present(args.barcode, args.date, conn=conn)
+        if student is None:
+            print(f"Unknown barcode: {args.barcode}")
+            sys.exit(1)
+        print(f"{student[1]}: " + ("marked present" if attendance_id else "already present"))
+    elif args.command == "rebuild-counters":
+        print(f"Counters rebuilt, {rebuild_counters(conn=conn)} rows corrected")
+    elif args.command == "rebuild-rollups":
+        print(f"Monthly rollups rebuilt, {rebuild_rollups(conn=conn)} rows corrected")
+
+    if args.timings:
+        print_timing_stats(sys.stderr)
@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import sqlite3
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+import attendance_api
+import cards
+import reports
+import export
+import importer
+from qr_cache import QRCache
+from database import app_dir, connect
+from virtual_grid import PAGE_ROWS
+from absence import AbsenceIndex, AbsenceSearch, ABSENT_ON_DATE, ABSENT_AT_LEAST, ABSENCE_STREAK
+from add_dummy_data import add_dummy_data
+from add_attendance_data import add_attendance_data
+
+# Headless benchmark of the attendance_api operations behind the Tk handlers.
+#
+# Each database size is generated once with the seeded test data generators
+# and kept in DATA_DIR; the results are written as JSON to RESULTS_DIR so runs
+# from different commits can be compared with --compare.
+
+DATA_DIR = os.path.join(app_dir, "benchmark_data")
+RESULTS_DIR = os.path.join(app_dir, "benchmark_results")
+
+# Attendance rows of each generated database
+SIZES = {"10k": 10000, "100k": 100000, "1m": 1000000}
+
+# Generated databases hold a school year of attendance
+START_MONTH = "2023-09"
+MONTHS = 12
+ATTENDANCE_RATE = 0.8
+WORKING_DAYS_PER_MONTH = 21.7
+
+
+def database_path(size, seed):
+    return os.path.join(DATA_DIR, f"bench_{size}_seed{seed}.db")
+
+
+def generate_database(path, attendance_rows, seed, workers=1):
+    """Create a database with about attendance_rows attendance records"""
+    if os.path.exists(path):
+        os.remove(path)
+    students = max(50, attendance_rows // 200)
+    months = math.ceil(attendance_rows / (students * ATTENDANCE_RATE * WORKING_DAYS_PER_MONTH))
+
+    conn = attendance_api.open_database(path)
+    add_dummy_data(students, 12, seed, conn, verbose=False)
+    add_attendance_data(START_MONTH, months, ATTENDANCE_RATE, seed, workers, conn, verbose=False)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def benchmark_cases(conn, seed):
+    """(name, run) pairs; run(conn) executes one handler's query path and returns the rows handled.
+
+    "Today" is the last date that has attendance, so the date filtered queries
+    see a full day of scans.
+    """
+    cursor = conn.cursor()
+    today = cursor.execute("SELECT MAX(date) FROM attendance").fetchone()[0]
+    month = f"{today[5:7]}-{today[:4]}"
+    center, learning_type, grade = cursor.execute(
+        """SELECT centers.name, students.learning_type, students.grade
+           FROM students JOIN centers ON students.center_id = centers.id
+           GROUP BY students.center_id, students.learning_type, students.grade
+           ORDER BY COUNT(*) DESC LIMIT 1""").fetchone()
+    barcodes = [row[0] for row in cursor.execute("SELECT barcode FROM students ORDER BY id")]
+    random.Random(seed).shuffle(barcodes)
+    report_barcodes = iter(barcodes * 1000)
+
+    # Scans are recorded on the day after the generated data and removed again
+    scan_date = (datetime.datetime.strptime(today, "%Y-%m-%d") + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+    scan_barcodes = iter(barcodes * 1000)
+
+    def add_attendance(conn, barcode):
+        attendance_api.mark_present(barcode, scan_date, conn=conn)
+        return 1
+
+    # The window looks barcodes up in the in-memory roster and only inserts the attendance
+    roster = attendance_api.load_roster(conn)
+
+    def scan(conn, barcode):
+        student_id, _ = roster.find_barcode(barcode)
+        attendance_api.mark_student_present(student_id, scan_date, conn=conn)
+        return 1
+
+    def attendance_statistics(conn, *filters):
+        attendance_api.stats(today, *filters, conn=conn)
+        return 1
+
+    # The views read a page at a time; "deep" pages start in the middle of the result
+    middle_student_id, middle_attendance_id, last_attendance_id = cursor.execute(
+        "SELECT (SELECT MAX(id) FROM students) / 2, (SELECT MAX(id) FROM attendance) / 2, "
+        "(SELECT MAX(id) FROM attendance)").fetchone()
+
+    def report(conn, *filters):
+        barcode = next(report_barcodes)
+        attendance_api.report_count(barcode, *filters, conn=conn)
+        return len(attendance_api.report(barcode, *filters, limit=PAGE_ROWS, conn=conn))
+
+    def absentees(conn, *filters):
+        attendance_api.absentees_count(today, *filters, conn=conn)
+        return len(attendance_api.absentees(today, *filters, limit=PAGE_ROWS, conn=conn))
+
+    # A batch of QR cards (4 A4 pages), rows are cards
+    card_students = cards.card_students(center, conn=conn)[:4 * cards.CARD_COLUMNS * cards.CARD_ROWS]
+    cards_path = os.path.join(tempfile.gettempdir(), "benchmark_cards.pdf")
+    export_path = os.path.join(tempfile.gettempdir(), "benchmark_export")
+    qr_cache = QRCache(tempfile.mkdtemp(prefix="benchmark_qr_cache"))
+
+    # One importer chunk of new students (without barcodes, so every run imports all of them); removed again
+    import_path = os.path.join(tempfile.gettempdir(), "benchmark_import.csv")
+    with open(import_path, "w", newline="", encoding="utf-8") as file:
+        file.write("name,mobile,center,learning_type,parent_mobile,grade\n")
+        for index in range(importer.CHUNK_ROWS):
+            file.write(f"طالب مستورد {index},010{index:08d},{center},{learning_type},011{index:08d},{grade}\n")
+    no_qr_cache = QRCache(qr_cache.directory, max_disk_bytes=0, max_memory_bytes=0)
+
+    # The wizard's absence questions over the presence bitmaps (kept by the window between searches)
+    absence_index = AbsenceIndex(roster)
+    four_weeks_ago = (datetime.datetime.strptime(today, "%Y-%m-%d") - datetime.timedelta(days=27)).strftime("%Y-%m-%d")
+
+    def absence(conn, mode, start=today, min_days=1):
+        search = AbsenceSearch(absence_index, mode, start, today, min_days)
+        search.count(conn)
+        return len(search.page(conn, None, PAGE_ROWS))
+
+    return [
+        ("load_students: first page", lambda conn: len(attendance_api.students(limit=PAGE_ROWS, conn=conn))),
+        ("load_students: deep page",
+         lambda conn: len(attendance_api.students(after_id=middle_student_id, limit=PAGE_ROWS, conn=conn))),
+        ("load_students: by center", lambda conn: len(attendance_api.students(center, limit=PAGE_ROWS, conn=conn))),
+        ("load_students: by center/type/grade",
+         lambda conn: len(attendance_api.students(center, learning_type, grade, limit=PAGE_ROWS, conn=conn))),
+        ("search_students: name", lambda conn: len(attendance_api.search_students("أحمد محم", limit=PAGE_ROWS, conn=conn))),
+        ("search_students: mobile prefix", lambda conn: len(attendance_api.search_students("0101", limit=PAGE_ROWS, conn=conn))),
+        ("load_students: all rows", lambda conn: len(attendance_api.students(conn=conn))),
+        ("load_attendance: first page", lambda conn: len(attendance_api.attendance(limit=PAGE_ROWS, conn=conn))),
+        ("load_attendance: deep page",
+         lambda conn: len(attendance_api.attendance(before_id=middle_attendance_id, limit=PAGE_ROWS, conn=conn))),
+        ("load_attendance: today", lambda conn: len(attendance_api.attendance(today, limit=PAGE_ROWS, conn=conn))),
+        ("load_attendance: today by center/type/grade",
+         lambda conn: len(attendance_api.attendance(today, center, learning_type, grade, limit=PAGE_ROWS, conn=conn))),
+        ("load_attendance: new rows since watermark",
+         lambda conn: len(attendance_api.attendance(today, center, learning_type, grade, limit=PAGE_ROWS + 1,
+                                                    after_id=last_attendance_id - 1000, conn=conn))),
+        ("load_attendance: all rows", lambda conn: len(attendance_api.attendance(conn=conn))),
+        ("update_attendance_statistics", lambda conn: attendance_statistics(conn)),
+        ("update_attendance_statistics: by center/type/grade",
+         lambda conn: attendance_statistics(conn, center, learning_type, grade)),
+        ("add_attendance: first scan", lambda conn: add_attendance(conn, next(scan_barcodes))),
+        ("add_attendance: repeated scan", lambda conn: add_attendance(conn, barcodes[0])),
+        ("add_attendance: first scan (roster)", lambda conn: scan(conn, next(scan_barcodes))),
+        ("auto_confirm_attendance: barcode check (roster)", lambda conn: int(roster.barcode_exists(barcodes[1]))),
+        ("filter_by_barcode", lambda conn: report(conn)),
+        ("filter_by_barcode: month", lambda conn: report(conn, month)),
+        ("search_absent_students", lambda conn: absentees(conn)),
+        ("search_absent_students: by name", lambda conn: absentees(conn, "محمد")),
+        ("search_absent_students: by center/type", lambda conn: absentees(conn, "", center, learning_type)),
+        ("print_student_cards", lambda conn: cards.write_card_sheets(card_students, cards_path, cache=no_qr_cache)[0]),
+        ("print_student_cards: raster QR codes",
+         lambda conn: cards.write_card_sheets(card_students, cards_path, cache=no_qr_cache, rendering="raster")[0]),
+        ("print_student_cards: cached QR codes",
+         lambda conn: cards.write_card_sheets(card_students, cards_path, cache=qr_cache)[0]),
+        ("import_students: one chunk", lambda conn: importer.import_students(import_path, conn)[0]),
+        ("export_attendance: all rows to CSV", lambda conn: export.export_attendance(export_path + ".csv", conn=conn)),
+        ("export_attendance: today to XLSX", lambda conn: export.export_attendance(export_path + ".xlsx", today, conn=conn)),
+        ("monthly_report: center", lambda conn: len(reports.monthly_report(center, month, conn=conn).students)),
+        ("monthly_report: every center", lambda conn: len(reports.monthly_reports(month, conn=conn))),
+        ("monthly_summary: every center", lambda conn: len(reports.center_month_summary(conn=conn))),
+        ("monthly_summary: center", lambda conn: len(reports.center_month_summary(center, conn=conn))),
+        ("search_absent_students: bitsets", lambda conn: absence(conn, ABSENT_ON_DATE)),
+        ("search_absent_students: at least 5 of 4 weeks (bitsets)",
+         lambda conn: absence(conn, ABSENT_AT_LEAST, four_weeks_ago, 5)),
+        ("search_absent_students: 3 day streak (bitsets)", lambda conn: absence(conn, ABSENCE_STREAK, today, 3)),
+    ], scan_date
+
+
+def run_case(conn, run, repeat, warmup):
+    """Time repeat calls of run(conn); returns the result dictionary of one case"""
+    for _ in range(warmup):
+        run(conn)
+
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows += run(conn)
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    total = sum(timings)
+    return {
+        "runs": repeat,
+        "rows_per_run": rows / repeat,
+        "mean_ms": total / repeat * 1000,
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "max_ms": timings[-1] * 1000,
+        "rows_per_second": rows / total if total else 0,
+    }
+
+
+def benchmark_database(path, seed, repeat, warmup, only=None):
+    conn = connect(path)
+    last_student_id = conn.execute("SELECT MAX(id) FROM students").fetchone()[0]
+    cases, scan_date = benchmark_cases(conn, seed)
+    results = {}
+    try:
+        for name, run in cases:
+            if only and only not in name:
+                continue
+            results[name] = run_case(conn, run, repeat, warmup)
+            print(f"  {name:<52} p50 {results[name]['p50_ms']:9.3f} ms   p95 {results[name]['p95_ms']:9.3f} ms   "
+                  f"p99 {results[name]['p99_ms']:9.3f} ms   {results[name]['rows_per_second']:12.0f} rows/s")
+    finally:
+        # Remove the scans recorded by the add_attendance cases and the students of the import case
+        conn.execute("DELETE FROM attendance WHERE date = ?", (scan_date,))
+        conn.execute("DELETE FROM students WHERE id > ?", (last_student_id,))
+        conn.commit()
+        conn.close()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=app_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(previous, current):
+    """Print the p50/p95 change of every case present in both result files"""
+    print(f"\nCompared with {previous['commit']} ({previous['timestamp']}):")
+    for size, cases in current["results"].items():
+        for name, result in cases.items():
+            old = previous["results"].get(size, {}).get(name)
+            if not old:
+                continue
+            changes = []
+            for key in ("p50_ms", "p95_ms"):
+                change = (result[key] - old[key]) / old[key] * 100 if old[key] else 0
+                changes.append(f"{key[:3]} {old[key]:9.3f} -> {result[key]:9.3f} ms ({change:+6.1f}%)")
+            print(f"  {size:>4} {name:<52} " + "   ".join(changes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the application's query paths without a display")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES),
+                        help="Database sizes in attendance rows (default: all)")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per case (default: 20)")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed runs per case (default: 2)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the generated databases (default: 1)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes generating attendance (default: 1)")
+    parser.add_argument("--regenerate", action="store_true", help="Generate the databases again")
+    parser.add_argument("--only", help="Only run the cases whose name contains this text")
+    parser.add_argument("--output", help="JSON result file (default: benchmark_results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Earlier JSON result file to compare with")
+    args = parser.parse_args()
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": {},
+    }
+
+    for size in args.sizes:
+        path = database_path(size, args.seed)
+        if args.regenerate or not os.path.exists(path):
+            print(f"Generating the {size} database...")
+            generate_database(path, SIZES[size], args.seed, args.workers)
+        else:
+            # Databases generated by an older schema are upgraded first
+            attendance_api.open_database(path).close()
+
+        conn = connect(path)
+        attendance_rows = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+        student_count = conn.execute("SELECT COUNT(*) FROM students").fetchone()[0]
+        conn.close()
+        print(f"\n{size}: {attendance_rows} attendance rows, {student_count} students")
+        report["results"][size] = benchmark_database(path, args.seed, args.repeat, args.warmup, args.only)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{report['commit']}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as result_file:
+        json.dump(report, result_file, ensure_ascii=False, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        try:
+            with open(args.compare, encoding="utf-8") as previous_file:
+                compare(json.load(previous_file), report)
+        except (OSError, ValueError) as e:
+            print(f"Cannot compare with {args.compare}: {e}")
+            sys.exit(1)
@@ -0,0 +1,230 @@
+import io
+import os
+import re
+import time
+import tempfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import qrcode
+from fpdf import FPDF
+from fpdf.drawing import PaintedPath, Transform
+from fpdf.errors import FPDFException
+import queries
+from database import connect, get_connection
+from qr_cache import QRCache, default_cache
+
+# Student cards (name, mobile, barcode and the barcode's QR code) laid out
+# CARD_COLUMNS x CARD_ROWS on A4 pages of one PDF.
+#
+# The QR codes come from the QR cache (qr_cache.py); the ones it does not
+# hold yet are rendered on a process pool, the slow part of a batch.
+#
+# Two renderings: "vector" draws the QR modules as filled rectangles (the
+# dark modules of a row merged into runs), sharp at any size and a few
+# hundred bytes per card; "raster" places a PNG image of the code as the
+# single card always did.
+
+CARD_COLUMNS = 2
+CARD_ROWS = 5
+
+# A4 in millimetres
+PAGE_WIDTH = 210
+PAGE_HEIGHT = 297
+PAGE_MARGIN = 10
+CARD_PADDING = 3
+
+# Fonts with Arabic letters for the names (the first one found is used); the
+# cards are printed without names when none is installed
+CARD_FONTS = [
+    r"C:\Windows\Fonts\arial.ttf",
+    r"C:\Windows\Fonts\tahoma.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+]
+
+# Render parameters of the card QR codes (part of the cache key)
+QR_PARAMETERS = {"version": 1, "box_size": 10, "border": 5, "format": "PNG"}
+QR_MODULE_PARAMETERS = {"version": 1, "border": 5, "format": "modules"}
+
+RENDERINGS = ("vector", "raster")
+
+# A run of dark modules in a row of render_qr_modules() bytes
+_DARK_RUN = re.compile(b"\x01+")
+
+# Fewer cards than this are rendered in this process (starting the pool costs more)
+MIN_POOL_CARDS = 50
+
+# QR images handed to a pool worker at a time
+RENDER_CHUNK = 32
+
+
+def render_qr_png(barcode):
+    """PNG bytes of the QR code of barcode"""
+    qr = qrcode.QRCode(version=QR_PARAMETERS["version"], box_size=QR_PARAMETERS["box_size"],
+                       border=QR_PARAMETERS["border"])
+    qr.add_data(barcode)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill='black', back_color='white').save(buffer, QR_PARAMETERS["format"])
+    return buffer.getvalue()
+
+
+def render_qr_modules(barcode):
+    """The QR code of barcode as one byte (1 dark, 0 light) per module, row by row, border included"""
+    qr = qrcode.QRCode(version=QR_MODULE_PARAMETERS["version"], border=QR_MODULE_PARAMETERS["border"])
+    qr.add_data(barcode)
+    qr.make(fit=True)
+    return bytes(module for row in qr.get_matrix() for module in row)
+
+
+def draw_qr_modules(pdf, modules, x, y, size):
+    """Draw render_qr_modules() bytes as a size x size square of filled rectangles at (x, y).
+
+    The rectangles form one path, filled once, drawn in module units (small
+    integers in the page content) and scaled into place.
+    """
+    count = int(len(modules) ** 0.5)
+    path = PaintedPath()
+    path.style.fill_color = "#000000"
+    path.style.stroke_color = None
+    path.transform = Transform.scaling(size / count).translate(x, y)
+    for row in range(count):
+        line = modules[row * count:(row + 1) * count]
+        for run in _DARK_RUN.finditer(line):
+            path.rectangle(run.start(), row, run.end() - run.start(), 1)
+    with pdf.drawing_context() as context:
+        context.add_item(path, clone=False)  # new_path() deep-copies the path, most of the drawing time
+
+
+def qr_png(barcode, cache=None):
+    """PNG bytes of the QR code of barcode, from the QR cache (the default one when cache is None)"""
+    return (cache or default_cache()).get(barcode, QR_PARAMETERS, render_qr_png)
+
+
+def render_qr_images(barcodes, workers=None, render=render_qr_png):
+    """render(barcode) of every barcode, in order, on workers processes (all CPUs by default)"""
+    if len(barcodes) < MIN_POOL_CARDS or workers == 1:
+        return [render(barcode) for barcode in barcodes]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(render, barcodes, chunksize=RENDER_CHUNK))
+
+
+def _card_font(pdf):
+    """Name of the font to print names with, or None"""
+    for path in CARD_FONTS:
+        if os.path.exists(path):
+            pdf.add_font("card", "", path)
+            try:
+                pdf.set_text_shaping(True)  # Joined, right-to-left Arabic (needs uharfbuzz)
+            except FPDFException:
+                pass
+            return "card"
+    return None
+
+
+def write_card_sheets(students, path, workers=None, cache=None, rendering="vector", columns=CARD_COLUMNS,
+                      rows=CARD_ROWS):
+    """Write the cards of students ((name, mobile, barcode) rows) to the PDF path.
+
+    rendering is one of RENDERINGS. The QR codes come from cache (the
+    default QR cache when None). Returns
+    (cards, seconds, cached) for the whole batch, QR rendering included, where
+    cached is the number of images the cache already held (nothing is written
+    without students).
+    """
+    if not students:
+        return 0, 0.0, 0
+    started = time.perf_counter()
+    if rendering == "vector":
+        parameters, render = QR_MODULE_PARAMETERS, render_qr_modules
+    else:
+        parameters, render = QR_PARAMETERS, render_qr_png
+    rendered = []
+
+    def render_missing(barcodes):
+        rendered.extend(barcodes)
+        return render_qr_images(barcodes, workers, render)
+
+    images = (cache or default_cache()).get_many([barcode for _, _, barcode in students], parameters, render_missing)
+    cached = len(students) - len(rendered)
+
+    pdf = FPDF(unit="mm", format="A4")
+    pdf.set_auto_page_break(False)
+    name_font = _card_font(pdf)
+
+    card_width = (PAGE_WIDTH - 2 * PAGE_MARGIN) / columns
+    card_height = (PAGE_HEIGHT - 2 * PAGE_MARGIN) / rows
+    qr_size = card_height - 2 * CARD_PADDING
+    text_x = qr_size + 2 * CARD_PADDING
+    text_width = card_width - text_x - CARD_PADDING
+
+    for index, ((name, mobile, barcode), image) in enumerate(zip(students, images)):
+        slot = index % (columns * rows)
+        if slot == 0:
+            pdf.add_page()
+        x = PAGE_MARGIN + (slot % columns) * card_width
+        y = PAGE_MARGIN + (slot // columns) * card_height
+
+        # Cutting border, QR code on the left, text on the right
+        pdf.rect(x, y, card_width, card_height)
+        if rendering == "vector":
+            draw_qr_modules(pdf, image, x + CARD_PADDING, y + CARD_PADDING, qr_size)
+        else:
+            pdf.image(io.BytesIO(image), x=x + CARD_PADDING, y=y + CARD_PADDING, w=qr_size, h=qr_size)
+        pdf.set_xy(x + text_x, y + card_height / 2 - 12)
+        if name_font:
+            pdf.set_font(name_font, "", 12)
+            pdf.cell(text_width, 8, name or "", align="C", new_x="LEFT", new_y="NEXT")
+        pdf.set_font("Helvetica", "", 10)
+        pdf.cell(text_width, 8, f"Mobile: {mobile or ''}", align="C", new_x="LEFT", new_y="NEXT")
+        pdf.set_font("Helvetica", "B", 10)
+        pdf.cell(text_width, 8, f"Barcode: {barcode}", align="C")
+
+    pdf.output(path)
+    return len(students), time.perf_counter() - started, cached
+
+
+def compare_renderings(students, workers=None):
+    """{rendering: (seconds, PDF bytes)} of the same cards in each rendering, QR codes rendered from scratch"""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        # An empty cache that keeps nothing, so both renderings pay for the QR codes
+        cache = QRCache(directory, max_disk_bytes=0, max_memory_bytes=0)
+        for rendering in RENDERINGS:
+            path = os.path.join(directory, f"{rendering}.pdf")
+            _, seconds, _ = write_card_sheets(students, path, workers, cache, rendering)
+            results[rendering] = (seconds, os.path.getsize(path))
+    return results
+
+
+def card_students(center_name="", learning_type="", grade="", student_ids=None, conn=None):
+    """(name, mobile, barcode) of the students of a filter, or of student_ids when given, by name"""
+    conn = conn or get_connection()
+    if student_ids is not None:
+        if not student_ids:
+            return []
+        return conn.execute(*queries.card_students_by_id_query(student_ids)).fetchall()
+    return conn.execute(*queries.card_students_query(center_name, learning_type, grade)).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the QR cards of a center's students into one PDF")
+    parser.add_argument("output", help="PDF file to write")
+    parser.add_argument("--db", help="Database file (default: students.db next to the app)")
+    parser.add_argument("--center", default="")
+    parser.add_argument("--type", default="")
+    parser.add_argument("--grade", default="")
+    parser.add_argument("--workers", type=int, help="QR rendering processes (default: one per CPU)")
+    parser.add_argument("--rendering", choices=RENDERINGS, default="vector", help="QR codes as vector rectangles or images")
+    parser.add_argument("--compare", action="store_true", help="Time both renderings and compare the PDF sizes instead")
+    args = parser.parse_args()
+
+    students = card_students(args.center, args.type, args.grade, conn=connect(args.db))
+    if args.compare:
+        for rendering, (seconds, size) in compare_renderings(students, args.workers).items():
+            print(f"{rendering:<7} {len(students) / seconds if seconds else 0:8.0f} cards/s {size / 1024:10.0f} KiB")
+        raise SystemExit(0)
+    cards, seconds, cached = write_card_sheets(students, args.output, args.workers, rendering=args.rendering)
+    print(f"{cards} cards in {seconds:.2f} s ({cards / seconds if seconds else 0:.0f} cards/s), "
+          f"{cached} QR codes from the cache")
+    print("QR cache: " + ", ".join(f"{name} {value}" for name, value in default_cache().stats().items()))
@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import threading
+import atexit
+from arabic import normalize_arabic
+
+# Get the directory where the script is running
+app_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Define the database file path in the same directory
+db_path = os.path.join(app_dir, 'students.db')
+
+# Connection tuning applied to every connection we open
+CACHE_SIZE_KIB = 64 * 1024            # 64 MB page cache per connection
+MMAP_SIZE = 256 * 1024 * 1024         # Map up to 256 MB of the file into memory
+BUSY_TIMEOUT_MS = 5000                # Wait up to 5 seconds for a lock held by another connection
+STATEMENT_CACHE_SIZE = 256            # Prepared statements kept per connection
+
+# One long-lived connection per (thread, database path)
+_local = threading.local()
+_all_connections = []
+_all_connections_lock = threading.Lock()
+
+
+def connect(path=None):
+    """Open a new tuned connection to the database"""
+    conn = sqlite3.connect(path or db_path, timeout=BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    # Used by the triggers that keep the student search index up to date
+    conn.create_function("normalize_arabic", 1, normalize_arabic, deterministic=True)
+    return conn
+
+
+def get_connection(path=None):
+    """Return the shared connection of the calling thread, opening it on first use"""
+    path = path or db_path
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = connect(path)
+        with _all_connections_lock:
+            _all_connections.append(conn)
+    return conn
+
+
+def close_connection(path=None):
+    """Close the shared connection of the calling thread (if it is open)"""
+    connections = getattr(_local, 'connections', {})
+    conn = connections.pop(path or db_path, None)
+    if conn is not None:
+        with _all_connections_lock:
+            if conn in _all_connections:
+                _all_connections.remove(conn)
+        conn.close()
+
+
+@atexit.register
+def _close_all_connections():
+    """Close every shared connection when the process exits so the WAL gets checkpointed"""
+    with _all_connections_lock:
+        connections = list(_all_connections)
+        _all_connections.clear()
+    for conn in connections:
+        try:
+            # Let SQLite refresh planner statistics that drifted during the session
+            conn.execute("PRAGMA optimize")
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def analyze(conn=None):
+    """Refresh the query planner statistics"""
+    conn = conn or get_connection()
+    conn.execute("ANALYZE")
+    conn.commit()
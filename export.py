@@ -0,0 +1,272 @@
+import os
+import csv
+import sys
+import argparse
+import datetime
+import itertools
+import queries
+from database import connect, get_connection
+from migrations import create_database
+
+# Export of the rows of a view (students, attendance, a student's report,
+# absentees) to CSV or XLSX.
+#
+# The view's query is run again without a page LIMIT and read FETCH_ROWS at a
+# time with fetchmany(); each chunk is written before the next one is read,
+# so memory use does not grow with the number of rows. XLSX files are written
+# with openpyxl's write-only workbook, which streams the rows to disk too.
+#
+# The file is written under a temporary name and renamed at the end, so a
+# failed or cancelled export never leaves a truncated file behind.
+
+FETCH_ROWS = 5000
+
+# Rows of an Excel sheet (the header included); longer exports continue on a new sheet
+XLSX_MAX_ROWS = 1048576
+
+EXPORT_FORMATS = (".csv", ".xlsx")
+
+# Column headings of each view (the rows' leading id is not exported, except for students)
+STUDENT_COLUMNS = ["الرقم", "الاسم", "رقم الجوال", "اسم السنتر", "نوع الطالب", "رقم جوال ولي الامر", "الرمز الشريطي", "الصف"]
+ATTENDANCE_COLUMNS = ["الاسم", "رقم الجوال", "اسم السنتر", "نوع الطالب", "رقم جوال ولي الامر", "الصف", "التاريخ", "الدرجات"]
+REPORT_COLUMNS = ATTENDANCE_COLUMNS
+ABSENTEE_COLUMNS = ["الاسم", "رقم الجوال", "اسم السنتر", "نوع الطالب", "رقم جوال ولي الامر", "الصف", "أيام الغياب"]
+
+# Incremental export rows (English names, like the importer's columns): change is insert, update or delete
+CHANGE_COLUMNS = ["change", "attendance_id", "student_id", "barcode", "name", "center", "learning_type", "grade", "date",
+                  "marks"]
+
+
+def query_chunks(conn, query, parameters=(), size=FETCH_ROWS):
+    """Yield the rows of query size at a time"""
+    cursor = conn.execute(query, parameters)
+    try:
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def page_chunks(conn, fetch_page, key, size=FETCH_ROWS):
+    """Yield the rows of a VirtualGrid fetch_page(conn, after_key, limit) size at a time"""
+    after = None
+    while True:
+        rows = fetch_page(conn, after, size)
+        if not rows:
+            break
+        yield rows
+        after = key(rows[-1])
+
+
+def write_rows(path, header, chunks, progress=None):
+    """Write header and the rows of chunks to path (CSV or XLSX by its extension); returns the rows written.
+
+    progress(rows_written) is called after every chunk.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {extension or path}")
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if extension == ".xlsx":
+            written = _write_xlsx(temporary_path, header, chunks, progress)
+        else:
+            written = _write_csv(temporary_path, header, chunks, progress)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return written
+
+
+def _write_csv(path, header, chunks, progress):
+    written = 0
+    # UTF-8 with BOM so that Excel shows the Arabic text
+    with open(path, "w", newline="", encoding="utf-8-sig") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for rows in chunks:
+            writer.writerows(rows)
+            written += len(rows)
+            if progress:
+                progress(written)
+    return written
+
+
+def _write_xlsx(path, header, chunks, progress):
+    from openpyxl import Workbook  # Only needed for Excel files
+
+    workbook = Workbook(write_only=True)
+
+    def new_sheet():
+        sheet = workbook.create_sheet(str(len(workbook.worksheets) + 1))
+        sheet.sheet_view.rightToLeft = True
+        sheet.append(header)
+        return sheet
+
+    sheet = new_sheet()
+    sheet_rows = 1
+    written = 0
+    for rows in chunks:
+        for row in rows:
+            if sheet_rows == XLSX_MAX_ROWS:
+                sheet = new_sheet()
+                sheet_rows = 1
+            sheet.append(row)
+            sheet_rows += 1
+        written += len(rows)
+        if progress:
+            progress(written)
+    workbook.save(path)
+    return written
+
+
+# Views
+
+def export_students(path, search_text="", center_name="", learning_type="", grade="", conn=None, progress=None):
+    """Students tab rows matching the search text and filters, by id"""
+    conn = conn or get_connection()
+    expression = queries.search_expression(search_text) if search_text.strip() else None
+    if expression:
+        query = queries.search_students_query(expression, center_name, learning_type, grade)
+    else:
+        query = queries.students_query(center_name, learning_type, grade)
+    return write_rows(path, STUDENT_COLUMNS, query_chunks(conn, *query), progress)
+
+
+def export_attendance(path, date=None, center_name="", learning_type="", grade="", conn=None, progress=None):
+    """Attendance tab rows (of one date, or the whole history), newest first"""
+    conn = conn or get_connection()
+    chunks = query_chunks(conn, *queries.attendance_query(date, center_name, learning_type, grade))
+    return write_rows(path, ATTENDANCE_COLUMNS, ([row[1:] for row in rows] for rows in chunks), progress)
+
+
+def export_report(path, barcode, month="", center_name="", learning_type="", conn=None, progress=None):
+    """Reporting tab rows: the attendance history of one student, newest first"""
+    conn = conn or get_connection()
+    chunks = query_chunks(conn, *queries.report_query(barcode, month, center_name, learning_type))
+    return write_rows(path, REPORT_COLUMNS, ([row[1:] for row in rows] for rows in chunks), progress)
+
+
+def export_absentees(path, search, conn=None, progress=None):
+    """Rows of an absence.AbsenceSearch, by name"""
+    conn = conn or get_connection()
+    chunks = page_chunks(conn, search.page, lambda row: (row[1], row[0]))
+    return write_rows(path, ABSENTEE_COLUMNS, ([row[1:] for row in rows] for rows in chunks), progress)
+
+
+# Incremental export
+
+def export_changes(path, destination, conn=None, progress=None):
+    """Write the attendance rows added, changed or deleted since the last export to destination; returns the rows written.
+
+    A destination is any name; its first export holds every row. Rows are
+    identified by attendance_id: the file lists the deleted rows first
+    (tombstones with the student and date they had), then the current state
+    of the changed rows, then the new rows. The destination's watermarks are
+    only saved once the file is complete, so a failed export is sent again by
+    the next one.
+    """
+    conn = conn or get_connection()
+    try:
+        # Registering the destination starts the change log (its triggers only log for destinations)
+        conn.execute(queries.ADD_DESTINATION_QUERY, (destination,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Every read from the same snapshot; changes made meanwhile get later ids and sequence numbers
+    conn.execute("BEGIN")
+    try:
+        last_id, last_seq = conn.execute(queries.WATERMARK_QUERY, (destination,)).fetchone()
+        high_id, high_seq = conn.execute(queries.EXPORT_HIGH_MARKS_QUERY).fetchone()
+        high_id, high_seq = max(high_id, last_id), max(high_seq, last_seq)
+        chunks = itertools.chain(
+            query_chunks(conn, *queries.deleted_rows_query(last_seq, high_seq, last_id)),
+            query_chunks(conn, *queries.changed_rows_query(last_seq, high_seq, last_id)),
+            query_chunks(conn, *queries.added_rows_query(last_id, high_id)))
+        written = write_rows(path, CHANGE_COLUMNS, chunks, progress)
+    finally:
+        conn.rollback()  # End the read transaction
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(queries.LOG_REUSED_IDS_QUERY, (high_seq, high_id))
+        conn.execute(queries.UPDATE_WATERMARK_QUERY,
+                     (high_id, high_seq, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), destination))
+        conn.execute(queries.TRIM_CHANGES_QUERY)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return written
+
+
+def forget_destination(destination, conn=None):
+    """Drop the watermarks of destination (its next export holds every row again)"""
+    conn = conn or get_connection()
+    try:
+        conn.execute(queries.DELETE_DESTINATION_QUERY, (destination,))
+        conn.execute(queries.TRIM_CHANGES_QUERY)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def export_destinations(conn=None):
+    """(destination, last_attendance_id, last_change_seq, exported_at) of every incremental export destination"""
+    conn = conn or get_connection()
+    return conn.execute(queries.DESTINATIONS_QUERY).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the students or the attendance history to CSV or XLSX")
+    parser.add_argument("view", choices=["students", "attendance", "report", "changes", "destinations"],
+                        help="changes: the attendance added, edited or deleted since the destination's last export; "
+                             "destinations: list the incremental export destinations")
+    parser.add_argument("output", nargs="?", help="File to write (.csv or .xlsx)")
+    parser.add_argument("--db", help="Database file (default: students.db next to the app)")
+    parser.add_argument("--center", default="")
+    parser.add_argument("--type", default="")
+    parser.add_argument("--grade", default="")
+    parser.add_argument("--search", default="", help="students: words of the name, mobiles or barcode")
+    parser.add_argument("--date", help="attendance: only this date (YYYY-MM-DD)")
+    parser.add_argument("--barcode", help="report: the student's barcode")
+    parser.add_argument("--month", default="", help="report: only this month (MM-YYYY)")
+    parser.add_argument("--destination", help="changes: name of the receiver of the files (e.g. head-office)")
+    parser.add_argument("--reset", action="store_true", help="changes: start the destination again with every row")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    create_database(conn)
+    if args.view == "destinations":
+        for destination, last_id, last_seq, exported_at in export_destinations(conn):
+            print(f"{destination}\tattendance id {last_id}\tchange {last_seq}\t{exported_at or 'never'}")
+        raise SystemExit(0)
+
+    if not args.output or os.path.splitext(args.output)[1].lower() not in EXPORT_FORMATS:
+        parser.error("output must be a .csv or .xlsx file")
+    if args.view == "report" and not args.barcode:
+        parser.error("report needs --barcode")
+    if args.view == "changes" and not args.destination:
+        parser.error("changes needs --destination")
+
+    progress = lambda rows: print(f"{rows} rows...", end="\r", file=sys.stderr)
+    if args.view == "changes":
+        if args.reset:
+            forget_destination(args.destination, conn)
+        rows = export_changes(args.output, args.destination, conn, progress)
+    elif args.view == "students":
+        rows = export_students(args.output, args.search, args.center, args.type, args.grade, conn, progress)
+    elif args.view == "attendance":
+        rows = export_attendance(args.output, args.date, args.center, args.type, args.grade, conn, progress)
+    else:
+        rows = export_report(args.output, args.barcode, args.month, args.center, args.type, conn, progress)
+    print(f"Exported {rows} rows to {args.output}")
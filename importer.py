@@ -0,0 +1,231 @@
+import csv
+import os
+import re
+import sys
+import random
+import string
+import sqlite3
+import argparse
+import datetime
+import queries
+from database import db_path, connect
+from attendance_api import LEARNING_TYPES, GRADES, insert_student_rows, open_database
+
+# Rows validated and written per transaction
+CHUNK_ROWS = 5000
+
+# Rejected rows kept in the result (the count is always exact)
+MAX_REPORTED_ERRORS = 1000
+
+# Accepted column headers (the app's Arabic headings or plain English names)
+COLUMN_ALIASES = {
+    "name": ["الاسم", "name"],
+    "mobile": ["رقم الجوال", "mobile"],
+    "center": ["اسم السنتر", "center", "center_name"],
+    "learning_type": ["نوع الطالب", "learning_type", "type"],
+    "parent_mobile": ["رقم جوال ولي الامر", "parent_mobile"],
+    "barcode": ["الرمز الشريطي", "barcode"],
+    "grade": ["الصف", "grade"],
+}
+REQUIRED_COLUMNS = ["name", "mobile", "center", "learning_type", "parent_mobile", "grade"]
+
+# Egyptian mobile numbers: 010, 011, 012 or 015 followed by 8 digits
+MOBILE_PATTERN = re.compile(r"^01[0125]\d{8}$")
+ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+
+
+class StudentImportError(Exception):
+    """The file cannot be imported at all (unreadable or missing columns)"""
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def read_rows(path):
+    """Yield (line_number, row) for every data row of a CSV or XLSX file.
+
+    row is a list of cell texts; the header row is yielded first with line 1.
+    The file is streamed, never loaded as a whole.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise StudentImportError("openpyxl is required to import Excel files (pip install openpyxl)")
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for line_number, values in enumerate(workbook.active.iter_rows(values_only=True), start=1):
+                yield line_number, [_cell_text(value) for value in values]
+        finally:
+            workbook.close()
+    else:
+        # utf-8-sig also accepts the BOM that Excel writes in front of CSV files
+        with open(path, newline="", encoding="utf-8-sig") as csv_file:
+            for line_number, values in enumerate(csv.reader(csv_file), start=1):
+                yield line_number, [value.strip() for value in values]
+
+
+def _column_positions(header):
+    positions = {}
+    normalized = [cell.strip().lower() for cell in header]
+    for column, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias.lower() in normalized:
+                positions[column] = normalized.index(alias.lower())
+                break
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in positions]
+    if missing:
+        raise StudentImportError("Missing columns: " + ", ".join(COLUMN_ALIASES[column][0] for column in missing))
+    return positions
+
+
+def normalize_mobile(value):
+    """Return the mobile number in 01XXXXXXXXX form, or None if it is not valid"""
+    mobile = re.sub(r"[\s\-+()]", "", value.translate(ARABIC_DIGITS))
+    if mobile.startswith("20") and len(mobile) == 12:
+        mobile = mobile[1:]  # International prefix
+    elif len(mobile) == 10 and mobile.startswith("1"):
+        mobile = "0" + mobile  # Leading zero lost by a spreadsheet
+    return mobile if MOBILE_PATTERN.match(mobile) else None
+
+
+def _new_barcode(barcodes):
+    while True:
+        barcode = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+        if barcode not in barcodes:
+            return barcode
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_students(path, conn=None, create_centers=False, progress=None):
+    """Import students from a CSV or XLSX file.
+
+    Rows are validated and inserted CHUNK_ROWS at a time, one transaction per
+    chunk. Barcodes are checked against an in-memory set of the existing ones
+    (rows without a barcode get a new one). Invalid rows are skipped.
+
+    Returns (imported_count, rejected_count, errors) where errors is a list of
+    (line_number, message) for the first MAX_REPORTED_ERRORS rejected rows.
+    progress(rows_read) is called after every chunk.
+    """
+    conn = conn or connect()
+    cursor = conn.cursor()
+
+    rows = read_rows(path)
+    try:
+        _, header = next(rows)
+    except StopIteration:
+        raise StudentImportError("The file is empty")
+    positions = _column_positions(header)
+
+    cursor.execute(queries.CENTER_NAMES_QUERY)
+    centers = {name: center_id for center_id, name in cursor}
+    cursor.execute(queries.STUDENT_BARCODES_QUERY)
+    barcodes = {row[0] for row in cursor}
+
+    imported = 0
+    rejected = 0
+    rows_read = 0
+    errors = []
+
+    def reject(line_number, message):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append((line_number, message))
+
+    def cell(values, column):
+        position = positions.get(column)
+        return values[position] if position is not None and position < len(values) else ""
+
+    for chunk in _chunks(rows, CHUNK_ROWS):
+        students = []
+        for line_number, values in chunk:
+            rows_read += 1
+            if not any(values):
+                continue  # Blank line
+
+            name = cell(values, "name")
+            center_name = cell(values, "center")
+            learning_type = cell(values, "learning_type")
+            grade = cell(values, "grade")
+            barcode = cell(values, "barcode")
+            mobile = normalize_mobile(cell(values, "mobile"))
+            parent_mobile = normalize_mobile(cell(values, "parent_mobile"))
+
+            if not name:
+                reject(line_number, "الاسم مطلوب")
+            elif mobile is None:
+                reject(line_number, f"رقم الجوال غير صحيح: {cell(values, 'mobile')}")
+            elif parent_mobile is None:
+                reject(line_number, f"رقم جوال ولي الامر غير صحيح: {cell(values, 'parent_mobile')}")
+            elif learning_type not in LEARNING_TYPES:
+                reject(line_number, f"نوع الطالب غير صحيح: {learning_type}")
+            elif grade not in GRADES:
+                reject(line_number, f"الصف غير صحيح: {grade}")
+            elif center_name not in centers and not (create_centers and center_name):
+                reject(line_number, f"السنتر غير موجود: {center_name}")
+            elif barcode and barcode in barcodes:
+                reject(line_number, f"الرمز الشريطي موجود بالفعل: {barcode}")
+            else:
+                if center_name not in centers:
+                    cursor.execute(queries.INSERT_CENTER_QUERY,
+                                   (center_name, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                    centers[center_name] = cursor.lastrowid
+                barcode = barcode or _new_barcode(barcodes)
+                barcodes.add(barcode)
+                students.append((name, mobile, centers[center_name], learning_type, parent_mobile, barcode, grade))
+
+        try:
+            insert_student_rows(cursor, students)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        imported += len(students)
+
+        if progress:
+            progress(rows_read)
+
+    return imported, rejected, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import students from a CSV or XLSX file")
+    parser.add_argument("file", help="CSV (UTF-8) or XLSX file with one student per row")
+    parser.add_argument("--db", default=db_path, help="Database file (default: students.db next to the app)")
+    parser.add_argument("--create-centers", action="store_true", help="Create centers that do not exist yet")
+    args = parser.parse_args()
+
+    started = datetime.datetime.now()
+    try:
+        imported, rejected, errors = import_students(
+            args.file, open_database(args.db), args.create_centers,
+            progress=lambda rows_read: print(f"Read {rows_read} rows...", end="\r"))
+    except (StudentImportError, OSError, sqlite3.Error) as e:
+        print(f"Import failed: {e}")
+        sys.exit(1)
+
+    seconds = (datetime.datetime.now() - started).total_seconds()
+    print(f"Imported {imported} students, rejected {rejected} rows in {seconds:.1f}s")
+    for line_number, message in errors[:50]:
+        print(f"  line {line_number}: {message}")
+    if rejected > 50:
+        print(f"  ... and {rejected - 50} more")
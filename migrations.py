@@ -0,0 +1,607 @@
+import datetime
+from database import get_connection, analyze
+
+# Schema management
+#
+# The schema version is stored in PRAGMA user_version. SCHEMA_MIGRATIONS is
+# the ordered list of (version, description, migrate, chunked) steps:
+#
+# - plain steps are called as migrate(cursor) inside a single transaction
+#   together with the user_version bump;
+# - chunked steps are called as migrate(conn, progress) and do their work with
+#   run_in_chunks(), committing every chunk. The position reached is stored in
+#   schema_migration_progress in the same transaction as the chunk, so a step
+#   interrupted by a crash resumes where it stopped. Chunked steps must be safe
+#   to run again from the beginning of any phase.
+#
+# progress(message, done, total) is called while migrating; total is 0 when
+# the amount of work is unknown.
+
+# Rows copied or cleaned per transaction by the chunked steps
+CHUNK_ROWS = 5000
+
+# Student ids handled per transaction while removing duplicate attendance rows
+DEDUP_BATCH_STUDENTS = 1000
+
+STUDENTS_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS students (
+                            id INTEGER PRIMARY KEY,
+                            name TEXT,
+                            mobile TEXT,
+                            center_id INTEGER,
+                            learning_type TEXT,
+                            parent_mobile TEXT,
+                            barcode TEXT UNIQUE,
+                            grade TEXT,
+                            FOREIGN KEY(center_id) REFERENCES centers(id))'''
+
+
+def _table_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+
+def run_in_chunks(conn, step, chunk, start, total=0, progress=None, message=""):
+    """Call chunk(cursor, position) in its own transaction until it returns None.
+
+    chunk does one bounded piece of work after position and returns the new
+    position. The position is saved under the name step together with the
+    chunk's changes, so a rerun continues after the last committed chunk.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT position FROM schema_migration_progress WHERE step = ?", (step,))
+    row = cursor.fetchone()
+    position = row[0] if row else start
+
+    while True:
+        cursor.execute("BEGIN")
+        try:
+            new_position = chunk(cursor, position)
+            if new_position is not None:
+                cursor.execute("INSERT OR REPLACE INTO schema_migration_progress (step, position) VALUES (?, ?)",
+                               (step, new_position))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if new_position is None:
+            return
+        position = new_position
+        if progress:
+            progress(message, position - start, total - start if total else 0)
+
+
+def _create_base_schema(conn, progress):
+    """Version 1: centers, students and attendance tables (converting the legacy center_name schema)"""
+    cursor = conn.cursor()
+
+    # Create centers table
+    cursor.execute('''CREATE TABLE IF NOT EXISTS centers (
+                        id INTEGER PRIMARY KEY,
+                        name TEXT UNIQUE NOT NULL,
+                        created_date TEXT)''')
+
+    # Old schema: students with a center_name column instead of center_id.
+    # Keep the old rows aside under students_legacy; legacy_alter_table stops
+    # SQLite from rewriting the attendance foreign key to the renamed table.
+    cursor.execute("PRAGMA table_info(students)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'center_name' in columns and 'center_id' not in columns:
+        print("Migrating database schema...")
+        cursor.execute("PRAGMA legacy_alter_table = ON")
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute("ALTER TABLE students RENAME TO students_legacy")
+            cursor.execute(STUDENTS_TABLE_SQL)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute("PRAGMA legacy_alter_table = OFF")
+
+    cursor.execute(STUDENTS_TABLE_SQL)
+
+    if _table_exists(cursor, "students_legacy"):
+        # Create every referenced center in one statement
+        cursor.execute("BEGIN")
+        cursor.execute('''INSERT OR IGNORE INTO centers (name, created_date)
+                          SELECT DISTINCT center_name, ? FROM students_legacy WHERE center_name IS NOT NULL''',
+                       (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+        conn.commit()
+
+        cursor.execute("SELECT MAX(id) FROM students_legacy")
+        total = cursor.fetchone()[0] or 0
+
+        def copy_students(cursor, last_id):
+            cursor.execute("SELECT MAX(id) FROM (SELECT id FROM students_legacy WHERE id > ? ORDER BY id LIMIT ?)",
+                           (last_id, CHUNK_ROWS))
+            upper_id = cursor.fetchone()[0]
+            if upper_id is None:
+                return None
+            cursor.execute('''INSERT INTO students (id, name, mobile, center_id, learning_type, parent_mobile, barcode, grade)
+                              SELECT legacy.id, legacy.name, legacy.mobile, centers.id, legacy.learning_type,
+                                     legacy.parent_mobile, legacy.barcode, legacy.grade
+                              FROM students_legacy AS legacy
+                              LEFT JOIN centers ON centers.name = legacy.center_name
+                              WHERE legacy.id > ? AND legacy.id <= ?''',
+                           (last_id, upper_id))
+            return upper_id
+
+        run_in_chunks(conn, "1:copy_students", copy_students, 0, total, progress, "Copying students")
+
+        cursor.execute("BEGIN")
+        cursor.execute("DROP TABLE students_legacy")
+        conn.commit()
+        print("Database migration completed!")
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS attendance (
+                        id INTEGER PRIMARY KEY,
+                        student_id INTEGER,
+                        date TEXT,
+                        marks INTEGER,
+                        FOREIGN KEY(student_id) REFERENCES students(id))''')
+
+
+def _create_indexes(cursor):
+    """Version 2: indexes for the attendance and student filters"""
+    # Today's attendance, present counts and the absent students subquery
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date_student ON attendance(date, student_id)")
+    # Per-student history in the reporting tab
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_date ON attendance(student_id, date)")
+    # Center / learning type / grade filters
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_center_type_grade ON students(center_id, learning_type, grade)")
+    # Grade filter without a center and the grade dropdown
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_grade ON students(grade)")
+
+
+def _unique_attendance_per_day(conn, progress):
+    """Version 3: at most one attendance row per student and date"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(student_id) FROM attendance")
+    total = cursor.fetchone()[0] or 0
+
+    # Remove duplicates batch by batch of student ids, keeping the row that has
+    # marks (and the oldest one among equals)
+    def deduplicate(cursor, last_student_id):
+        cursor.execute("""SELECT MAX(student_id) FROM (
+                              SELECT DISTINCT student_id FROM attendance
+                              WHERE student_id > ? ORDER BY student_id LIMIT ?)""",
+                       (last_student_id, DEDUP_BATCH_STUDENTS))
+        upper_student_id = cursor.fetchone()[0]
+        if upper_student_id is None:
+            return None
+        cursor.execute("""DELETE FROM attendance WHERE id IN (
+                              SELECT id FROM (
+                                  SELECT id, ROW_NUMBER() OVER (
+                                             PARTITION BY student_id, date
+                                             ORDER BY (marks IS NULL OR marks = ''), id) AS position
+                                  FROM attendance
+                                  WHERE student_id > ? AND student_id <= ?)
+                              WHERE position > 1)""",
+                       (last_student_id, upper_student_id))
+        return upper_student_id
+
+    # Student ids are rowids, which SQLite assigns from 1
+    run_in_chunks(conn, "3:deduplicate", deduplicate, 0, total, progress, "Removing duplicate attendance")
+
+    # The unique index replaces the plain (student_id, date) index
+    cursor.execute("BEGIN")
+    cursor.execute("DROP INDEX IF EXISTS idx_attendance_student_date")
+    cursor.execute("CREATE UNIQUE INDEX idx_attendance_student_date ON attendance(student_id, date)")
+    conn.commit()
+
+
+def _create_paging_indexes(cursor):
+    """Version 4: indexes on the sort keys of the paged listings"""
+    # Absent students are listed by name, a page at a time
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_name ON students(name)")
+    # Students of one center in id order (the composite index sorts by type and grade first)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_center ON students(center_id)")
+
+
+# Search index row of the student just written (the body of the insert and update triggers)
+_INDEX_NEW_STUDENT = """
+    INSERT INTO students_fts (rowid, name, mobile, parent_mobile, barcode)
+    VALUES (new.id, normalize_arabic(new.name), normalize_arabic(new.mobile),
+            normalize_arabic(new.parent_mobile), normalize_arabic(new.barcode));"""
+
+
+def _create_student_search(conn, progress):
+    """Version 5: full-text index of the students' name, mobiles and barcode"""
+    # students_fts holds the normalize_arabic() spelling of each student under
+    # rowid = students.id. The triggers need the function, which connect()
+    # registers on every connection of the application.
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    cursor.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+                          name, mobile, parent_mobile, barcode,
+                          tokenize = 'unicode61', prefix = '2 3')""")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students BEGIN {_INDEX_NEW_STUDENT} END")
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS students_fts_update
+                       AFTER UPDATE OF id, name, mobile, parent_mobile, barcode ON students BEGIN
+                           DELETE FROM students_fts WHERE rowid = old.id; {_INDEX_NEW_STUDENT}
+                       END""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students BEGIN
+                          DELETE FROM students_fts WHERE rowid = old.id;
+                      END""")
+    conn.commit()
+
+    # Index the existing students; the triggers already cover the ones written meanwhile
+    cursor.execute("SELECT MAX(id) FROM students")
+    total = cursor.fetchone()[0] or 0
+
+    def index_students(cursor, last_id):
+        cursor.execute("SELECT MAX(id) FROM (SELECT id FROM students WHERE id > ? ORDER BY id LIMIT ?)",
+                       (last_id, CHUNK_ROWS))
+        upper_id = cursor.fetchone()[0]
+        if upper_id is None:
+            return None
+        cursor.execute("DELETE FROM students_fts WHERE rowid > ? AND rowid <= ?", (last_id, upper_id))
+        cursor.execute("""INSERT INTO students_fts (rowid, name, mobile, parent_mobile, barcode)
+                          SELECT id, normalize_arabic(name), normalize_arabic(mobile),
+                                 normalize_arabic(parent_mobile), normalize_arabic(barcode)
+                          FROM students WHERE id > ? AND id <= ?""",
+                       (last_id, upper_id))
+        return upper_id
+
+    run_in_chunks(conn, "5:index_students", index_students, 0, total, progress, "Indexing students for search")
+
+
+# Triggers keeping daily_attendance_counts and roster_counts in step with every
+# write to attendance and students. A student's group is (center_id,
+# learning_type, grade) with NULLs stored as 0 / '' so they can be part of the
+# key. Attendance without a date, or whose student does not exist, is not
+# counted (the joins of the statistics never matched it either).
+_ADD_ATTENDANCE = """
+    INSERT INTO daily_attendance_counts (date, center_id, learning_type, grade, present)
+    SELECT new.date, IFNULL(center_id, 0), IFNULL(learning_type, ''), IFNULL(grade, ''), 1
+    FROM students WHERE id = new.student_id AND new.date IS NOT NULL
+    ON CONFLICT (date, center_id, learning_type, grade) DO UPDATE SET present = present + 1;"""
+
+_REMOVE_ATTENDANCE = """
+    UPDATE daily_attendance_counts SET present = present - 1
+    WHERE date = old.date AND (center_id, learning_type, grade) =
+          (SELECT IFNULL(center_id, 0), IFNULL(learning_type, ''), IFNULL(grade, '')
+           FROM students WHERE id = old.student_id);"""
+
+_ADD_STUDENT = """
+    INSERT INTO roster_counts (center_id, learning_type, grade, students)
+    VALUES (IFNULL(new.center_id, 0), IFNULL(new.learning_type, ''), IFNULL(new.grade, ''), 1)
+    ON CONFLICT (center_id, learning_type, grade) DO UPDATE SET students = students + 1;
+    INSERT INTO daily_attendance_counts (date, center_id, learning_type, grade, present)
+    SELECT date, IFNULL(new.center_id, 0), IFNULL(new.learning_type, ''), IFNULL(new.grade, ''), 1
+    FROM attendance WHERE student_id = new.id AND date IS NOT NULL
+    ON CONFLICT (date, center_id, learning_type, grade) DO UPDATE SET present = present + 1;"""
+
+_REMOVE_STUDENT = """
+    UPDATE roster_counts SET students = students - 1
+    WHERE center_id = IFNULL(old.center_id, 0) AND learning_type = IFNULL(old.learning_type, '')
+      AND grade = IFNULL(old.grade, '');
+    UPDATE daily_attendance_counts SET present = present - 1
+    WHERE center_id = IFNULL(old.center_id, 0) AND learning_type = IFNULL(old.learning_type, '')
+      AND grade = IFNULL(old.grade, '')
+      AND date IN (SELECT date FROM attendance WHERE student_id = old.id);"""
+
+COUNTER_TRIGGERS = {
+    "attendance_counts_insert": f"AFTER INSERT ON attendance BEGIN {_ADD_ATTENDANCE} END",
+    "attendance_counts_delete": f"AFTER DELETE ON attendance BEGIN {_REMOVE_ATTENDANCE} END",
+    "attendance_counts_update": f"AFTER UPDATE OF student_id, date ON attendance BEGIN "
+                                f"{_REMOVE_ATTENDANCE} {_ADD_ATTENDANCE} END",
+    "students_counts_insert": f"AFTER INSERT ON students BEGIN {_ADD_STUDENT} END",
+    "students_counts_delete": f"AFTER DELETE ON students BEGIN {_REMOVE_STUDENT} END",
+    "students_counts_update": f"""AFTER UPDATE OF id, center_id, learning_type, grade ON students
+                                  WHEN old.id IS NOT new.id OR old.center_id IS NOT new.center_id
+                                    OR old.learning_type IS NOT new.learning_type OR old.grade IS NOT new.grade
+                                  BEGIN {_REMOVE_STUDENT} {_ADD_STUDENT} END""",
+}
+
+
+def rebuild_attendance_counters(cursor):
+    """Derive daily_attendance_counts and roster_counts again from attendance and students"""
+    cursor.execute("DELETE FROM daily_attendance_counts")
+    cursor.execute("""INSERT INTO daily_attendance_counts (date, center_id, learning_type, grade, present)
+                       SELECT attendance.date, IFNULL(students.center_id, 0), IFNULL(students.learning_type, ''),
+                              IFNULL(students.grade, ''), COUNT(*)
+                       FROM attendance JOIN students ON attendance.student_id = students.id
+                       WHERE attendance.date IS NOT NULL
+                       GROUP BY 1, 2, 3, 4""")
+    cursor.execute("DELETE FROM roster_counts")
+    cursor.execute("""INSERT INTO roster_counts (center_id, learning_type, grade, students)
+                       SELECT IFNULL(center_id, 0), IFNULL(learning_type, ''), IFNULL(grade, ''), COUNT(*)
+                       FROM students GROUP BY 1, 2, 3""")
+
+
+def _create_attendance_counters(cursor):
+    """Version 6: present students per day and students per group for the statistics bar"""
+    cursor.execute("""CREATE TABLE IF NOT EXISTS daily_attendance_counts (
+                          date TEXT NOT NULL,
+                          center_id INTEGER NOT NULL,
+                          learning_type TEXT NOT NULL,
+                          grade TEXT NOT NULL,
+                          present INTEGER NOT NULL,
+                          PRIMARY KEY (date, center_id, learning_type, grade)) WITHOUT ROWID""")
+    cursor.execute("""CREATE TABLE IF NOT EXISTS roster_counts (
+                          center_id INTEGER NOT NULL,
+                          learning_type TEXT NOT NULL,
+                          grade TEXT NOT NULL,
+                          students INTEGER NOT NULL,
+                          PRIMARY KEY (center_id, learning_type, grade)) WITHOUT ROWID""")
+    for name, body in COUNTER_TRIGGERS.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    rebuild_attendance_counters(cursor)
+
+
+# Triggers logging the changes an incremental export (export.py) has to send
+# again: marks edited and rows deleted, once any export destination exists.
+# New rows are found by id, so an insert is only logged when it reuses the id
+# of a deleted row that a destination has already received.
+CHANGE_LOG_TRIGGERS = {
+    "attendance_changes_insert": """AFTER INSERT ON attendance
+                                   WHEN new.id <= (SELECT MAX(last_attendance_id) FROM export_watermarks)
+                                   BEGIN INSERT INTO attendance_changes (attendance_id, student_id, date, change)
+                                         VALUES (new.id, new.student_id, new.date, 'insert'); END""",
+    "attendance_changes_update": """AFTER UPDATE ON attendance
+                                   WHEN EXISTS (SELECT 1 FROM export_watermarks)
+                                   BEGIN INSERT INTO attendance_changes (attendance_id, student_id, date, change)
+                                         VALUES (new.id, new.student_id, new.date, 'update'); END""",
+    "attendance_changes_delete": """AFTER DELETE ON attendance
+                                   WHEN EXISTS (SELECT 1 FROM export_watermarks)
+                                   BEGIN INSERT INTO attendance_changes (attendance_id, student_id, date, change)
+                                         VALUES (old.id, old.student_id, old.date, 'delete'); END""",
+}
+
+
+def _create_change_log(cursor):
+    """Version 7: attendance change log and the watermark of each incremental export destination"""
+    # AUTOINCREMENT: the log is trimmed, a sequence number must never come back
+    cursor.execute("""CREATE TABLE IF NOT EXISTS attendance_changes (
+                          seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                          attendance_id INTEGER NOT NULL,
+                          student_id INTEGER,
+                          date TEXT,
+                          change TEXT NOT NULL)""")
+    cursor.execute("""CREATE TABLE IF NOT EXISTS export_watermarks (
+                          destination TEXT PRIMARY KEY,
+                          last_attendance_id INTEGER NOT NULL DEFAULT 0,
+                          last_change_seq INTEGER NOT NULL DEFAULT 0,
+                          exported_at TEXT)""")
+    for name, body in CHANGE_LOG_TRIGGERS.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+# Monthly rollups for the reporting tab's center/month summary, kept in step
+# with attendance and students by triggers like the counters above (same
+# group key, same rules for attendance without a date or a student):
+# monthly_student_attendance holds each student's days present, first and last
+# date and the sum and count of numeric marks per 'YYYY-MM' month;
+# monthly_group_attendance adds them up per (center_id, learning_type, grade,
+# month) together with the number of students present that month.
+
+def _numeric_mark(row):
+    # Marks are free text; only numeric ones are summed (as in the monthly report)
+    return f"(CASE WHEN CAST({row}.marks AS TEXT) GLOB '*[0-9]*' THEN CAST({row}.marks AS REAL) END)"
+
+
+def _month_dates(row, aggregate):
+    # First or last remaining date of the row's student and month, through the (student_id, date) index
+    return f"""(SELECT {aggregate}(date) FROM attendance WHERE student_id = {row}.student_id
+                AND date > substr({row}.date, 1, 7) AND date < substr({row}.date, 1, 7) || '-99')"""
+
+
+_ADD_ATTENDANCE_ROLLUP = f"""
+    INSERT INTO monthly_student_attendance (student_id, month, days_present, first_date, last_date, marks_sum, marks_count)
+    SELECT new.student_id, substr(new.date, 1, 7), 1, new.date, new.date, IFNULL({_numeric_mark("new")}, 0),
+           {_numeric_mark("new")} IS NOT NULL
+    WHERE new.student_id IS NOT NULL AND new.date IS NOT NULL
+    ON CONFLICT (student_id, month) DO UPDATE SET
+        days_present = days_present + 1,
+        first_date = MIN(first_date, excluded.first_date),
+        last_date = MAX(last_date, excluded.last_date),
+        marks_sum = marks_sum + excluded.marks_sum,
+        marks_count = marks_count + excluded.marks_count;
+    INSERT INTO monthly_group_attendance (center_id, learning_type, grade, month, students, days_present, marks_sum,
+                                          marks_count)
+    SELECT IFNULL(center_id, 0), IFNULL(learning_type, ''), IFNULL(grade, ''), substr(new.date, 1, 7),
+           (SELECT days_present FROM monthly_student_attendance
+            WHERE student_id = new.student_id AND month = substr(new.date, 1, 7)) = 1,
+           1, IFNULL({_numeric_mark("new")}, 0), {_numeric_mark("new")} IS NOT NULL
+    FROM students WHERE id = new.student_id AND new.date IS NOT NULL
+    ON CONFLICT (center_id, learning_type, grade, month) DO UPDATE SET
+        students = students + excluded.students,
+        days_present = days_present + 1,
+        marks_sum = marks_sum + excluded.marks_sum,
+        marks_count = marks_count + excluded.marks_count;"""
+
+# A student's month row goes away with its last day; the group loses a student present then
+_REMOVE_ATTENDANCE_ROLLUP = f"""
+    UPDATE monthly_student_attendance SET
+        days_present = days_present - 1,
+        first_date = CASE WHEN first_date = old.date THEN {_month_dates("old", "MIN")} ELSE first_date END,
+        last_date = CASE WHEN last_date = old.date THEN {_month_dates("old", "MAX")} ELSE last_date END,
+        marks_sum = marks_sum - IFNULL({_numeric_mark("old")}, 0),
+        marks_count = marks_count - ({_numeric_mark("old")} IS NOT NULL)
+    WHERE student_id = old.student_id AND month = substr(old.date, 1, 7);
+    UPDATE monthly_group_attendance SET
+        students = students - ((SELECT days_present FROM monthly_student_attendance
+                                WHERE student_id = old.student_id AND month = substr(old.date, 1, 7)) = 0),
+        days_present = days_present - 1,
+        marks_sum = marks_sum - IFNULL({_numeric_mark("old")}, 0),
+        marks_count = marks_count - ({_numeric_mark("old")} IS NOT NULL)
+    WHERE month = substr(old.date, 1, 7) AND (center_id, learning_type, grade) =
+          (SELECT IFNULL(center_id, 0), IFNULL(learning_type, ''), IFNULL(grade, '')
+           FROM students WHERE id = old.student_id);
+    DELETE FROM monthly_student_attendance
+    WHERE student_id = old.student_id AND month = substr(old.date, 1, 7) AND days_present = 0;
+    DELETE FROM monthly_group_attendance
+    WHERE month = substr(old.date, 1, 7) AND days_present = 0 AND (center_id, learning_type, grade) =
+          (SELECT IFNULL(center_id, 0), IFNULL(learning_type, ''), IFNULL(grade, '')
+           FROM students WHERE id = old.student_id);"""
+
+_ADD_STUDENT_ROLLUP = """
+    INSERT INTO monthly_group_attendance (center_id, learning_type, grade, month, students, days_present, marks_sum,
+                                          marks_count)
+    SELECT IFNULL(new.center_id, 0), IFNULL(new.learning_type, ''), IFNULL(new.grade, ''), month, 1, days_present,
+           marks_sum, marks_count
+    FROM monthly_student_attendance WHERE student_id = new.id
+    ON CONFLICT (center_id, learning_type, grade, month) DO UPDATE SET
+        students = students + 1,
+        days_present = days_present + excluded.days_present,
+        marks_sum = marks_sum + excluded.marks_sum,
+        marks_count = marks_count + excluded.marks_count;"""
+
+_REMOVE_STUDENT_ROLLUP = """
+    UPDATE monthly_group_attendance SET
+        students = students - 1,
+        days_present = monthly_group_attendance.days_present - student.days_present,
+        marks_sum = monthly_group_attendance.marks_sum - student.marks_sum,
+        marks_count = monthly_group_attendance.marks_count - student.marks_count
+    FROM (SELECT month, days_present, marks_sum, marks_count FROM monthly_student_attendance
+          WHERE student_id = old.id) AS student
+    WHERE monthly_group_attendance.center_id = IFNULL(old.center_id, 0)
+      AND monthly_group_attendance.learning_type = IFNULL(old.learning_type, '')
+      AND monthly_group_attendance.grade = IFNULL(old.grade, '')
+      AND monthly_group_attendance.month = student.month;
+    DELETE FROM monthly_group_attendance
+    WHERE center_id = IFNULL(old.center_id, 0) AND learning_type = IFNULL(old.learning_type, '')
+      AND grade = IFNULL(old.grade, '') AND days_present = 0;"""
+
+ROLLUP_TRIGGERS = {
+    "attendance_rollups_insert": f"AFTER INSERT ON attendance BEGIN {_ADD_ATTENDANCE_ROLLUP} END",
+    "attendance_rollups_delete": f"AFTER DELETE ON attendance BEGIN {_REMOVE_ATTENDANCE_ROLLUP} END",
+    "attendance_rollups_update": f"AFTER UPDATE OF student_id, date, marks ON attendance BEGIN "
+                                 f"{_REMOVE_ATTENDANCE_ROLLUP} {_ADD_ATTENDANCE_ROLLUP} END",
+    "students_rollups_insert": f"AFTER INSERT ON students BEGIN {_ADD_STUDENT_ROLLUP} END",
+    "students_rollups_delete": f"AFTER DELETE ON students BEGIN {_REMOVE_STUDENT_ROLLUP} END",
+    "students_rollups_update": f"""AFTER UPDATE OF id, center_id, learning_type, grade ON students
+                                   WHEN old.id IS NOT new.id OR old.center_id IS NOT new.center_id
+                                     OR old.learning_type IS NOT new.learning_type OR old.grade IS NOT new.grade
+                                   BEGIN {_REMOVE_STUDENT_ROLLUP} {_ADD_STUDENT_ROLLUP} END""",
+}
+
+
+def rebuild_monthly_rollups(cursor):
+    """Derive monthly_student_attendance and monthly_group_attendance again from attendance and students"""
+    cursor.execute("DELETE FROM monthly_student_attendance")
+    cursor.execute(f"""INSERT INTO monthly_student_attendance (student_id, month, days_present, first_date, last_date,
+                                                               marks_sum, marks_count)
+                       SELECT student_id, substr(date, 1, 7), COUNT(*), MIN(date), MAX(date),
+                              IFNULL(SUM({_numeric_mark("attendance")}), 0), COUNT({_numeric_mark("attendance")})
+                       FROM attendance
+                       WHERE student_id IS NOT NULL AND date IS NOT NULL
+                       GROUP BY 1, 2""")
+    cursor.execute("DELETE FROM monthly_group_attendance")
+    cursor.execute("""INSERT INTO monthly_group_attendance (center_id, learning_type, grade, month, students,
+                                                             days_present, marks_sum, marks_count)
+                       SELECT IFNULL(students.center_id, 0), IFNULL(students.learning_type, ''),
+                              IFNULL(students.grade, ''), rollup.month, COUNT(*), SUM(rollup.days_present),
+                              SUM(rollup.marks_sum), SUM(rollup.marks_count)
+                       FROM monthly_student_attendance AS rollup
+                       JOIN students ON rollup.student_id = students.id
+                       GROUP BY 1, 2, 3, 4""")
+
+
+def _create_monthly_rollups(cursor):
+    """Version 8: attendance per student and month, and per center/type/grade group and month"""
+    cursor.execute("""CREATE TABLE IF NOT EXISTS monthly_student_attendance (
+                          student_id INTEGER NOT NULL,
+                          month TEXT NOT NULL,
+                          days_present INTEGER NOT NULL,
+                          first_date TEXT,
+                          last_date TEXT,
+                          marks_sum REAL NOT NULL,
+                          marks_count INTEGER NOT NULL,
+                          PRIMARY KEY (student_id, month)) WITHOUT ROWID""")
+    cursor.execute("""CREATE TABLE IF NOT EXISTS monthly_group_attendance (
+                          center_id INTEGER NOT NULL,
+                          learning_type TEXT NOT NULL,
+                          grade TEXT NOT NULL,
+                          month TEXT NOT NULL,
+                          students INTEGER NOT NULL,
+                          days_present INTEGER NOT NULL,
+                          marks_sum REAL NOT NULL,
+                          marks_count INTEGER NOT NULL,
+                          PRIMARY KEY (center_id, learning_type, grade, month)) WITHOUT ROWID""")
+    for name, body in ROLLUP_TRIGGERS.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    rebuild_monthly_rollups(cursor)
+
+
+def _defer_bulk_student_indexing(cursor):
+    """Version 9: let bulk student inserts index the search in one statement instead of row by row"""
+    # While students_fts_deferred holds a row the insert trigger leaves new students
+    # unindexed. Bulk inserts (attendance_api.insert_student_rows) add the row,
+    # insert, index the new id range with INSERT ... SELECT and remove it again,
+    # all in one transaction, so no other connection ever sees it.
+    cursor.execute("CREATE TABLE IF NOT EXISTS students_fts_deferred (id INTEGER PRIMARY KEY)")
+    cursor.execute("DROP TRIGGER IF EXISTS students_fts_insert")
+    cursor.execute(f"""CREATE TRIGGER students_fts_insert AFTER INSERT ON students
+                       WHEN NOT EXISTS (SELECT 1 FROM students_fts_deferred)
+                       BEGIN {_INDEX_NEW_STUDENT} END""")
+
+
+def _drop_empty_group_rollups(cursor):
+    """Version 10: group rollups go away with their last day present, like the student rollups"""
+    for name, body in ROLLUP_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {body}")
+    cursor.execute("DELETE FROM monthly_group_attendance WHERE days_present = 0")
+
+
+SCHEMA_MIGRATIONS = [
+    (1, "Creating tables", _create_base_schema, True),
+    (2, "Creating indexes", _create_indexes, False),
+    (3, "One attendance per student and day", _unique_attendance_per_day, True),
+    (4, "Creating paging indexes", _create_paging_indexes, False),
+    (5, "Creating the student search index", _create_student_search, True),
+    (6, "Counting attendance", _create_attendance_counters, False),
+    (7, "Logging attendance changes", _create_change_log, False),
+    (8, "Summing up attendance per month", _create_monthly_rollups, False),
+    (9, "Indexing imported students in bulk", _defer_bulk_student_indexing, False),
+    (10, "Dropping empty monthly rollups", _drop_empty_group_rollups, False),
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def create_database(conn=None, progress=None):
+    """Create the database or upgrade it to SCHEMA_VERSION"""
+    conn = conn or get_connection()
+    cursor = conn.cursor()
+    cursor.execute('''CREATE TABLE IF NOT EXISTS schema_migration_progress (
+                        step TEXT PRIMARY KEY,
+                        position INTEGER)''')
+
+    version = start_version = get_schema_version(conn)
+    for target_version, description, migrate, chunked in SCHEMA_MIGRATIONS:
+        if version >= target_version:
+            continue
+        if progress:
+            progress(description, 0, 0)
+
+        if chunked:
+            migrate(conn, progress)
+            cursor.execute("BEGIN")
+        else:
+            cursor.execute("BEGIN")
+            try:
+                migrate(cursor)
+            except Exception:
+                conn.rollback()
+                raise
+
+        # The step is complete: record the version and forget its resume positions
+        cursor.execute(f"PRAGMA user_version = {target_version}")
+        cursor.execute("DELETE FROM schema_migration_progress WHERE step LIKE ?", (f"{target_version}:%",))
+        conn.commit()
+        version = target_version
+
+    # New indexes are only useful once the planner has statistics for them
+    if start_version < SCHEMA_VERSION:
+        if progress:
+            progress("Analyzing", 0, 0)
+        analyze(conn)
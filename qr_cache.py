@@ -0,0 +1,196 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from database import app_dir
+
+# Rendered QR images keyed by a hash of the payload and the render parameters.
+#
+# Two tiers: the most recently used images in memory, and files in CACHE_DIR
+# named after the render format (.png images, .modules for the QR module
+# bytes of the vector cards). Both are bounded in bytes and evict the least recently used
+# entries first; a file's modification time records its last use, so the
+# disk order survives restarts.
+
+CACHE_DIR = os.path.join(app_dir, "qr_cache")
+MAX_DISK_BYTES = 64 * 1024 * 1024      # About 150k card QR codes (PNG bytes, not counting file system blocks)
+MAX_MEMORY_BYTES = 8 * 1024 * 1024
+
+# Extensions of the cache files (of the render formats the cards use)
+CACHE_EXTENSIONS = (".png", ".modules")
+
+
+class QRCache:
+    """Content-addressed, size-bounded LRU cache of encoded QR images.
+
+    get(payload, parameters, render) returns the bytes stored for the payload
+    rendered with parameters (a JSON-serializable dict), calling
+    render(payload) only on a miss. stats() counts the hits of each tier and
+    the misses. The cache is shared by the Tk thread and the job executor's
+    worker, so every method holds the lock.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_disk_bytes=MAX_DISK_BYTES, max_memory_bytes=MAX_MEMORY_BYTES):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> image bytes, least recently used first
+        self._memory_bytes = 0
+        self._files = None            # key -> (file size, extension), least recently used first (read on first use)
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(payload, parameters):
+        data = json.dumps([payload, parameters], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def extension(parameters):
+        """File extension of the images rendered with parameters (".png", ".modules", ...)"""
+        return "." + str(parameters.get("format", "bin")).lower()
+
+    def get(self, payload, parameters, render):
+        image = self.lookup(payload, parameters)
+        if image is None:
+            image = render(payload)
+            self.put(payload, parameters, image)
+        return image
+
+    def get_many(self, payloads, parameters, render_many):
+        """Images of every payload, in order; the misses are rendered together by render_many(payloads)"""
+        images = [self.lookup(payload, parameters) for payload in payloads]
+        missing = [index for index, image in enumerate(images) if image is None]
+        if missing:
+            rendered = render_many([payloads[index] for index in missing])
+            for index, image in zip(missing, rendered):
+                images[index] = image
+                self.put(payloads[index], parameters, image)
+        return images
+
+    def lookup(self, payload, parameters):
+        """The cached image, or None (counted as a miss)"""
+        key = self.key(payload, parameters)
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return image
+            image = self._read_file(key)
+            if image is not None:
+                self.disk_hits += 1
+                self._remember(key, image)
+                return image
+            self.misses += 1
+            return None
+
+    def put(self, payload, parameters, image):
+        key = self.key(payload, parameters)
+        with self._lock:
+            self._remember(key, image)
+            self._write_file(key, self.extension(parameters), image)
+
+    def stats(self):
+        """{"memory_hits", "disk_hits", "misses", "memory_bytes", "disk_bytes"}"""
+        with self._lock:
+            return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "memory_bytes": self._memory_bytes, "disk_bytes": self._disk_bytes}
+
+    def reset_stats(self):
+        with self._lock:
+            self.memory_hits = self.disk_hits = self.misses = 0
+
+    # Memory tier
+
+    def _remember(self, key, image):
+        if len(image) > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = image
+        self._memory_bytes += len(image)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # Disk tier
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key[:2], key + extension)
+
+    def _load_index(self):
+        """Read the sizes and last uses of the files already on disk, once"""
+        if self._files is not None:
+            return
+        entries = []
+        if os.path.isdir(self.directory):
+            for folder in os.scandir(self.directory):
+                if not folder.is_dir():
+                    continue
+                for entry in os.scandir(folder.path):
+                    key, extension = os.path.splitext(entry.name)
+                    if extension in CACHE_EXTENSIONS:
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, key, stat.st_size, extension))
+        entries.sort()
+        self._files = OrderedDict((key, (size, extension)) for _, key, size, extension in entries)
+        self._disk_bytes = sum(size for size, _ in self._files.values())
+
+    def _read_file(self, key):
+        self._load_index()
+        if key not in self._files:
+            return None
+        path = self._path(key, self._files[key][1])
+        try:
+            with open(path, "rb") as file:
+                image = file.read()
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            # Removed behind our back
+            self._disk_bytes -= self._files.pop(key)[0]
+            return None
+        self._files.move_to_end(key)
+        return image
+
+    def _write_file(self, key, extension, image):
+        self._load_index()
+        if key in self._files or len(image) > self.max_disk_bytes:
+            return
+        path = self._path(key, extension)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a temporary name so a crash never leaves a truncated image
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as file:
+                file.write(image)
+            os.replace(temporary_path, path)
+        except OSError:
+            return  # The cache is only an optimization; a read-only folder just disables the disk tier
+        self._files[key] = (len(image), extension)
+        self._disk_bytes += len(image)
+        while self._disk_bytes > self.max_disk_bytes:
+            evicted, (size, evicted_extension) = self._files.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(evicted, evicted_extension))
+            except OSError:
+                pass
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """The application's QR cache in CACHE_DIR"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = QRCache()
+        return _default_cache
@@ -0,0 +1,652 @@
+import re
+import sys
+import datetime
+from arabic import normalize_arabic
+from database import get_connection
+
+# All SQL used by the application lives here so that the same queries can be
+# checked with EXPLAIN QUERY PLAN and reused outside of the Tk handlers.
+# Every builder returns a (query, parameters) pair.
+
+STUDENT_BY_BARCODE_QUERY = '''SELECT students.id, students.name, students.mobile, centers.name as center_name,
+                                     students.learning_type, students.parent_mobile, students.grade
+                              FROM students
+                              LEFT JOIN centers ON students.center_id = centers.id
+                              WHERE students.barcode = ?'''
+
+# Records a scan; does nothing when the student is already present on that date
+MARK_PRESENT_QUERY = '''INSERT INTO attendance (student_id, date, marks) VALUES (?, ?, ?)
+                        ON CONFLICT(student_id, date) DO NOTHING'''
+
+BARCODE_EXISTS_QUERY = "SELECT id FROM students WHERE barcode = ?"
+BARCODE_EXISTS_FOR_OTHER_QUERY = "SELECT id FROM students WHERE barcode = ? AND id != ?"
+
+CENTERS_QUERY = "SELECT id, name, created_date FROM centers ORDER BY id DESC"
+CENTER_NAMES_QUERY = "SELECT id, name FROM centers ORDER BY name"
+GRADES_QUERY = "SELECT DISTINCT grade FROM students"
+STUDENT_BARCODES_QUERY = "SELECT barcode FROM students WHERE barcode IS NOT NULL"
+
+# Bulk student inserts skip the per-row search index trigger and index the new
+# id range in one statement (see migrations._defer_bulk_student_indexing)
+LAST_STUDENT_ID_QUERY = "SELECT IFNULL(MAX(id), 0) FROM students"
+DEFER_STUDENT_INDEXING_QUERY = "INSERT OR IGNORE INTO students_fts_deferred (id) VALUES (1)"
+RESUME_STUDENT_INDEXING_QUERY = "DELETE FROM students_fts_deferred"
+INDEX_NEW_STUDENTS_QUERY = '''INSERT INTO students_fts (rowid, name, mobile, parent_mobile, barcode)
+                              SELECT id, normalize_arabic(name), normalize_arabic(mobile),
+                                     normalize_arabic(parent_mobile), normalize_arabic(barcode)
+                              FROM students WHERE id > ?'''
+NEXT_ATTENDANCE_DATE_QUERY = "SELECT MIN(date) FROM attendance WHERE date >= ?"
+
+# Every student's barcode and filter columns, read once into the in-memory roster (roster.py)
+ROSTER_QUERY = '''SELECT students.id, students.name, students.barcode, centers.name, students.learning_type, students.grade
+                  FROM students
+                  LEFT JOIN centers ON students.center_id = centers.id
+                  ORDER BY students.id'''
+
+INSERT_CENTER_QUERY = "INSERT INTO centers (name, created_date) VALUES (?, ?)"
+RENAME_CENTER_QUERY = "UPDATE centers SET name=? WHERE id=?"
+DELETE_CENTER_QUERY = "DELETE FROM centers WHERE id=?"
+DELETE_CENTER_STUDENTS_QUERY = "DELETE FROM students WHERE center_id=?"
+DELETE_CENTER_ATTENDANCE_QUERY = "DELETE FROM attendance WHERE student_id IN (SELECT id FROM students WHERE center_id=?)"
+
+INSERT_STUDENT_QUERY = '''INSERT INTO students (name, mobile, center_id, learning_type, parent_mobile, barcode, grade)
+                          VALUES (?, ?, ?, ?, ?, ?, ?)'''
+UPDATE_STUDENT_QUERY = '''UPDATE students SET name=?, mobile=?, center_id=?, learning_type=?, parent_mobile=?, barcode=?, grade=?
+                          WHERE id=?'''
+DELETE_STUDENT_QUERY = "DELETE FROM students WHERE id=?"
+
+# Presence of one date for the absence index (absence.py): the ids of the students who attended, and
+# the row count and highest attendance id that tell whether a cached copy is still current
+PRESENT_STUDENT_IDS_QUERY = "SELECT student_id FROM attendance WHERE date = ?"
+ATTENDANCE_DAY_QUERY = "SELECT COUNT(*), MAX(id) FROM attendance WHERE date = ?"
+LAST_ATTENDANCE_ID_QUERY = "SELECT IFNULL(MAX(id), 0) FROM attendance"
+
+# Days with any attendance (the days the centers were open), oldest first / newest first
+SESSION_DAYS_QUERY = '''SELECT DISTINCT date FROM daily_attendance_counts
+                        WHERE date BETWEEN ? AND ? AND present > 0 ORDER BY date'''
+RECENT_SESSION_DAYS_QUERY = '''SELECT DISTINCT date FROM daily_attendance_counts
+                               WHERE date <= ? AND present > 0 ORDER BY date DESC LIMIT ?'''
+
+UPDATE_MARKS_QUERY = "UPDATE attendance SET marks=? WHERE id=?"
+DELETE_ATTENDANCE_QUERY = "DELETE FROM attendance WHERE id = ?"
+
+
+def month_range(month):
+    """Turn a 'MM-YYYY' month into the half-open date range [start, end).
+
+    Raises ValueError if month is not a valid 'MM-YYYY' value.
+    """
+    first_day = datetime.datetime.strptime(month.strip(), "%m-%Y").date()
+    if first_day.month == 12:
+        next_month = first_day.replace(year=first_day.year + 1, month=1)
+    else:
+        next_month = first_day.replace(month=first_day.month + 1)
+    return first_day.strftime("%Y-%m-%d"), next_month.strftime("%Y-%m-%d")
+
+
+def available_months(conn=None):
+    """Months ('MM-YYYY', newest first) that have at least one attendance record.
+
+    Jumps from month to month through the date index instead of reading every
+    row, so the cost grows with the number of months, not with the history.
+    """
+    conn = conn or get_connection()
+    cursor = conn.cursor()
+    months = []
+    cursor.execute(NEXT_ATTENDANCE_DATE_QUERY, ("",))
+    date = cursor.fetchone()[0]
+    while date:
+        month = f"{date[5:7]}-{date[:4]}"
+        months.append(month)
+        cursor.execute(NEXT_ATTENDANCE_DATE_QUERY, (month_range(month)[1],))
+        date = cursor.fetchone()[0]
+    months.reverse()
+    return months
+
+
+def student_filter_conditions(center_name="", learning_type="", grade=""):
+    """Build the WHERE conditions shared by every student-filtered query"""
+    conditions = []
+    parameters = []
+
+    if center_name:
+        conditions.append("centers.name = ?")
+        parameters.append(center_name)
+
+    if learning_type:
+        conditions.append("students.learning_type = ?")
+        parameters.append(learning_type)
+
+    if grade:
+        conditions.append("students.grade = ?")
+        parameters.append(grade)
+
+    return conditions, parameters
+
+
+def search_expression(text, column=None):
+    """FTS5 MATCH expression finding every word of text as a word prefix, optionally in one column.
+
+    The words are normalized like the indexed text; None if text has no words.
+    """
+    words = re.findall(r"\w+", normalize_arabic(text))
+    if not words:
+        return None
+    column_filter = f"{column} : " if column else ""
+    return " AND ".join(f'{column_filter}"{word}"*' for word in words)
+
+
+def _where(conditions):
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def _limit(limit, parameters):
+    if limit is None:
+        return ""
+    parameters.append(limit)
+    return " LIMIT ?"
+
+
+# The listings below can be read a page at a time with keyset pagination:
+# pass the sort key of the last row already read (after_id / before_id /
+# after) and the page size (limit).
+
+def students_query(center_name="", learning_type="", grade="", after_id=None, limit=None):
+    """Students tab listing, ordered by id"""
+    query = """SELECT students.id, students.name, students.mobile, centers.name as center_name,
+                      students.learning_type, students.parent_mobile, students.barcode, students.grade
+               FROM students
+               LEFT JOIN centers ON students.center_id = centers.id"""
+    conditions, parameters = student_filter_conditions(center_name, learning_type, grade)
+    if after_id is not None:
+        conditions.append("students.id > ?")
+        parameters.append(after_id)
+    query += _where(conditions) + " ORDER BY students.id"
+    return query + _limit(limit, parameters), parameters
+
+
+def students_by_id_query(student_ids):
+    """Students tab rows of the given students (a page of ids picked by the roster), ordered by id"""
+    query = f"""SELECT students.id, students.name, students.mobile, centers.name as center_name,
+                      students.learning_type, students.parent_mobile, students.barcode, students.grade
+               FROM students
+               LEFT JOIN centers ON students.center_id = centers.id
+               WHERE students.id IN ({", ".join("?" * len(student_ids))})
+               ORDER BY students.id"""
+    return query, list(student_ids)
+
+
+def search_students_query(expression, center_name="", learning_type="", grade="", after_id=None, limit=None):
+    """Students tab rows matching a search_expression() over name, mobiles and barcode, ordered by id"""
+    query = """SELECT students.id, students.name, students.mobile, centers.name as center_name,
+                      students.learning_type, students.parent_mobile, students.barcode, students.grade
+               FROM students_fts
+               JOIN students ON students.id = students_fts.rowid
+               LEFT JOIN centers ON students.center_id = centers.id"""
+    conditions, parameters = student_filter_conditions(center_name, learning_type, grade)
+    conditions.insert(0, "students_fts MATCH ?")
+    parameters.insert(0, expression)
+    if after_id is not None:
+        conditions.append("students_fts.rowid > ?")
+        parameters.append(after_id)
+    query += _where(conditions) + " ORDER BY students_fts.rowid"
+    return query + _limit(limit, parameters), parameters
+
+
+def attendance_query(date=None, center_name="", learning_type="", grade="", before_id=None, limit=None, after_id=None):
+    """Attendance tab listing, optionally restricted to a single date, newest first.
+
+    after_id restricts the listing to the rows added after that id (refresh of the view).
+    """
+    # The rows after after_id are read by rowid so only the new rows are touched:
+    # CROSS JOIN keeps attendance as the outer loop and the unary + keeps the
+    # planner from walking the whole day in the date index
+    refresh = after_id is not None
+    query = f'''SELECT attendance.id, students.name, students.mobile, centers.name as center_name,
+                      students.learning_type, students.parent_mobile, students.grade, attendance.date, attendance.marks
+               FROM attendance
+               {"CROSS JOIN" if refresh else "JOIN"} students ON attendance.student_id = students.id
+               LEFT JOIN centers ON students.center_id = centers.id'''
+    conditions, parameters = student_filter_conditions(center_name, learning_type, grade)
+    if date:
+        conditions.insert(0, "+attendance.date = ?" if refresh else "attendance.date = ?")
+        parameters.insert(0, date)
+    if before_id is not None:
+        conditions.append("attendance.id < ?")
+        parameters.append(before_id)
+    if refresh:
+        conditions.append("attendance.id > ?")
+        parameters.append(after_id)
+    query += _where(conditions) + " ORDER BY attendance.id DESC"
+    return query + _limit(limit, parameters), parameters
+
+
+# The statistics bar reads the trigger-maintained counters (roster_counts and
+# daily_attendance_counts, see migrations.COUNTER_TRIGGERS): a handful of rows
+# per center/type/grade group instead of the students and attendance rows.
+
+def _counter_conditions(table, center_name, learning_type, grade):
+    conditions = []
+    parameters = []
+    if center_name:
+        conditions.append(f"{table}.center_id = (SELECT id FROM centers WHERE name = ?)")
+        parameters.append(center_name)
+    if learning_type:
+        conditions.append(f"{table}.learning_type = ?")
+        parameters.append(learning_type)
+    if grade:
+        conditions.append(f"{table}.grade = ?")
+        parameters.append(grade)
+    return conditions, parameters
+
+
+def total_students_query(center_name="", learning_type="", grade=""):
+    """Number of students matching the attendance filters"""
+    query = "SELECT IFNULL(SUM(students), 0) FROM roster_counts"
+    conditions, parameters = _counter_conditions("roster_counts", center_name, learning_type, grade)
+    return query + _where(conditions), parameters
+
+
+def present_students_query(date, center_name="", learning_type="", grade=""):
+    """Number of students matching the attendance filters who attended on date"""
+    query = "SELECT IFNULL(SUM(present), 0) FROM daily_attendance_counts"
+    conditions, parameters = _counter_conditions("daily_attendance_counts", center_name, learning_type, grade)
+    conditions.insert(0, "daily_attendance_counts.date = ?")
+    parameters.insert(0, date)
+    return query + _where(conditions), parameters
+
+
+def attendance_counts(conn, date, center_name="", learning_type="", grade=""):
+    """(total_students, present_students, total_unfiltered) for the attendance statistics bar.
+
+    total_unfiltered is only counted when a filter is applied (0 otherwise).
+    """
+    cursor = conn.cursor()
+
+    # Total students (filtered by current selections)
+    cursor.execute(*total_students_query(center_name, learning_type, grade))
+    total_students = cursor.fetchone()[0]
+
+    # Present students (attendance on date) with same filters
+    cursor.execute(*present_students_query(date, center_name, learning_type, grade))
+    present_students = cursor.fetchone()[0]
+
+    # Get total unfiltered count for comparison if filters are applied
+    total_unfiltered = 0
+    if center_name or learning_type or grade:
+        cursor.execute(*total_students_query())
+        total_unfiltered = cursor.fetchone()[0]
+
+    return total_students, present_students, total_unfiltered
+
+
+def _report_conditions(barcode, month, center_name, learning_type):
+    conditions = ["students.barcode = ?"]
+    parameters = [barcode]
+
+    if month:
+        # Half-open range so the (student_id, date) index can be used
+        conditions.append("attendance.date >= ? AND attendance.date < ?")
+        parameters += month_range(month)
+
+    filter_conditions, filter_parameters = student_filter_conditions(center_name, learning_type)
+    conditions += filter_conditions
+    parameters += filter_parameters
+    return conditions, parameters
+
+
+def report_query(barcode, month="", center_name="", learning_type="", before_id=None, limit=None):
+    """Reporting tab: attendance history of one student, newest first.
+
+    The first column is attendance.id (the sort key), the displayed columns follow.
+    """
+    query = '''SELECT attendance.id, students.name, students.mobile, centers.name as center_name, students.learning_type, students.parent_mobile, students.grade, attendance.date, attendance.marks
+               FROM attendance
+               JOIN students ON attendance.student_id = students.id
+               LEFT JOIN centers ON students.center_id = centers.id'''
+    conditions, parameters = _report_conditions(barcode, month, center_name, learning_type)
+    if before_id is not None:
+        conditions.append("attendance.id < ?")
+        parameters.append(before_id)
+    query += _where(conditions) + " ORDER BY attendance.id DESC"
+    return query + _limit(limit, parameters), parameters
+
+
+def report_count_query(barcode, month="", center_name="", learning_type=""):
+    """Number of rows of report_query()"""
+    query = '''SELECT COUNT(*)
+               FROM attendance
+               JOIN students ON attendance.student_id = students.id
+               LEFT JOIN centers ON students.center_id = centers.id'''
+    conditions, parameters = _report_conditions(barcode, month, center_name, learning_type)
+    return query + _where(conditions), parameters
+
+
+def _absent_conditions(date, name, center_name, learning_type):
+    conditions = ["students.id NOT IN (SELECT student_id FROM attendance WHERE date = ?)"]
+    parameters = [date]
+
+    # Words of the name (in any spelling variant) through the search index
+    expression = search_expression(name, "name") if name else None
+    if expression:
+        conditions.append("students.id IN (SELECT rowid FROM students_fts WHERE students_fts MATCH ?)")
+        parameters.append(expression)
+
+    filter_conditions, filter_parameters = student_filter_conditions(center_name, learning_type)
+    return conditions + filter_conditions, parameters + filter_parameters
+
+
+def absent_students_query(date, name="", center_name="", learning_type="", after=None, limit=None):
+    """Students without an attendance record on date, ordered by name.
+
+    The first column is students.id; the sort key is (name, id), pass it as after.
+    """
+    query = """
+        SELECT
+            students.id,
+            students.name,
+            students.mobile,
+            centers.name as center_name,
+            students.learning_type,
+            students.parent_mobile,
+            students.grade
+        FROM students
+        LEFT JOIN centers ON students.center_id = centers.id"""
+    conditions, parameters = _absent_conditions(date, name, center_name, learning_type)
+    if after is not None:
+        conditions.append("(students.name, students.id) > (?, ?)")
+        parameters += after
+    query += _where(conditions) + " ORDER BY students.name, students.id"
+    return query + _limit(limit, parameters), parameters
+
+
+def name_search_ids_query(expression):
+    """Ids of the students whose name matches a search_expression(text, "name")"""
+    return "SELECT rowid FROM students_fts WHERE students_fts MATCH ?", [expression]
+
+
+def absentees_by_id_query(student_ids):
+    """absent_students_query() rows of the given students (a page picked by the absence index)"""
+    query = f"""SELECT students.id, students.name, students.mobile, centers.name as center_name,
+                      students.learning_type, students.parent_mobile, students.grade
+               FROM students
+               LEFT JOIN centers ON students.center_id = centers.id
+               WHERE students.id IN ({", ".join("?" * len(student_ids))})"""
+    return query, list(student_ids)
+
+
+def absent_students_count_query(date, name="", center_name="", learning_type=""):
+    """Number of rows of absent_students_query()"""
+    query = """SELECT COUNT(*)
+               FROM students
+               LEFT JOIN centers ON students.center_id = centers.id"""
+    conditions, parameters = _absent_conditions(date, name, center_name, learning_type)
+    return query + _where(conditions), parameters
+
+
+# Printed QR cards (cards.py) of the students matching the filters or of a selection, by name
+
+def card_students_query(center_name="", learning_type="", grade=""):
+    """(name, mobile, barcode) of the students with a barcode matching the filters"""
+    query = """SELECT students.name, students.mobile, students.barcode
+               FROM students
+               LEFT JOIN centers ON students.center_id = centers.id"""
+    conditions, parameters = student_filter_conditions(center_name, learning_type, grade)
+    conditions.append("students.barcode IS NOT NULL AND students.barcode != ''")
+    query += _where(conditions) + " ORDER BY students.name, students.id"
+    return query, parameters
+
+
+def card_students_by_id_query(student_ids):
+    """(name, mobile, barcode) of the given students that have a barcode"""
+    query = f"""SELECT name, mobile, barcode FROM students
+               WHERE id IN ({", ".join("?" * len(student_ids))}) AND barcode IS NOT NULL AND barcode != ''
+               ORDER BY name, id"""
+    return query, list(student_ids)
+
+
+# The monthly attendance matrix (reports.py) reads the month's attendance in one
+# date range scan and the students of the report, then pivots them in NumPy.
+
+def monthly_attendance_query(month, center_name="", learning_type="", grade=""):
+    """(student_id, day of the month, numeric marks or NULL) of the attendance rows of a 'MM-YYYY' month.
+
+    Without filters the month is read as one date range; with filters the
+    students' (student_id, date) ranges are read instead.
+    """
+    start, end = month_range(month)
+    query = """SELECT student_id, CAST(substr(date, 9, 2) AS INTEGER),
+                      CASE WHEN CAST(marks AS TEXT) GLOB '*[0-9]*' THEN CAST(marks AS REAL) END
+               FROM attendance
+               WHERE date >= ? AND date < ?"""
+    parameters = [start, end]
+    conditions, filter_parameters = student_filter_conditions(center_name, learning_type, grade)
+    if conditions:
+        query += """ AND student_id IN (SELECT students.id FROM students
+                                        LEFT JOIN centers ON students.center_id = centers.id""" + _where(conditions) + ")"
+        parameters += filter_parameters
+    return query, parameters
+
+
+def report_students_query(center_name="", learning_type="", grade=""):
+    """(id, name, barcode, center_name) of the students of a monthly report, by center and name"""
+    query = """SELECT students.id, students.name, students.barcode, centers.name as center_name
+               FROM students
+               LEFT JOIN centers ON students.center_id = centers.id"""
+    conditions, parameters = student_filter_conditions(center_name, learning_type, grade)
+    query += _where(conditions) + " ORDER BY centers.name, students.name, students.id"
+    return query, parameters
+
+
+# The center/month summary of the reporting tab reads the monthly rollups
+# (monthly_group_attendance, see migrations.ROLLUP_TRIGGERS): a row per
+# center/type/grade group and month, whatever the size of the history.
+
+def monthly_summary_query(center_name="", learning_type="", grade=""):
+    """(center_name, 'YYYY-MM' month, students present, days present, marks sum, marks count) per center and month.
+
+    Ordered by center, newest month first.
+    """
+    query = """SELECT centers.name as center_name, monthly_group_attendance.month,
+                      SUM(monthly_group_attendance.students), SUM(monthly_group_attendance.days_present),
+                      SUM(monthly_group_attendance.marks_sum), SUM(monthly_group_attendance.marks_count)
+               FROM monthly_group_attendance
+               LEFT JOIN centers ON monthly_group_attendance.center_id = centers.id"""
+    conditions, parameters = _counter_conditions("monthly_group_attendance", center_name, learning_type, grade)
+    query += _where(conditions) + """ GROUP BY monthly_group_attendance.center_id, monthly_group_attendance.month
+                                      ORDER BY centers.name, monthly_group_attendance.month DESC"""
+    return query, parameters
+
+
+# Incremental export (export.py): the rows added after a destination's last
+# attendance id, and the rows changed or deleted after its last change
+# sequence number (attendance_changes, see migrations.CHANGE_LOG_TRIGGERS).
+# Every read is a range of the attendance or change log rowids, so an export
+# costs as much as the changes it sends, whatever the size of the history.
+
+WATERMARK_QUERY = "SELECT last_attendance_id, last_change_seq FROM export_watermarks WHERE destination = ?"
+ADD_DESTINATION_QUERY = "INSERT OR IGNORE INTO export_watermarks (destination) VALUES (?)"
+DELETE_DESTINATION_QUERY = "DELETE FROM export_watermarks WHERE destination = ?"
+DESTINATIONS_QUERY = '''SELECT destination, last_attendance_id, last_change_seq, exported_at
+                        FROM export_watermarks ORDER BY destination'''
+EXPORT_HIGH_MARKS_QUERY = '''SELECT (SELECT IFNULL(MAX(id), 0) FROM attendance),
+                                    (SELECT IFNULL(MAX(seq), 0) FROM attendance_changes)'''
+UPDATE_WATERMARK_QUERY = '''UPDATE export_watermarks SET last_attendance_id = ?, last_change_seq = ?, exported_at = ?
+                            WHERE destination = ?'''
+
+# Rows deleted after the snapshot of an export and inserted again under the same id: the
+# insert trigger only logs such rows once the destination's new watermark is saved
+LOG_REUSED_IDS_QUERY = '''INSERT INTO attendance_changes (attendance_id, student_id, date, change)
+                          SELECT id, student_id, date, 'insert' FROM attendance
+                          WHERE id IN (SELECT attendance_id FROM attendance_changes
+                                       WHERE seq > ? AND change = 'delete' AND attendance_id <= ?)'''
+
+# Drop the changes every destination has exported (all of them once no destination is left)
+TRIM_CHANGES_QUERY = '''DELETE FROM attendance_changes
+                        WHERE seq <= IFNULL((SELECT MIN(last_change_seq) FROM export_watermarks),
+                                            (SELECT MAX(seq) FROM attendance_changes))'''
+
+_CHANGE_COLUMNS = """attendance.id, attendance.student_id, students.barcode, students.name, centers.name as center_name,
+                     students.learning_type, students.grade, attendance.date, attendance.marks"""
+
+
+def added_rows_query(last_attendance_id, high_attendance_id):
+    """('insert', attendance row) of the rows added after last_attendance_id, by id"""
+    query = f'''SELECT 'insert', {_CHANGE_COLUMNS}
+                FROM attendance
+                LEFT JOIN students ON attendance.student_id = students.id
+                LEFT JOIN centers ON students.center_id = centers.id
+                WHERE attendance.id > ? AND attendance.id <= ?
+                ORDER BY attendance.id'''
+    return query, [last_attendance_id, high_attendance_id]
+
+
+def changed_rows_query(last_change_seq, high_change_seq, last_attendance_id):
+    """('update' or 'insert', attendance row) of the rows up to last_attendance_id logged as changed, by id"""
+    # One row per attendance id however often it changed
+    query = f'''SELECT CASE WHEN MAX(attendance_changes.change = 'insert') THEN 'insert' ELSE 'update' END,
+                       {_CHANGE_COLUMNS}
+                FROM attendance_changes
+                CROSS JOIN attendance ON attendance.id = attendance_changes.attendance_id
+                LEFT JOIN students ON attendance.student_id = students.id
+                LEFT JOIN centers ON students.center_id = centers.id
+                WHERE attendance_changes.seq > ? AND attendance_changes.seq <= ? AND attendance_changes.attendance_id <= ?
+                GROUP BY attendance.id
+                ORDER BY attendance.id'''
+    return query, [last_change_seq, high_change_seq, last_attendance_id]
+
+
+def deleted_rows_query(last_change_seq, high_change_seq, last_attendance_id):
+    """('delete', the row as it was) of the rows up to last_attendance_id logged as deleted (tombstones)"""
+    query = '''SELECT DISTINCT 'delete', attendance_changes.attendance_id, attendance_changes.student_id,
+                      students.barcode, students.name, centers.name as center_name, students.learning_type,
+                      students.grade, attendance_changes.date, NULL
+               FROM attendance_changes
+               LEFT JOIN students ON attendance_changes.student_id = students.id
+               LEFT JOIN centers ON students.center_id = centers.id
+               WHERE attendance_changes.seq > ? AND attendance_changes.seq <= ?
+                 AND attendance_changes.change = 'delete' AND attendance_changes.attendance_id <= ?
+               ORDER BY attendance_changes.attendance_id'''
+    return query, [last_change_seq, high_change_seq, last_attendance_id]
+
+
+def query_catalogue():
+    """Every query shape the application issues, with representative parameters.
+
+    Each entry is (name, query, parameters, may_scan). may_scan marks the
+    unfiltered listings whose result is the whole table anyway.
+    """
+    today = datetime.datetime.now().strftime("%Y-%m-%d")
+    center, learning_type, grade = "center", "علمي", "اولي"
+
+    def q(name, built, may_scan=False):
+        return (name, built[0], built[1], may_scan)
+
+    return [
+        q("students (all)", students_query(), may_scan=True),
+        q("students by center", students_query(center)),
+        q("students by center/type/grade", students_query(center, learning_type, grade)),
+        q("students by type/grade", students_query("", learning_type, grade)),
+        q("students by grade", students_query("", "", grade)),
+        q("attendance (all)", attendance_query(), may_scan=True),
+        q("attendance today", attendance_query(today)),
+        q("attendance today by center/type/grade", attendance_query(today, center, learning_type, grade)),
+        q("attendance by center", attendance_query(None, center)),
+        # roster_counts has one row per center/type/grade group, reading all of it is fine
+        q("total students", total_students_query(), may_scan=True),
+        q("total students by center/type/grade", total_students_query(center, learning_type, grade)),
+        q("total students by grade", total_students_query("", "", grade), may_scan=True),
+        q("present students", present_students_query(today)),
+        q("present students by center/type/grade", present_students_query(today, center, learning_type, grade)),
+        q("student by barcode", (STUDENT_BY_BARCODE_QUERY, ["ABC"])),
+        q("barcode exists", (BARCODE_EXISTS_QUERY, ["ABC"])),
+        q("barcode exists for other", (BARCODE_EXISTS_FOR_OTHER_QUERY, ["ABC", 1])),
+        q("report by barcode", report_query("ABC")),
+        q("report by barcode and month", report_query("ABC", "08-2024", center, learning_type)),
+        q("absent students", absent_students_query(today), may_scan=True),
+        q("absent students by name", absent_students_query(today, "احمد")),
+        q("absent students by center/type", absent_students_query(today, "", center, learning_type)),
+        q("absent students count", absent_students_count_query(today), may_scan=True),
+        q("students page", students_query(after_id=1000, limit=200)),
+        q("students page by center/type/grade", students_query(center, learning_type, grade, 1000, 200)),
+        q("students by id", students_by_id_query(range(1000, 1200))),
+        q("roster", (ROSTER_QUERY, []), may_scan=True),
+        q("student search", search_students_query(search_expression("احمد 010"), limit=200)),
+        q("student search by center/type/grade page",
+          search_students_query(search_expression("احمد"), center, learning_type, grade, 1000, 200)),
+        q("attendance page", attendance_query(before_id=1000, limit=200)),
+        q("attendance today page", attendance_query(today, before_id=1000, limit=200)),
+        q("attendance today since", attendance_query(today, after_id=1000)),
+        q("attendance today by center/type/grade since", attendance_query(today, center, learning_type, grade, after_id=1000)),
+        q("report page", report_query("ABC", before_id=1000, limit=200)),
+        q("report count", report_count_query("ABC", "08-2024")),
+        q("absent students page", absent_students_query(today, after=("احمد", 1000), limit=200)),
+        q("present student ids", (PRESENT_STUDENT_IDS_QUERY, [today])),
+        q("attendance day", (ATTENDANCE_DAY_QUERY, [today])),
+        q("last attendance id", (LAST_ATTENDANCE_ID_QUERY, [])),
+        q("session days", (SESSION_DAYS_QUERY, ["2024-08-01", today])),
+        q("recent session days", (RECENT_SESSION_DAYS_QUERY, [today, 60])),
+        q("name search ids", name_search_ids_query(search_expression("احمد", "name"))),
+        q("absentees by id", absentees_by_id_query(range(1000, 1200))),
+        q("card students by center", card_students_query(center)),
+        q("card students by center/type/grade", card_students_query(center, learning_type, grade)),
+        q("card students by id", card_students_by_id_query(range(1000, 1200))),
+        q("monthly attendance", monthly_attendance_query("08-2024")),
+        q("monthly attendance by center/type", monthly_attendance_query("08-2024", center, learning_type)),
+        q("report students by center", report_students_query(center)),
+        q("report students by center/type", report_students_query(center, learning_type)),
+        q("report students (all centers)", report_students_query(), may_scan=True),
+        q("centers", (CENTERS_QUERY, []), may_scan=True),
+        q("center names", (CENTER_NAMES_QUERY, []), may_scan=True),
+        q("grades", (GRADES_QUERY, [])),
+        q("last student id", (LAST_STUDENT_ID_QUERY, [])),
+        q("index new students", (INDEX_NEW_STUDENTS_QUERY, [1000])),
+        q("delete center attendance", (DELETE_CENTER_ATTENDANCE_QUERY, [1])),
+        q("delete center students", (DELETE_CENTER_STUDENTS_QUERY, [1])),
+        q("next attendance date", (NEXT_ATTENDANCE_DATE_QUERY, [today])),
+        # monthly_group_attendance has one row per group and month, reading all of it is fine
+        q("monthly summary", monthly_summary_query(), may_scan=True),
+        q("monthly summary by center", monthly_summary_query(center)),
+        q("monthly summary by center/type/grade", monthly_summary_query(center, learning_type, grade)),
+        q("monthly summary by type", monthly_summary_query("", learning_type), may_scan=True),
+        q("export watermark", (WATERMARK_QUERY, ["head office"])),
+        q("export destinations", (DESTINATIONS_QUERY, []), may_scan=True),
+        q("export high marks", (EXPORT_HIGH_MARKS_QUERY, [])),
+        q("export added rows", added_rows_query(1000, 2000)),
+        q("export changed rows", changed_rows_query(10, 20, 1000)),
+        q("export deleted rows", deleted_rows_query(10, 20, 1000)),
+        q("log reused attendance ids", (LOG_REUSED_IDS_QUERY, [20, 2000])),
+        q("trim attendance changes", (TRIM_CHANGES_QUERY, [])),
+    ]
+
+
+# A plan step that reads a whole table without any index
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def check_query_plans(conn=None):
+    """Run EXPLAIN QUERY PLAN on every catalogued query.
+
+    Returns a list of (name, plan_lines, full_scans) for the queries that
+    read a table without an index although they are filtered.
+    """
+    conn = conn or get_connection()
+    problems = []
+    for name, query, parameters, may_scan in query_catalogue():
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, parameters)]
+        full_scans = [line for line in plan if _FULL_SCAN.match(line)]
+        if full_scans and not may_scan:
+            problems.append((name, plan, full_scans))
+    return problems
+
+
+if __name__ == "__main__":
+    # Usage: python queries.py  -> report queries that do not use an index
+    problems = check_query_plans()
+    if problems:
+        for name, plan, full_scans in problems:
+            print(f"FULL SCAN in '{name}':")
+            for line in plan:
+                print(f"    {line}")
+        sys.exit(1)
+    print(f"All {len(query_catalogue())} queries use an index.")
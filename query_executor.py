@@ -0,0 +1,122 @@
+import queue
+import sqlite3
+import threading
+from tkinter import messagebox
+from database import connect
+
+# How often the Tk thread looks for finished queries (in milliseconds)
+POLL_INTERVAL_MS = 15
+
+# SQLite virtual machine instructions between two cancellation checks
+PROGRESS_HANDLER_STEPS = 1000
+
+
+class QueryExecutor:
+    """Runs database reads on a worker thread and hands the results back to the Tk thread.
+
+    Work is submitted under a key (for example "students" or "attendance").
+    Submitting again under the same key makes the previous request stale: it
+    is skipped if it has not started yet, aborted through SQLite's progress
+    handler if it is running, and its result is never delivered.
+    """
+
+    def __init__(self, root, path=None, name="query-executor"):
+        self.root = root
+        self.path = path
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._running = None  # (key, generation) of the request being executed
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def submit(self, key, work, callback, error_callback=None, progress_callback=None):
+        """Run work(conn) on the worker thread, then callback(result) on the Tk thread.
+
+        With progress_callback, work is called as work(conn, progress) and every
+        progress(value) it makes runs progress_callback(value) on the Tk thread.
+        """
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+        if progress_callback is not None:
+            work = self._with_progress(key, generation, work, progress_callback)
+        self._requests.put((key, generation, work, callback, error_callback))
+
+    def _with_progress(self, key, generation, work, progress_callback):
+        def progress(value):
+            self._results.put((key, generation, progress_callback, value, False))
+        return lambda conn: work(conn, progress)
+
+    def cancel(self, key):
+        """Drop the pending or running request submitted under key"""
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def close(self):
+        """Stop the worker thread once the queued requests are drained"""
+        self._closed = True
+        self._requests.put(None)
+
+    def _is_stale(self, key, generation):
+        with self._lock:
+            return self._generations.get(key) != generation
+
+    def _abort_if_stale(self):
+        # Progress handler: a non-zero return value interrupts the running statement
+        running = self._running
+        return 1 if running is not None and self._is_stale(*running) else 0
+
+    def _run(self):
+        conn = connect(self.path)
+        conn.set_progress_handler(self._abort_if_stale, PROGRESS_HANDLER_STEPS)
+        try:
+            while True:
+                request = self._requests.get()
+                if request is None:
+                    break
+                key, generation, work, callback, error_callback = request
+                if self._is_stale(key, generation):
+                    continue
+
+                self._running = (key, generation)
+                try:
+                    result = work(conn)
+                except Exception as e:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    # An interrupted stale request is expected, anything else is reported
+                    if not (isinstance(e, sqlite3.OperationalError) and self._is_stale(key, generation)):
+                        self._results.put((key, generation, error_callback, e, True))
+                else:
+                    self._results.put((key, generation, callback, result, False))
+                finally:
+                    self._running = None
+        finally:
+            conn.close()
+
+    def _poll(self):
+        # Reschedule first so a failing callback does not stop the delivery loop
+        if not self._closed:
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+
+        while True:
+            try:
+                key, generation, callback, value, failed = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_stale(key, generation):
+                continue
+            if failed and callback is None:
+                messagebox.showerror("خطأ في قاعدة البيانات", f"حدث خطأ أثناء تحميل البيانات: {value}")
+            else:
+                callback(value)
+
+
+def fetch_all(query, parameters=()):
+    """Work for QueryExecutor.submit() returning every row of query"""
+    return lambda conn: conn.execute(query, parameters).fetchall()
@@ -0,0 +1,206 @@
+import csv
+import os
+import argparse
+import numpy as np
+import queries
+from database import connect, get_connection
+
+# Monthly attendance matrix of a center: one row per student, one column per
+# school day (a day on which any student of the center attended), with each
+# student's days present, attendance rate and average marks, and the number
+# of students present on each day.
+#
+# The month's attendance is read in one date range scan and pivoted with
+# NumPy, so the reports of every center come from the same read.
+
+PRESENT_MARK = "✓"
+
+# Center/month summary (from the monthly rollups): a row per center and month
+SUMMARY_COLUMNS = ["اسم السنتر", "الشهر", "الطلاب الحاضرون", "أيام الحضور", "متوسط أيام الحضور", "متوسط الدرجات",
+                   "أيام الحضور العام السابق", "التغير"]
+
+
+class MonthlyReport:
+    """Attendance of the students of one center in one month as a student × school-day matrix.
+
+    students is a list of (id, name, barcode), days the school days
+    ('YYYY-MM-DD', oldest first), present a boolean array of shape
+    (students, days) and marks a float array of the same shape with NaN where
+    no numeric mark was recorded.
+    """
+
+    def __init__(self, center_name, month, students, days, present, marks):
+        self.center_name = center_name
+        self.month = month
+        self.students = students
+        self.days = days
+        self.present = present
+        self.marks = marks
+
+    def totals(self):
+        """Days present of each student"""
+        return self.present.sum(axis=1)
+
+    def rates(self):
+        """Share of the school days each student attended (0 when the center had no school day)"""
+        if not self.days:
+            return np.zeros(len(self.students))
+        return self.totals() / len(self.days)
+
+    def average_marks(self):
+        """Average numeric mark of each student (NaN without any mark)"""
+        return _average(self.marks, axis=1)
+
+    def headcounts(self):
+        """Students present on each school day"""
+        return self.present.sum(axis=0)
+
+    def header(self):
+        return ["الاسم", "الرمز الشريطي"] + [day[8:] for day in self.days] + ["أيام الحضور", "نسبة الحضور", "متوسط الدرجات"]
+
+    def rows(self):
+        """Table rows (name, barcode, a ✓ per school day attended, total, rate, average mark)"""
+        cells = np.where(self.present, PRESENT_MARK, "")
+        for (_, name, barcode), day_cells, total, rate, average in zip(
+                self.students, cells.tolist(), self.totals().tolist(), self.rates().tolist(), self.average_marks().tolist()):
+            yield [name, barcode] + day_cells + [total, _percent(rate), _mark(average)]
+
+    def footer(self):
+        """Students present per day, then the center's totals"""
+        present = int(self.present.sum())
+        possible = self.present.size
+        return (["عدد الحاضرين", ""] + self.headcounts().tolist() +
+                [present, _percent(present / possible if possible else 0), _mark(_average(self.marks).item())])
+
+    def write_csv(self, path):
+        """Save the matrix as CSV (UTF-8 with BOM so that Excel shows the Arabic text)"""
+        with open(path, "w", newline="", encoding="utf-8-sig") as file:
+            writer = csv.writer(file)
+            writer.writerow([f"{self.center_name} - {self.month}"])
+            writer.writerow(self.header())
+            writer.writerows(self.rows())
+            writer.writerow(self.footer())
+
+
+def _average(values, axis=None):
+    counts = (~np.isnan(values)).sum(axis=axis)
+    sums = np.nansum(values, axis=axis)
+    return np.divide(sums, counts, out=np.full(np.shape(sums), np.nan), where=counts > 0)
+
+
+def _percent(rate):
+    return f"{rate * 100:.0f}%"
+
+
+def _mark(value):
+    return "" if np.isnan(value) else f"{value:.1f}"
+
+
+def monthly_reports(month, center_name="", learning_type="", grade="", conn=None):
+    """{center_name: MonthlyReport} of a 'MM-YYYY' month, for one center or (center_name empty) every center.
+
+    Raises ValueError if month is not a valid 'MM-YYYY' value.
+    """
+    conn = conn or get_connection()
+    students = conn.execute(*queries.report_students_query(center_name, learning_type, grade)).fetchall()
+    attendance = conn.execute(*queries.monthly_attendance_query(month, center_name, learning_type, grade)).fetchall()
+    month_prefix = queries.month_range(month)[0][:8]
+
+    # Row of each student in the students list (which is grouped by center)
+    report_ids = np.array([student[0] for student in students], dtype=np.int64)
+    id_order = np.argsort(report_ids)
+    sorted_ids = report_ids[id_order]
+
+    if attendance:
+        student_ids, dates, marks = zip(*attendance)
+        student_ids = np.array(student_ids, dtype=np.int64)
+        dates = np.array(dates, dtype=np.int64)  # Day of the month
+        marks = np.array(marks, dtype=float)  # NULL becomes NaN
+    else:
+        student_ids, dates, marks = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    # Keep the rows of the report's students and sort them by report row
+    found = np.searchsorted(sorted_ids, student_ids)
+    found[found == len(sorted_ids)] = 0
+    known = sorted_ids[found] == student_ids if len(sorted_ids) else np.zeros(len(student_ids), dtype=bool)
+    rows = id_order[found[known]]
+    dates, marks = dates[known], marks[known]
+    order = np.argsort(rows, kind="stable")
+    rows, dates, marks = rows[order], dates[order], marks[order]
+
+    reports = {}
+    start = 0
+    while start < len(students):
+        center = students[start][3]
+        end = start
+        while end < len(students) and students[end][3] == center:
+            end += 1
+
+        # The center's rows are a slice of the sorted attendance
+        first, last = np.searchsorted(rows, [start, end])
+        days, day_columns = np.unique(dates[first:last], return_inverse=True)
+        present = np.zeros((end - start, len(days)), dtype=bool)
+        center_marks = np.full((end - start, len(days)), np.nan)
+        present[rows[first:last] - start, day_columns] = True
+        center_marks[rows[first:last] - start, day_columns] = marks[first:last]
+
+        reports[center] = MonthlyReport(center, month, [student[:3] for student in students[start:end]],
+                                        [f"{month_prefix}{day:02d}" for day in days.tolist()], present, center_marks)
+        start = end
+    return reports
+
+
+def monthly_report(center_name, month, learning_type="", grade="", conn=None):
+    """MonthlyReport of one center (with no students when the center has none)"""
+    reports = monthly_reports(month, center_name, learning_type, grade, conn)
+    return reports.get(center_name) or MonthlyReport(center_name, month, [], [], np.zeros((0, 0), dtype=bool),
+                                                     np.zeros((0, 0)))
+
+
+def center_month_summary(center_name="", learning_type="", grade="", conn=None):
+    """SUMMARY_COLUMNS rows of every center and month, by center and newest month first.
+
+    Read from the monthly rollups (a few rows per center and month), each
+    month compared with the same month of the previous year.
+    """
+    conn = conn or get_connection()
+    months = conn.execute(*queries.monthly_summary_query(center_name, learning_type, grade)).fetchall()
+    days_present = {(center, month): days for center, month, _, days, _, _ in months}
+    rows = []
+    for center, month, students, days, marks_sum, marks_count in months:
+        year, month_number = month.split("-")
+        last_year = days_present.get((center, f"{int(year) - 1:04d}-{month_number}"))
+        change = f"{(days - last_year) / last_year * 100:+.0f}%" if last_year else ""
+        rows.append([center or "بدون سنتر", f"{month_number}-{year}", students, days, f"{days / students:.1f}",
+                     _mark(marks_sum / marks_count if marks_count else np.nan), last_year or "", change])
+    return rows
+
+
+def report_file_name(report):
+    return f"{report.center_name or 'بدون سنتر'} {report.month}.csv"
+
+
+def export_monthly_reports(month, directory, conn=None):
+    """Write the report of every center for month into directory; returns the files written"""
+    paths = []
+    for report in monthly_reports(month, conn=conn).values():
+        path = os.path.join(directory, report_file_name(report))
+        report.write_csv(path)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the monthly attendance matrix of every center as CSV")
+    parser.add_argument("month", help="MM-YYYY")
+    parser.add_argument("--db", help="Database file (default: students.db next to the app)")
+    parser.add_argument("--out", default=".", help="Directory of the CSV files (default: current directory)")
+    args = parser.parse_args()
+
+    try:
+        queries.month_range(args.month)
+    except ValueError:
+        parser.error("month must be MM-YYYY")
+    os.makedirs(args.out, exist_ok=True)
+    for path in export_monthly_reports(args.month, args.out, conn=connect(args.db)):
+        print(path)
@@ -0,0 +1,290 @@
+import re
+import sys
+import bisect
+import threading
+from array import array
+from queries import ROSTER_QUERY
+
+# Positions of the set bits of every byte value
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+_NONZERO_BYTE = re.compile(b"[^\x00]")
+
+
+def _popcount(bitmap):
+    # int.bit_count() needs Python 3.10
+    return bitmap.bit_count() if hasattr(bitmap, "bit_count") else bin(bitmap).count("1")
+
+
+def _insert_bit(bitmap, position):
+    """bitmap with the bits from position on moved up by one and a clear bit at position"""
+    low = bitmap & ((1 << position) - 1)
+    return low | ((bitmap >> position) << (position + 1))
+
+
+def _positions(bitmap, start, limit):
+    """Positions of the set bits of bitmap from start on, lowest first (at most limit)"""
+    positions = []
+    bitmap >>= start
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for match in _NONZERO_BYTE.finditer(data):
+        index = match.start()
+        offset = start + index * 8
+        positions.extend(offset + bit for bit in _BYTE_BITS[data[index]])
+        if limit is not None and len(positions) >= limit:
+            return positions[:limit]
+    return positions
+
+
+def _bitmap(positions, size):
+    """Bitmap with the given positions set, built in one pass"""
+    data = bytearray((size + 7) // 8)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, "little")
+
+
+class _Column:
+    """Values of one filter column as small integer codes, with a bitmap of the positions of each value"""
+
+    def __init__(self, typecode):
+        self.codes = array(typecode)
+        self.values = []    # code -> value
+        self._lookup = {}   # value -> code
+        self.bitmaps = []   # code -> bitmap of the positions holding the value
+
+    def code(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+            self.bitmaps.append(0)
+        return code
+
+    def load(self, values):
+        """Fill an empty column; the bitmaps are built at the end (setting bits one by one copies the whole int each time)"""
+        self.codes.extend(map(self.code, values))
+        positions = [[] for _ in self.values]
+        for position, code in enumerate(self.codes):
+            positions[code].append(position)
+        self.bitmaps = [_bitmap(code_positions, len(self.codes)) for code_positions in positions]
+
+    def bitmap(self, value):
+        code = self._lookup.get(value)
+        return 0 if code is None else self.bitmaps[code]
+
+    def insert(self, position, value):
+        self.bitmaps = [_insert_bit(bitmap, position) for bitmap in self.bitmaps]
+        self.codes.insert(position, self.code(value))
+        self.bitmaps[self.codes[position]] |= 1 << position
+
+    def set(self, position, value):
+        code = self.code(value)
+        if position == len(self.codes):
+            self.codes.append(code)
+        else:
+            old = self.codes[position]
+            self.bitmaps[old] &= ~(1 << position)
+            self.codes[position] = code
+        self.bitmaps[code] |= 1 << position
+
+    def rename(self, old, new):
+        code = self._lookup.pop(old, None)
+        if code is None:
+            return
+        target = self._lookup.get(new)
+        if target is None:
+            self._lookup[new] = code
+            self.values[code] = new
+            return
+        # new is already interned (e.g. a deleted center's name): move the positions to its code, retire the old one
+        for position in _positions(self.bitmaps[code], 0, None):
+            self.codes[position] = target
+        self.bitmaps[target] |= self.bitmaps[code]
+        self.bitmaps[code] = 0
+
+
+class Roster:
+    """Every student's id, name, barcode, center, type and grade held in memory.
+
+    The filter columns are arrays in id order (about 20 bytes per student
+    plus the interned name) and each distinct center, type and grade has a
+    bitmap, a Python int with bit i set for the student at position i. A
+    filtered count or page of ids is the AND of up to three bitmaps and the
+    live bitmap, so the filters never touch the database. A dict from barcode
+    to student id serves the scan path the same way.
+
+    Deleted students have their live bit cleared and their barcode dropped.
+    The roster is read on the query executor's worker while the Tk thread
+    applies the changes, so every method holds the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.ids = array('q')
+        self.names = []
+        self.barcodes = []        # position -> barcode
+        self._barcode_ids = {}    # barcode -> student id of the live students
+        self.centers = _Column('H')
+        self.types = _Column('H')
+        self.grades = _Column('H')
+        self._live = 0
+
+    @classmethod
+    def load(cls, conn):
+        roster = cls()
+        roster.reload(conn)
+        return roster
+
+    def reload(self, conn):
+        """Read every student again (after an import or a change made outside the roster)"""
+        rows = conn.execute(ROSTER_QUERY).fetchall()
+        ids, names, barcodes, center_names, learning_types, grades = zip(*rows) if rows else ([],) * 6
+        with self._lock:
+            self._clear()
+            self.ids.extend(ids)
+            self.names = [sys.intern(name or "") for name in names]
+            self.barcodes = list(barcodes)
+            self._barcode_ids = {barcode: student_id for student_id, barcode in zip(ids, barcodes) if barcode}
+            for column, values in ((self.centers, center_names), (self.types, learning_types), (self.grades, grades)):
+                column.load(values)
+            self._live = (1 << len(rows)) - 1
+
+    def _append(self, student_id, name, barcode, center_name, learning_type, grade):
+        position = len(self.ids)
+        self.ids.append(student_id)
+        self.names.append(sys.intern(name or ""))
+        self.barcodes.append(None)
+        self.centers.set(position, center_name)
+        self.types.set(position, learning_type)
+        self.grades.set(position, grade)
+        self._set_barcode(position, barcode)
+        self._live |= 1 << position
+
+    def _position(self, student_id):
+        position = bisect.bisect_left(self.ids, student_id)
+        if position < len(self.ids) and self.ids[position] == student_id:
+            return position
+        return None
+
+    def _set_barcode(self, position, barcode):
+        old = self.barcodes[position]
+        if old and self._barcode_ids.get(old) == self.ids[position]:
+            del self._barcode_ids[old]
+        self.barcodes[position] = barcode
+        if barcode:
+            self._barcode_ids[barcode] = self.ids[position]
+
+    def add(self, student_id, name, barcode, center_name, learning_type, grade):
+        with self._lock:
+            if not self.ids or student_id > self.ids[-1]:
+                self._append(student_id, name, barcode, center_name, learning_type, grade)
+                return
+            position = bisect.bisect_left(self.ids, student_id)
+            if position < len(self.ids) and self.ids[position] == student_id:
+                # Id of a deleted student reused
+                self._set(position, name, barcode, center_name, learning_type, grade)
+                return
+
+            # Rare: an id below the last one (inserted with an explicit id), shift the later positions up
+            self.ids.insert(position, student_id)
+            self.names.insert(position, sys.intern(name or ""))
+            self.barcodes.insert(position, None)
+            self.centers.insert(position, center_name)
+            self.types.insert(position, learning_type)
+            self.grades.insert(position, grade)
+            self._set_barcode(position, barcode)
+            self._live = _insert_bit(self._live, position) | 1 << position
+
+    def update(self, student_id, name, barcode, center_name, learning_type, grade):
+        with self._lock:
+            position = self._position(student_id)
+            if position is not None:
+                self._set(position, name, barcode, center_name, learning_type, grade)
+
+    def _set(self, position, name, barcode, center_name, learning_type, grade):
+        self.names[position] = sys.intern(name or "")
+        self.centers.set(position, center_name)
+        self.types.set(position, learning_type)
+        self.grades.set(position, grade)
+        self._set_barcode(position, barcode)
+        self._live |= 1 << position
+
+    def _remove_position(self, position):
+        self._set_barcode(position, None)
+        self._live &= ~(1 << position)
+
+    def remove(self, student_id):
+        with self._lock:
+            position = self._position(student_id)
+            if position is not None:
+                self._remove_position(position)
+
+    def remove_center(self, center_name):
+        """Drop the students of a deleted center"""
+        with self._lock:
+            for position in _positions(self._live & self.centers.bitmap(center_name), 0, None):
+                self._remove_position(position)
+
+    def rename_center(self, old_name, new_name):
+        with self._lock:
+            self.centers.rename(old_name, new_name)
+
+    def find_barcode(self, barcode):
+        """(student_id, name) of the student with barcode, or None"""
+        with self._lock:
+            student_id = self._barcode_ids.get(barcode)
+            if student_id is None:
+                return None
+            return student_id, self.names[self._position(student_id)]
+
+    def barcode_exists(self, barcode, exclude_student_id=None):
+        """Whether a student other than exclude_student_id uses barcode"""
+        with self._lock:
+            student_id = self._barcode_ids.get(barcode)
+        return student_id is not None and student_id != exclude_student_id
+
+    def _filter(self, center_name, learning_type, grade):
+        bitmap = self._live
+        if center_name:
+            bitmap &= self.centers.bitmap(center_name)
+        if learning_type:
+            bitmap &= self.types.bitmap(learning_type)
+        if grade:
+            bitmap &= self.grades.bitmap(grade)
+        return bitmap
+
+    def count(self, center_name="", learning_type="", grade=""):
+        """Number of students matching the filters (empty filters match everything)"""
+        with self._lock:
+            return _popcount(self._filter(center_name, learning_type, grade))
+
+    def student_ids(self, center_name="", learning_type="", grade="", after_id=None, limit=None):
+        """Ids of the students matching the filters in id order (limit ids after after_id for one page)"""
+        with self._lock:
+            bitmap = self._filter(center_name, learning_type, grade)
+            start = 0 if after_id is None else bisect.bisect_right(self.ids, after_id)
+            return [self.ids[position] for position in _positions(bitmap, start, limit)]
+
+    def id_bitmap(self, center_name="", learning_type="", grade=""):
+        """The students matching the filters as a bitmap over the student ids (bit i for the student with id i)"""
+        with self._lock:
+            student_ids = [self.ids[position] for position in _positions(self._filter(center_name, learning_type, grade), 0, None)]
+        return _bitmap(student_ids, student_ids[-1] + 1 if student_ids else 0)
+
+    def sort_by_name(self, student_ids):
+        """(name, id) of the given students, in the order of the absent students listing"""
+        with self._lock:
+            return sorted((self.names[self._position(student_id)], student_id) for student_id in student_ids)
+
+    def grade_values(self):
+        """Grades of the current students"""
+        with self._lock:
+            return [grade for grade, bitmap in zip(self.grades.values, self.grades.bitmaps)
+                    if grade is not None and bitmap & self._live]
+
+    def __len__(self):
+        with self._lock:
+            return _popcount(self._live)
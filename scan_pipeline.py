@@ -0,0 +1,97 @@
+import time
+import queue
+import threading
+import attendance_api
+from database import connect
+
+# How long the writer keeps collecting scans after the first one before
+# committing them together (in milliseconds)
+GROUP_COMMIT_MS = 20
+
+# Scans written in one transaction at most
+MAX_BATCH_SCANS = 200
+
+# How often the Tk thread looks for recorded scans (in milliseconds)
+POLL_INTERVAL_MS = 15
+
+
+class ScanPipeline:
+    """Records scanned attendance on a writer thread, several scans per transaction.
+
+    submit() only queues the scan, so the scan field is ready for the next
+    student at once. The writer takes the first queued scan, waits up to
+    GROUP_COMMIT_MS for more and writes them all in one transaction (one
+    commit instead of one per scan). on_recorded(results) is then called on
+    the Tk thread with a (scan, attendance_id) pair per scan, attendance_id
+    being None for a student already present on that date; on_error(scans,
+    error) if the transaction failed.
+    """
+
+    def __init__(self, root, on_recorded, on_error, path=None):
+        self.root = root
+        self.path = path
+        self.on_recorded = on_recorded
+        self.on_error = on_error
+        self._scans = queue.Queue()
+        self._results = queue.Queue()
+        self._closed = False
+
+        self._writer = threading.Thread(target=self._run, name="scan-writer", daemon=True)
+        self._writer.start()
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def submit(self, scan):
+        """Queue a scan: (student_id, date, marks, ...) where the extra items are handed back untouched"""
+        self._scans.put(scan)
+
+    def close(self):
+        """Stop the writer once the queued scans are written"""
+        self._closed = True
+        self._scans.put(None)
+        self._writer.join()
+
+    def _next_batch(self):
+        """Block for the first scan, then collect the ones arriving within GROUP_COMMIT_MS"""
+        first = self._scans.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + GROUP_COMMIT_MS / 1000
+        while len(batch) < MAX_BATCH_SCANS:
+            try:
+                scan = self._scans.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if scan is None:
+                self._scans.put(None)  # Stop after writing this batch
+                break
+            batch.append(scan)
+        return batch
+
+    def _run(self):
+        conn = connect(self.path)
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                try:
+                    attendance_ids = attendance_api.record_scans([scan[:3] for scan in batch], conn=conn)
+                except Exception as e:
+                    self._results.put((self.on_error, (batch, e)))
+                else:
+                    self._results.put((self.on_recorded, (list(zip(batch, attendance_ids)),)))
+        finally:
+            conn.close()
+
+    def _poll(self):
+        # Reschedule first so a failing callback does not stop the delivery loop
+        if not self._closed:
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+
+        while True:
+            try:
+                callback, arguments = self._results.get_nowait()
+            except queue.Empty:
+                break
+            callback(*arguments)
@@ -0,0 +1,233 @@
+import tkinter as tk
+from tkinter import messagebox
+
+# Rows fetched per page
+PAGE_ROWS = 200
+
+# Pages kept in the Treeview at the same time
+MAX_PAGES = 4
+
+# Load the next (or previous) page when the view gets this close to the end
+# of the rows in the widget (as a fraction of the scroll range)
+PREFETCH_MARGIN = 0.15
+
+
+class VirtualGrid:
+    """Shows a large query result in a ttk.Treeview a few pages at a time.
+
+    Pages are read with keyset pagination: fetch_page(conn, after_key, limit)
+    returns up to limit rows following the row whose key is after_key (None
+    for the first page), in the order of the indexed sort key. Only MAX_PAGES
+    pages live in the widget; scrolling near the bottom loads the next page
+    and drops the top one, scrolling back up reloads the dropped pages from
+    their saved start keys.
+
+    Pages are read through the QueryExecutor under the name given, so a new
+    load() makes any page still being read stale.
+    """
+
+    def __init__(self, tree, scrollbar, executor, name, key=lambda row: row[0], values=lambda row: row,
+                 on_loaded=None, on_error=None, page_rows=PAGE_ROWS, max_pages=MAX_PAGES):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.executor = executor
+        self.name = name
+        self.key = key
+        self.values = values
+        self.on_loaded = on_loaded
+        self.on_error = on_error
+        self.page_rows = page_rows
+        self.max_pages = max_pages
+
+        self.fetch_page = None
+        self._pages = []          # [(start_key, last_key, item_ids)] of the pages in the widget
+        self._dropped_above = []  # (start_key, last_key, rows) of the pages dropped from the top
+        self._has_more = False    # More rows after the last page in the widget
+        self._loading = False
+        self._keys = {}           # item_id -> key of the row shown by the item
+
+        self.tree.configure(yscrollcommand=self._on_yscroll)
+
+    def load(self, fetch_page, count=None):
+        """Show the first page of a new result.
+
+        count(conn), if given, is run together with the first page and its
+        result passed to on_loaded(total); otherwise on_loaded gets None.
+        """
+        self.fetch_page = fetch_page
+        self._loading = True
+
+        def first_page(conn):
+            rows = fetch_page(conn, None, self.page_rows)
+            return rows, count(conn) if count else None
+
+        self.executor.submit(self.name, first_page, self._show_first_page, self._on_page_error)
+
+    def clear(self):
+        self.executor.cancel(self.name)
+        self.fetch_page = None
+        self._reset()
+
+    def rows_shown(self):
+        return sum(len(item_ids) for _, _, item_ids in self._pages)
+
+    def at_start(self):
+        """Whether the first row of the result is in the widget"""
+        return self.fetch_page is not None and not self._dropped_above and not self._loading
+
+    def top_key(self):
+        """Key of the first row shown (None if the result is empty or its start is not in the widget)"""
+        if not self.at_start():
+            return None
+        for _, _, item_ids in self._pages:
+            if item_ids:
+                return self._keys[item_ids[0]]
+        return None
+
+    def prepend(self, row):
+        """Show a row that was just added in front of the result (only if the start is in the widget)"""
+        if not self.at_start():
+            return None
+        item_id, = self._insert_rows(0, [row])
+        if self._pages and len(self._pages[0][2]) < self.page_rows:
+            _, last_key, item_ids = self._pages[0]
+            self._pages[0] = (None, last_key, [item_id] + item_ids)
+        else:
+            # The first page is full: the row starts a page of its own, so that no
+            # page holds more rows than a reload of it reads
+            if self._pages:
+                _, last_key, item_ids = self._pages[0]
+                self._pages[0] = (self.key(row), last_key, item_ids)
+            self._pages.insert(0, (None, self.key(row), [item_id]))
+            if len(self._pages) > self.max_pages:
+                self._drop_items(self._pages.pop()[2])
+                self._has_more = True
+        return item_id
+
+    def delete(self, item_id):
+        """Remove one row from the widget (after it was deleted from the database)"""
+        for _, _, item_ids in self._pages:
+            if item_id in item_ids:
+                item_ids.remove(item_id)
+        self._keys.pop(item_id, None)  # The next row becomes the top one (its key the refresh watermark)
+        self.tree.delete(item_id)
+
+    def delete_where(self, predicate):
+        """Remove the rows whose displayed values match predicate(values)"""
+        for _, _, item_ids in self._pages:
+            for item_id in [item_id for item_id in item_ids if predicate(self.tree.item(item_id, 'values'))]:
+                self.delete(item_id)
+
+    def _reset(self):
+        self.tree.delete(*self.tree.get_children())
+        self._pages = []
+        self._dropped_above = []
+        self._has_more = False
+        self._loading = False
+        self._keys = {}
+
+    def _show_first_page(self, result):
+        if not self.tree.winfo_exists():
+            return
+        rows, total = result
+        self._reset()
+        self._append_page(None, rows)
+        self.tree.yview_moveto(0)
+        if self.on_loaded:
+            self.on_loaded(total)
+
+    def _insert_rows(self, index, rows):
+        """Insert rows from index on (tk.END to append); returns their item ids"""
+        item_ids = []
+        for offset, row in enumerate(rows):
+            item_id = self.tree.insert("", index if index == tk.END else index + offset, values=self.values(row))
+            self._keys[item_id] = self.key(row)
+            item_ids.append(item_id)
+        return item_ids
+
+    def _drop_items(self, item_ids):
+        self.tree.delete(*item_ids)
+        for item_id in item_ids:
+            del self._keys[item_id]
+
+    def _append_page(self, start_key, rows):
+        item_ids = self._insert_rows(tk.END, rows)
+        if rows:
+            self._pages.append((start_key, self.key(rows[-1]), item_ids))
+        self._has_more = len(rows) == self.page_rows
+
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._loading or self.fetch_page is None:
+            return
+        if float(last) >= 1 - PREFETCH_MARGIN and self._has_more:
+            self._load_next_page()
+        elif float(first) <= PREFETCH_MARGIN and self._dropped_above:
+            self._load_previous_page()
+
+    def _load_next_page(self):
+        start_key = self._pages[-1][1]
+        fetch_page = self.fetch_page
+        self._loading = True
+        self.executor.submit(self.name, lambda conn: fetch_page(conn, start_key, self.page_rows),
+                             lambda rows: self._show_next_page(start_key, rows), self._on_page_error)
+
+    def _load_previous_page(self):
+        start_key, last_key, count = self._dropped_above[-1]
+        fetch_page = self.fetch_page
+        self._loading = True
+
+        def previous_page(conn):
+            # The page as it was dropped: up to its last row (a page may hold fewer than page_rows rows)
+            rows = fetch_page(conn, start_key, self.page_rows)
+            keys = [self.key(row) for row in rows]
+            return rows[:keys.index(last_key) + 1] if last_key in keys else rows[:count]
+
+        self.executor.submit(self.name, previous_page, self._show_previous_page, self._on_page_error)
+
+    def _show_next_page(self, start_key, rows):
+        self._loading = False
+        if not self.tree.winfo_exists():
+            return
+        first_index = self._first_visible_index()
+        self._append_page(start_key, rows)
+
+        # Drop the top page once the window is full, keeping the same rows in view
+        if len(self._pages) > self.max_pages:
+            dropped_start, dropped_last, item_ids = self._pages.pop(0)
+            self._dropped_above.append((dropped_start, dropped_last, len(item_ids)))
+            self._drop_items(item_ids)
+            self._scroll_to_index(first_index - len(item_ids))
+
+    def _show_previous_page(self, rows):
+        self._loading = False
+        if not self.tree.winfo_exists():
+            return
+        first_index = self._first_visible_index()
+        start_key = self._dropped_above.pop()[0]
+        item_ids = self._insert_rows(0, rows)
+        if rows:
+            self._pages.insert(0, (start_key, self.key(rows[-1]), item_ids))
+
+        # Drop the bottom page once the window is full
+        if len(self._pages) > self.max_pages:
+            _, _, dropped_ids = self._pages.pop()
+            self._drop_items(dropped_ids)
+            self._has_more = True
+        self._scroll_to_index(first_index + len(item_ids))
+
+    def _on_page_error(self, error):
+        self._loading = False
+        if self.on_error:
+            self.on_error(error)
+        else:
+            messagebox.showerror("خطأ في قاعدة البيانات", f"حدث خطأ أثناء تحميل البيانات: {error}")
+
+    def _first_visible_index(self):
+        count = len(self.tree.get_children())
+        return round(self.tree.yview()[0] * count) if count else 0
+
+    def _scroll_to_index(self, index):
+        count = len(self.tree.get_children())
+        if count:
+            self.tree.yview_moveto(max(index, 0) / count)